@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+Load benchmark for MimoRestClient against the local mock gateway
+================================================================
+
+Runs the same batch of transfers sequentially, on a thread pool sharing one
+client, and on the asyncio client, and reports requests/sec, latency
+percentiles and peak memory for each mode. The mock gateway is seeded, so
+runs are reproducible on the same machine. It runs in its own process
+(python -m mimolib.mockgateway), so it neither competes with the client for
+the GIL nor counts towards its memory, and each mode is warmed up with a
+short untimed run before it is measured.
+
+    python benchmarks/bench_client.py --transfers 2000 --latency 0.01
+    python benchmarks/bench_client.py --modes threaded,async --output bench_output.txt
+
+'''
+import argparse
+import gc
+import json
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from mimolib import MimoRestClient, MimoContext
+from mimolib.bulk import BulkTransfer
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+URLS = dict(authentication_url="oauth/v2/authenticate",
+            token_url="oauth/v2/token",
+            search_url="partner/user/card_id",
+            transfer_url="partner/transfers",
+            refund_url="partner/refunds",
+            void_url="partner/transfers/void",
+            registration_url="partner/registration")
+
+
+class GatewayProcess(object):
+    """Mock gateway served by a separate Python process.
+
+    Attributes:
+        process: subprocess.Popen of the gateway.
+        url: Base URL of the gateway, to be used as client_url.
+    """
+    def __init__(self, args):
+        command = [sys.executable, "-m", "mimolib.mockgateway", "--port", "0",
+                   "--latency", str(args.latency), "--jitter", str(args.jitter),
+                   "--error-rate", str(args.error_rate), "--seed", str(args.seed)]
+        self.process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE,
+                                        universal_newlines=True)
+        line = self.process.stdout.readline()
+        match = re.search(r"http://\S+", line)
+        if match is None:
+            self.stop()
+            raise RuntimeError('mock gateway did not start: %r' % line)
+        self.url = match.group(0)
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+        self.process.stdout.close()
+
+
+def make_transfers(count, access_token):
+    for i in range(count):
+        yield (100 + i % 50, "benchmark transfer %d" % i,
+               {"username": "user%d" % (i % 1000), "context": MimoContext(access_token)})
+
+
+def get_access_token(client):
+    context = MimoContext()
+    client.request_oauth_token("benchmark", context=context, params={"url": "http://localhost/"})
+    return context.access_token
+
+
+def bench_sequential(gateway, args):
+    client = MimoRestClient("bench", "secret", gateway.url, json_request=True, **URLS)
+    token = get_access_token(client)
+    return BulkTransfer(client, concurrency=1).run_all(make_transfers(args.transfers, token))
+
+
+def bench_threaded(gateway, args):
+    client = MimoRestClient("bench", "secret", gateway.url, json_request=True,
+                            pool_maxsize=args.concurrency, prewarm=args.concurrency, **URLS)
+    token = get_access_token(client)
+    bulk = BulkTransfer(client, concurrency=args.concurrency)
+    return bulk.run_all(make_transfers(args.transfers, token))
+
+
+def bench_async(gateway, args):
+    import asyncio
+    from mimolib.aio import AsyncMimoRestClient
+    from mimolib.aio.bulk import AsyncBulkTransfer
+    loop = asyncio.new_event_loop()
+    client = AsyncMimoRestClient("bench", "secret", gateway.url, json_request=True,
+                                 max_concurrency=args.concurrency, **URLS)
+    try:
+        context = MimoContext()
+        loop.run_until_complete(client.request_oauth_token(
+            "benchmark", context=context, params={"url": "http://localhost/"}))
+        bulk = AsyncBulkTransfer(client, concurrency=args.concurrency)
+        return loop.run_until_complete(bulk.run_all(
+            make_transfers(args.transfers, context.access_token)))
+    finally:
+        loop.run_until_complete(client.close())
+        loop.close()
+
+
+MODES = {"sequential": bench_sequential,
+         "threaded": bench_threaded,
+         "async": bench_async}
+
+
+def run_mode(name, gateway, args):
+    # Imports, codec selection and the first connections are paid before measuring.
+    warm_up = argparse.Namespace(**dict(vars(args), transfers=min(args.transfers, args.concurrency)))
+    MODES[name](gateway, warm_up)
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+    report = MODES[name](gateway, args)
+    row = report.as_dict()
+    row["mode"] = name
+    if tracemalloc is not None:
+        row["peak_memory_kb"] = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    if resource is not None:
+        row["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return row
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark MimoRestClient against the mock gateway.")
+    parser.add_argument("--transfers", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.005,
+                        help="seconds the mock gateway adds to every call")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--modes", default="sequential,threaded,async")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="append JSON results to this file")
+    args = parser.parse_args(argv)
+
+    rows = []
+    for name in args.modes.split(","):
+        gateway = GatewayProcess(args)
+        try:
+            rows.append(run_mode(name, gateway, args))
+        finally:
+            gateway.stop()
+
+    print ("%-12s %8s %8s %10s %9s %9s %9s %10s" % (
+        "mode", "total", "failed", "req/s", "p50 ms", "p95 ms", "p99 ms", "peak KB"))
+    for row in rows:
+        print ("%-12s %8d %8d %10.1f %9.2f %9.2f %9.2f %10s" % (
+            row["mode"], row["total"], row["failed"], row["throughput"],
+            row["p50"] * 1000, row["p95"] * 1000, row["p99"] * 1000,
+            row.get("peak_memory_kb", "-")))
+    if args.output:
+        with open(args.output, "a") as f:
+            for row in rows:
+                f.write(json.dumps(row, sort_keys=True) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+Startup benchmark for short-lived invocations
+=============================================
+
+Measures, each in a fresh interpreter, the time to import mimolib, to build
+a client and a code URL offline, and to make the first network call
+against the local mock gateway, and checks that requests is only imported
+by the network call.
+
+    python benchmarks/bench_startup.py --runs 20
+
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mimolib.bulk import percentile
+from mimolib.mockgateway import MockGateway
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+PROBE = '''
+import json, sys, time
+clock = getattr(time, "perf_counter", time.time)
+started = clock()
+from mimolib import MimoRestClient, MimoContext
+imported = clock()
+client = MimoRestClient("bench", "secret", sys.argv[1], token_url="oauth/v2/token",
+                        search_url="partner/user/card_id")
+client.get_code_url(redirect_uri="http://localhost/callback")
+client.get_search_url(MimoContext("token"), username="mimo")
+offline = clock()
+offline_requests = "requests" in sys.modules
+client.search_user(MimoContext("token"), username="mimo")
+online = clock()
+print(json.dumps({"import": imported - started, "offline_call": offline - imported,
+                  "first_network_call": online - offline,
+                  "requests_imported_offline": offline_requests}))
+'''
+
+
+def run_probe(url):
+    output = subprocess.check_output([sys.executable, "-c", PROBE, url], cwd=ROOT)
+    return json.loads(output.decode("utf-8"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark mimolib import and cold-call time.")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    with MockGateway() as gateway:
+        samples = [run_probe(gateway.url) for _ in range(args.runs)]
+    print ("%-20s %9s %9s %9s" % ("phase", "p50 ms", "p95 ms", "max ms"))
+    for phase in ("import", "offline_call", "first_network_call"):
+        values = sorted(sample[phase] for sample in samples)
+        print ("%-20s %9.2f %9.2f %9.2f" % (phase, percentile(values, 50) * 1000,
+                                           percentile(values, 95) * 1000, values[-1] * 1000))
+    print ("requests imported before the first network call: %s"
+           % any(sample["requests_imported_offline"] for sample in samples))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+Throughput benchmark for the notification receiver
+==================================================
+
+Starts a WebhookReceiver on a local port, posts signed notifications to it
+from a NotificationSender, with a share of redeliveries and of badly signed
+requests, and reports events/sec, dispatch latency and the receiver's
+counters. Requires Python 3 and aiohttp.
+
+    python benchmarks/bench_webhooks.py --events 20000 --concurrency 64
+
+'''
+import argparse
+import asyncio
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mimolib import MimoRestClient
+from mimolib.compat import monotonic
+
+
+def make_notifications(count, duplicate_rate, rng):
+    for index in range(count):
+        transaction_id = index
+        if index and rng.random() < duplicate_rate:
+            transaction_id = rng.randrange(index)
+        yield {"transaction_id": transaction_id, "type": "success",
+               "amount": "%d.00" % rng.randint(1, 500), "notes": "payout"}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the gateway notification receiver.")
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--duplicate-rate", type=float, default=0.05)
+    parser.add_argument("--forged", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    from mimolib.aio.webhooks import WebhookReceiver, NotificationSender
+    client = MimoRestClient("bench", "secret", "http://localhost/", offline=True)
+    receiver = WebhookReceiver(client, workers=args.workers)
+    handled = []
+    receiver.add_handler(lambda event: handled.append(event.transaction_id), "success")
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(receiver.start())
+    sender = NotificationSender(receiver.url, client.client_secret, concurrency=args.concurrency)
+    try:
+        rng = random.Random(args.seed)
+        started = monotonic()
+        statuses = loop.run_until_complete(sender.send_many(
+            make_notifications(args.events, args.duplicate_rate, rng)))
+        loop.run_until_complete(receiver.drain())
+        elapsed = monotonic() - started
+        forged = [loop.run_until_complete(sender.send({"transaction_id": index}, secret="forged"))
+                  for index in range(args.forged)]
+    finally:
+        loop.run_until_complete(sender.close())
+        loop.run_until_complete(receiver.stop())
+        loop.close()
+
+    report = receiver.report
+    print ("events %d in %.2fs: %.0f events/sec" % (args.events, elapsed, args.events / elapsed))
+    print ("dispatch latency p50 %.2f ms, p99 %.2f ms" % (report.latency.percentile(50) * 1000,
+                                                        report.latency.percentile(99) * 1000))
+    print ("statuses %s, forged requests refused %d/%d"
+           % (sorted(statuses.items()), forged.count(401), len(forged)))
+    print ("handled %d distinct, duplicates %d, overloaded %d"
+           % (len(set(handled)), report.duplicates, report.overloaded))
+
+
+if __name__ == "__main__":
+    main()
@@ -40,17 +40,63 @@ mimo-python is a simple python module to support
 Mimo's API with OAuth 2.0 standard
 
 '''
-import requests
-from requests.auth import HTTPBasicAuth
-
 __title__ = 'MimoRestClient'
 __version__ = '1.0.0'
 
 
 
-import json
-import urllib
-from urllib import urlencode
+import logging
+import threading
+import time
+
+from mimolib.compat import urlencode, quote_plus, string_types, text_type, iteritems, monotonic
+from mimolib.codec import get_codec
+from mimolib.compression import BufferPool, compress
+from mimolib.metrics import RequestEvent, set_current_event
+from mimolib.results import (TransferResponse, RefundResponse, VoidResponse,
+                             SearchResponse)
+from mimolib.retry import new_idempotency_key
+from mimolib.templates import RequestTemplate
+
+logger = logging.getLogger(__name__)
+
+# Query fields of the registration URL, in order; the gateway calls zipcode "zip".
+REGISTRATION_QUERY_FIELDS = ("account_type", "username", "pin", "email", "password",
+                             "challenge_question", "challenge_answer", "terms_and_conditions",
+                             "address", "address_2", "dob", "city", "state", "zip", "country",
+                             "address_type", "first_name", "middle_name", "gender", "about",
+                             "website", "facebook", "twitter", "company_name",
+                             "company_id_number", "rc_incorporation_year", "mobile_phone")
+
+ENDPOINTS = ("authentication_url", "token_url", "search_url", "transfer_url",
+             "refund_url", "void_url", "registration_url")
+
+# Endpoint name of requests to URLs the client has no route for.
+OTHER_ENDPOINT = "other"
+
+
+class MimoContext(object):
+    """MimoContext class holding the credentials of one caller.
+
+    Passing a context to the MimoRestClient operations makes them read the
+    access token and last transaction id from the context, and write the new
+    ones back to it, instead of using the shared session cookie jar. Give each
+    worker thread or task its own context and a single client (and its pooled
+    session) can be shared across the whole process.
+
+    Attributes:
+        access_token: String OAuth access token used for the calls.
+        transaction_id: Transaction id returned by the last transfer or refund.
+    """
+    __slots__ = ("access_token", "transaction_id")
+
+    def __init__(self, access_token=False, transaction_id=False):
+        self.access_token = access_token
+        self.transaction_id = transaction_id
+
+    def __repr__(self):
+        return "MimoContext(transaction_id=%r)" % (self.transaction_id,)
+
 
 class MimoRestClient:
     """MimoRestClient class used to support various MIMO Payment API.
@@ -74,7 +120,37 @@ class MimoRestClient:
                  registration_url="partner/registration",
                  encoding="utf-8", **kwargs):
         """Inits SampleClass with client_id,client_secret,client_url and various 
-           URL used for MIMO API."""
+           URL used for MIMO API.
+
+           Connection pooling is tuned through kwargs:
+               pool_connections: Number of per-host pools to cache (default 10).
+               pool_maxsize: Maximum connections kept per host (default 10).
+               pool_block: Wait for a free connection instead of opening a throwaway one (default False).
+               connect_timeout: Seconds to wait for a connection (default 10).
+               read_timeout: Seconds to wait for the server response (default 60).
+               prewarm: Number of keep-alive connections to open at startup (default 0).
+
+           search_cache: Optional mimolib.cache.SearchCache used by search_user.
+           retry_policy: Optional mimolib.retry.RetryPolicy for transient failures.
+           rate_limiter: Optional mimolib.throttle.RateLimiter, may be shared between clients.
+           circuit_breaker: Optional mimolib.throttle.CircuitBreaker, may be shared between clients.
+           json_codec: "orjson", "ujson" or "json"; by default the fastest installed one is used.
+           typed_results: Return mimolib.results objects instead of dicts (default False).
+           observers: Objects whose on_request(event) receives a mimolib.metrics.RequestEvent per call.
+           journal: Optional mimolib.journal.Journal recording transfers, refunds and voids durably.
+           offline: Refuse every network call; URL building and get_code_url still work (default False).
+
+           Compression and response buffering:
+               compress_requests: "gzip" or "deflate" to compress request bodies (default None).
+               compress_min_size: Bodies smaller than this many bytes are sent as is (default 1024).
+               compression_level: zlib level used for request bodies (default 6).
+               accept_encoding: Response encodings offered to the gateway (default "gzip, deflate").
+               stream_responses: Read responses into pooled buffers and decode them from there (default False).
+               buffer_pool: mimolib.compression.BufferPool to borrow the buffers from, may be shared.
+
+           requests and the JSON library are only imported, and the session only created,
+           on the first network call.
+        """
         self.client_id = client_id
         self.client_secret = client_secret
         self.client_url = client_url
@@ -94,25 +170,162 @@ class MimoRestClient:
             self.headers = {'content-type': 'application/json'}
         if kwargs.get("auth_params", False):
             self.auth_params = kwargs["auth_params"] # must be like-("mimo", "mimo")
-        #self.session = requests.session(auth=self.auth_params)
-        self.session = requests.session()
-        self.session.auth = self.auth_params
+        self.json_codec = kwargs.get("json_codec")
+        self._codec = None
+        self.typed_results = kwargs.get("typed_results", False)
+        self.search_cache = kwargs.get("search_cache")
+        self.observers = list(kwargs.get("observers", ()))
+        self.retry_policy = kwargs.get("retry_policy")
+        self.rate_limiter = kwargs.get("rate_limiter")
+        self.circuit_breaker = kwargs.get("circuit_breaker")
+        self.journal = kwargs.get("journal")
+        self.extra_routes = {}
+        self.compile_templates()
+        self.pool_connections = kwargs.get("pool_connections", 10)
+        self.pool_maxsize = kwargs.get("pool_maxsize", 10)
+        self.pool_block = kwargs.get("pool_block", False)
+        self.timeout = (kwargs.get("connect_timeout", 10), kwargs.get("read_timeout", 60))
+        self.offline = kwargs.get("offline", False)
+        self.compress_requests = kwargs.get("compress_requests")
+        self.compress_min_size = kwargs.get("compress_min_size", 1024)
+        self.compression_level = kwargs.get("compression_level", 6)
+        self.accept_encoding = kwargs.get("accept_encoding", "gzip, deflate")
+        self.stream_responses = kwargs.get("stream_responses", False)
+        self.buffer_pool = kwargs.get("buffer_pool") or BufferPool()
+        self._session = None
+        self.session_lock = threading.Lock()
+        if kwargs.get("prewarm", 0) and not self.offline:
+            self.warm_up(kwargs["prewarm"])
+
+    def compile_templates(self):
+        """Performs operation of building the RequestTemplate of every endpoint.
+
+            Call it again after changing an endpoint URL, client_id or client_secret.
+        """
+        self.templates = dict((name, RequestTemplate(name, getattr(self, name)))
+                              for name in ENDPOINTS)
+        self.templates["authentication_url"] = RequestTemplate(
+            "authentication_url", self.authentication_url,
+            [("client_id", self.client_id), ("response_type", "code")])
+        self.templates["registration_url"] = RequestTemplate(
+            "registration_url", self.registration_url,
+            [("client_id", self.client_id), ("client_secret", self.client_secret)],
+            REGISTRATION_QUERY_FIELDS)
+        self.routes = dict((template.url, template) for template in self.templates.values())
+
+    def make_session(self):
+        """Performs operation of creating the pooled requests session."""
+        import requests
+        from mimolib.transport import TimedHTTPAdapter
+        #session = requests.session(auth=self.auth_params)
+        session = requests.session()
+        session.auth = self.auth_params
+        session.headers["Accept-Encoding"] = self.accept_encoding
+        adapter = TimedHTTPAdapter(pool_connections=self.pool_connections,
+                                   pool_maxsize=self.pool_maxsize,
+                                   pool_block=self.pool_block)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @property
+    def codec(self):
+        """JSON codec of the client, picked on first use."""
+        if self._codec is None:
+            self._codec = get_codec(self.json_codec, self.encoding)
+        return self._codec
+
+    @property
+    def session(self):
+        """requests session of the client, created on first use."""
+        session = self._session
+        if session is None:
+            with self.session_lock:
+                if self._session is None:
+                    self._session = self.make_session()
+                session = self._session
+        return session
+
+    @session.setter
+    def session(self, session):
+        self._session = session
+
+    def warm_up(self, connections):
+        """Performs operation of opening keep-alive connections to the gateway ahead of the first calls.
+
+            The HEAD requests are sent concurrently and every response holds on
+            to its connection until all of them are done, so each one needs a
+            connection of its own instead of reusing the first.
+
+            Args:
+                self: Current self class
+                connections: Number of connections to open, capped at pool_maxsize.
+
+            Returns:
+                Integer number of new connections now idle in the pool; HEADs
+                served on a connection that was already open are not counted
+        """
+        from requests.exceptions import RequestException
+        connections = min(connections, self.pool_maxsize)
+        held = []
+
+        def connect():
+            event = RequestEvent("warm_up", "HEAD")
+            set_current_event(event)
+            try:
+                response = self.session.head(self.client_url, timeout=self.timeout, stream=True)
+            except RequestException:
+                return
+            finally:
+                set_current_event(None)
+            held.append((response, event))
+
+        threads = [threading.Thread(target=connect) for _ in range(connections)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for response, event in held:
+            response.raw.release_conn()
+        return sum(1 for response, event in held if not event.reused_connection)
 
     def get_session_cookies_dict(self):
         """Performs operation of reading the session cookies."""
-        return requests.utils.dict_from_cookiejar(self.session.cookies)
+        if self._session is None:
+            return {}
+        from requests.utils import dict_from_cookiejar
+        return dict_from_cookiejar(self._session.cookies)
+
+    def get_cookie(self, name):
+        """Performs operation of reading one session cookie without copying the whole jar."""
+        if self._session is None:
+            return None
+        from requests.cookies import CookieConflictError
+        try:
+            return self._session.cookies.get(name)
+        except CookieConflictError:
+            return self.get_session_cookies_dict().get(name)
+
+    def get_credential(self, name, context=None):
+        """Performs operation of reading a credential from the context, or from the session cookies when no context is given."""
+        if context is not None:
+            return getattr(context, name) or False
+        value = self.get_cookie(name)
+        if value is None:
+            return False
+        return value
 
     def set_cookies(self, cookie_dict):
         """Performs operation of setting cookie data."""
-        for k,v in cookie_dict.iteritems():
+        for k,v in iteritems(cookie_dict):
             if not isinstance(v, str):
                 cookie_dict[k] =  str(v)
-        requests.utils.add_dict_to_cookiejar(self.session.cookies,
-                                             cookie_dict)
+        from requests.utils import add_dict_to_cookiejar
+        add_dict_to_cookiejar(self.session.cookies, cookie_dict)
     
     def encode_url(self, url):
         """Performs operation of encoding the URL and escape characters."""
-        return urllib.quote_plus(url)
+        return quote_plus(url)
 
     def get_url(self, params, url):
         """Performs operation to get URL."""
@@ -120,12 +333,217 @@ class MimoRestClient:
         url = "%(url)s?"%{'url' : url} + params
         return url
 
+    def get_request_body(self, params):
+        """Performs operation of encoding the request parameters as JSON when json_request is set."""
+        if self.json_request:
+            return self.codec.dumps(params)
+        return params
+
+    def compress_request_body(self, data, headers):
+        """Performs operation of compressing a request body per compress_requests.
+            Args:
+                self: Current self class
+                data: Request body, a string or a dict of form parameters.
+                headers: Per-call headers, updated with Content-Encoding when the body is compressed.
+
+            Returns:
+                Body to send
+        """
+        if not self.compress_requests or not data:
+            return data
+        if isinstance(data, dict):
+            data = urlencode(data, True)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        if isinstance(data, text_type):
+            data = data.encode(self.encoding)
+        if len(data) < self.compress_min_size:
+            return data
+        headers["Content-Encoding"] = self.compress_requests
+        return compress(data, self.compress_requests, self.compression_level)
+
+    def get_request_headers(self, headers=None):
+        """Performs operation of building per-call headers without mutating the shared client headers."""
+        request_headers = dict(self.headers or {})
+        request_headers.update(headers or {})
+        return request_headers
+
+    def add_route(self, name, url):
+        """Performs operation of naming an endpoint outside the client's own templates,
+            so its calls get their own rate limit bucket and metrics.
+            Args:
+                self: Current self class
+                name: Endpoint name, e.g. "lookup_url".
+                url: Full endpoint URL, without query string.
+        """
+        self.extra_routes[url] = name
+
+    def get_endpoint_name(self, url):
+        """Performs operation of mapping a request URL to its endpoint name, e.g. "transfer_url".
+
+            The query string is ignored; URLs without a route are named OTHER_ENDPOINT,
+            so per-call values such as tokens never become bucket keys or metric labels.
+        """
+        url = url.split("?", 1)[0]
+        template = self.routes.get(url)
+        if template is not None:
+            return template.name
+        return self.extra_routes.get(url, OTHER_ENDPOINT)
+
+    def admit_request(self, endpoint, attempt=1):
+        """Performs operation of checking the circuit breaker and rate limiter before a request.
+            Args:
+                self: Current self class
+                endpoint: Endpoint name of the request.
+                attempt: Attempt number of the call; when the first attempt is refused
+                         the error is marked sent=False, as nothing reached the gateway.
+
+            Returns:
+                Float seconds to wait before sending the request
+
+            Raises:
+                CircuitOpenError: If the circuit breaker is open.
+        """
+        if self.circuit_breaker is not None:
+            try:
+                self.circuit_breaker.allow()
+            except Exception as e:
+                e.sent = attempt > 1
+                raise
+        if self.rate_limiter is not None:
+            return self.rate_limiter.reserve(endpoint)
+        return 0
+
+    def record_outcome(self, ok):
+        """Performs operation of reporting a request outcome to the circuit breaker."""
+        if self.circuit_breaker is not None:
+            if ok:
+                self.circuit_breaker.record_success()
+            else:
+                self.circuit_breaker.record_failure()
+
+    def release_admission(self):
+        """Performs operation of releasing an admitted call that ended without an outcome, e.g. cancelled or interrupted."""
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.release()
+
+    def add_observer(self, observer):
+        """Performs operation of registering an object whose on_request(event) receives a RequestEvent per call."""
+        self.observers.append(observer)
+
+    def emit_event(self, event):
+        """Performs operation of passing a RequestEvent to every observer."""
+        for observer in self.observers:
+            try:
+                observer.on_request(event)
+            except Exception:
+                logger.warning("observer %r failed on %r", observer, event, exc_info=True)
+
+    def emit_failure(self, event, error, attempt, started):
+        """Performs operation of completing the RequestEvent of a failed or refused call and emitting it."""
+        event.retries = attempt - 1
+        event.error = error
+        event.latency = monotonic() - started
+        self.emit_event(event)
+
+    def send_request(self, method, url, idempotent=False, with_status=False, **kwargs):
+        """Performs operation of sending an HTTP request, retrying per retry_policy.
+            Args:
+                self: Current self class
+                method: HTTP method name
+                url: URL where request needs to be sent
+                idempotent: True when the call may safely be repeated.
+                with_status: Return the HTTP status of the last attempt along with the content.
+
+            Returns:
+                JSON response received from the server, or a tuple of (HTTP status, JSON response) with with_status
+
+            Raises:
+                CircuitOpenError: If the circuit breaker is open.
+                Exception: An error occurred while sending request, or the client is offline.
+                           Errors raised before anything was sent have sent=False.
+        """
+        if self.offline:
+            error = Exception('MimoRestClient is offline, %s %s was not sent' % (method, url))
+            error.sent = False
+            raise error
+        from requests.exceptions import RequestException
+        from requests.packages.urllib3.exceptions import HTTPError as TransportError
+        endpoint = self.get_endpoint_name(url)
+        event = RequestEvent(endpoint, method)
+        started = monotonic()
+        policy = idempotent and self.retry_policy or None
+        if policy is not None:
+            policy.record_call()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                delay = self.admit_request(endpoint, attempt)
+            except Exception as e:
+                event.rejected = True
+                self.emit_failure(event, e, attempt, started)
+                raise
+            event.wait_time += delay
+            set_current_event(event)
+            try:
+                if delay:
+                    time.sleep(delay)
+                response = self.session.request(method, url, timeout=self.timeout,
+                                                stream=self.stream_responses, **kwargs)
+                retry = policy is not None and policy.is_retryable_status(response.status_code) \
+                    and policy.should_retry(attempt, response.status_code)
+                if retry:
+                    response.close()
+                else:
+                    # A streamed body is only read here, so a truncated or stalled
+                    # body fails this attempt like a connection error would.
+                    decode_started = monotonic()
+                    if self.stream_responses:
+                        content, received = self.parse_streamed(response)
+                    else:
+                        content = self.parse_response(response)
+                        received = len(response.content)
+            except (RequestException, TransportError) as e:
+                self.record_outcome(False)
+                if policy is not None and policy.should_retry(attempt):
+                    time.sleep(policy.get_delay(attempt))
+                    continue
+                logger.debug("%s %s failed: %s", method, endpoint, e)
+                self.emit_failure(event, e, attempt, started)
+                raise Exception(e)
+            except BaseException:
+                # Neither a success nor a gateway failure, e.g. an undecodable body
+                # or KeyboardInterrupt; a half-open probe slot must not stay taken.
+                self.release_admission()
+                raise
+            finally:
+                set_current_event(None)
+            self.record_outcome(response.status_code < 500)
+            if retry:
+                time.sleep(policy.get_delay(attempt, response.headers.get("Retry-After")))
+                continue
+            break
+        event.decode_time = monotonic() - decode_started
+        event.latency = monotonic() - started
+        event.retries = attempt - 1
+        event.status = response.status_code
+        event.ttfb = response.elapsed.total_seconds()
+        event.bytes_sent = len(response.request.body or "")
+        event.bytes_received = received
+        self.emit_event(event)
+        if with_status:
+            return response.status_code, content
+        return content
+
     def POST_request(self, url, params, **kwargs):
         """Performs operation of posting the request to the server in JSON format.
             Args:
                 self: Current self class
                 url: URL where request needs to be posted
                 params: Request parameters to be posted.
+                idempotent: Optional flag allowing the retry_policy to repeat the request.
+                headers: Optional extra headers for this request.
+                with_status: Optional flag returning (HTTP status, JSON response).
         
             Returns:
                 JSON response received from the server
@@ -134,24 +552,17 @@ class MimoRestClient:
                 Exception: An error occurred while posting request or parsing response.
         """
         kwargs = kwargs and kwargs or {}
-        self.headers.update(kwargs.get("headers", {}))
-        try:
-            if self.json_request:
-                data = json.dumps(params, encoding=self.encoding)
-            else:
-                data = params
-
-            response = self.session.post(url, data=data, headers=self.headers)
-	    return self.parse_response(response)
-        except requests.exceptions as e:
-            print ("Request Exception occurred :",e)
-            raise Exception(e)
+        headers = self.get_request_headers(kwargs.get("headers"))
+        data = self.compress_request_body(self.get_request_body(params), headers)
+        return self.send_request("POST", url, kwargs.get("idempotent", False),
+                                 kwargs.get("with_status", False), data=data, headers=headers)
 
     def GET_request(self, url, **kwargs):
-        """Performs operation of HTTP GET on the URL provided.
+        """Performs operation of HTTP GET on the URL provided. GET requests are retried per retry_policy.
             Args:
                 self: Current self class
                 url: URL where request needs to be posted
+                with_status: Optional flag returning (HTTP status, JSON response).
            
             Returns:
                 JSON response received from the server
@@ -159,12 +570,7 @@ class MimoRestClient:
             Raises:
                 Exception: An error occurred while posting request or parsing response.
         """
-        try:
-            response = self.session.get(url)
-	    return self.parse_response(response)
-        except requests.exceptions as e:
-            print ("Request Exception occure :",e)
-            raise Exception(e)
+        return self.send_request("GET", url, True, kwargs.get("with_status", False))
 
     def parse_response(self, resp):
         """Performs operation of parsing the HTTP Response.
@@ -175,15 +581,52 @@ class MimoRestClient:
             Returns:
                 JSON content received from the server
         """
+        return self.parse_content(resp.content)
+
+    def parse_streamed(self, response):
+        """Performs operation of reading a streamed HTTP Response into a pooled buffer and parsing it.
+
+            Returns:
+                Tuple of (JSON content, number of body bytes)
+        """
+        buffer = self.buffer_pool.get()
+        try:
+            response.raw.decode_content = True
+            size = self.buffer_pool.read_into(buffer, response.raw)
+            content = self.parse_buffer(buffer, size)
+        finally:
+            response.close()
+            self.buffer_pool.put(buffer)
+        return content, size
+
+    def parse_buffer(self, buffer, size):
+        """Performs operation of parsing the first size bytes of a response buffer."""
+        if not size:
+            return {}
+        view = memoryview(buffer)[:size]
+        try:
+            return self.codec.loads_buffer(view)
+        except (ValueError, TypeError):
+            return self.parse_content(view.tobytes())
+
+    def parse_content(self, raw):
+        """Performs operation of parsing the raw body of an HTTP Response.
+            Args:
+                self: Current self class
+                raw: Raw response body (bytes or string)
+        
+            Returns:
+                JSON content received from the server, or the raw body when it is not JSON
+        """
         content = {}
-        if resp.content:
-            if isinstance(resp.content, basestring):
+        if raw:
+            if isinstance(raw, string_types):
                 try:
-                    content = json.loads(resp.content)
+                    content = self.codec.loads(raw)
                 except ValueError:
-                    content = resp.content
-	    else:
-		content = resp.content
+                    content = raw
+            else:
+                content = raw
         return content    
 
     def get_code_url(self, **kwargs):
@@ -194,24 +637,25 @@ class MimoRestClient:
             Returns:
                 String of Authentication URL for MIMO Payment Gateway
         """
+        if "client_id" not in kwargs and "response_type" not in kwargs:
+            return self.templates["authentication_url"].build_url(kwargs)
         data = {'client_id': self.client_id,
                 'response_type': "code"}
         data.update(kwargs)
         params = '?' + urlencode(data)
         return self.authentication_url + params
 
-    def request_oauth_token(self, code, **kwargs):
-        """Performs operation doing OATH with MIMO Payment Gateway. It also sets the cookies.
+    def get_token_params(self, code, **kwargs):
+        """Performs operation of building the OAuth token request parameters.
             Args:
                 self: Current self class
                 code: Authentication code.
            
             Returns:
-                String HTTP response received from the server
+                Dict of parameters to be posted to the token URL
         
             Raises:
                 NameError: If url or redirect_url varaible missing in kwargs input.
-                Exception: An error occurred while posting request or parsing response.
         """
         if 'params' not in kwargs:
             raise NameError('params is missing in arguments (kwargs as dict)')
@@ -225,62 +669,176 @@ class MimoRestClient:
                                client_secret = self.client_secret,
                                grant_type = "authorization_code",
                                code = code)
-        response_content = self.POST_request(self.token_url, kwargs["params"])
-        self.set_cookies(response_content)
+        return kwargs["params"]
+
+    def request_oauth_token(self, code, context=None, **kwargs):
+        """Performs operation doing OATH with MIMO Payment Gateway. It also sets the cookies.
+            Args:
+                self: Current self class
+                code: Authentication code.
+                context: Optional MimoContext receiving the access token instead of the session cookies.
+           
+            Returns:
+                String HTTP response received from the server
+        
+            Raises:
+                NameError: If url or redirect_url varaible missing in kwargs input.
+                Exception: An error occurred while posting request or parsing response.
+        """
+        params = self.get_token_params(code, **kwargs)
+        response_content = self.POST_request(self.token_url, params)
+        self.store_token(response_content, context)
         return response_content
 
+    def get_refresh_params(self, refresh_token, **kwargs):
+        """Performs operation of building the refresh_token grant parameters."""
+        kwargs.update(client_id = self.client_id,
+                      client_secret = self.client_secret,
+                      grant_type = "refresh_token",
+                      refresh_token = refresh_token)
+        return kwargs
 
-    def search_user(self, **kwargs):
-        """Performs operation doing search by username,email,phone and account number with MIMO Payment Gateway.
+    def refresh_oauth_token(self, refresh_token, context=None, **kwargs):
+        """Performs operation of renewing the access token with a refresh token.
+            Args:
+                self: Current self class
+                refresh_token: Refresh token returned with the previous access token.
+                context: Optional MimoContext receiving the access token instead of the session cookies.
+
+            Returns:
+                String HTTP response received from the server
+
+            Raises:
+                Exception: An error occurred while posting request or parsing response.
+        """
+        params = self.get_refresh_params(refresh_token, **kwargs)
+        response_content = self.POST_request(self.token_url, params)
+        self.store_token(response_content, context)
+        return response_content
+
+
+    def get_search_url(self, context=None, **kwargs):
+        """Performs operation of building the search URL for the given search values.
             Args:
                 self: Current self class
           
             Returns:
-                String JSON response received from the server
+                String search URL including the access token
         
             Raises:
                 ValueError: If variables in input are empty.
-                Exception: An error occurred while posting request or parsing response.
         """
         kwargs = kwargs and kwargs or {}
-        if kwargs.keys() <= 1:
+        if not kwargs:
             raise ValueError('search value is missing in arguments (kwargs as dict)')
 
         if not kwargs.get("access_token", False):
-            kwargs.update({'access_token':self.get_session_cookies_dict().get("access_token", False)})
-        url = self.get_url(kwargs, self.search_url)
-        return self.GET_request(url)
-
+            kwargs.update({'access_token':self.get_credential("access_token", context)})
+        return self.templates["search_url"].build_url(kwargs)
 
-    def transfer_funds(self, amount, notes, **kwargs):
-        """Performs operation doing transfer of funds with MIMO Payment Gateway.
+    def search_user(self, context=None, **kwargs):
+        """Performs operation doing search by username,email,phone and account number with MIMO Payment Gateway.
             Args:
                 self: Current self class
-                amount: Double amount to be transferred.
-                notes: String memo notes to be attached with this transfer
+                context: Optional MimoContext to use instead of the session cookies.
           
             Returns:
-                String JSON response received from the server
+                String JSON response received from the server, or the cached answer when
+                the client was created with a search_cache.
         
             Raises:
+                ValueError: If variables in input are empty.
                 Exception: An error occurred while posting request or parsing response.
         """
+        url = self.get_search_url(context, **kwargs)
+        if self.search_cache is not None:
+            found, content = self.search_cache.get(kwargs)
+            if found:
+                return self.get_result(SearchResponse, content)
+        status, content = self.GET_request(url, with_status=True)
+        if self.search_cache is not None:
+            self.search_cache.set(kwargs, content, status)
+        return self.get_result(SearchResponse, content)
+
+
+    def get_transfer_params(self, amount, notes, context=None, **kwargs):
+        """Performs operation of building the transfer request parameters.
+            Args:
+                self: Current self class
+                amount: Double amount to be transferred.
+                notes: String memo notes to be attached with this transfer
+          
+            Returns:
+                Dict of parameters to be posted to the transfer URL
+        """
         kwargs = kwargs and kwargs or {}
         if "access_token" not in kwargs:
-            kwargs.update({'access_token':self.get_session_cookies_dict().get("access_token", False)})
-	
+            kwargs.update({'access_token':self.get_credential("access_token", context)})
+
         kwargs.update({"amount":amount, "notes":notes})
-	response_content = self.POST_request(self.transfer_url, kwargs)
-	self.set_cookies({"transaction_id":response_content.get("transaction_id")})
+        return kwargs
+
+    def get_idempotency_headers(self, kwargs):
+        """Performs operation of taking the idempotency_key out of kwargs, generating one if missing, as a header."""
+        return {"Idempotency-Key": kwargs.pop("idempotency_key", None) or new_idempotency_key()}
+
+    def post_journaled(self, kind, url, params, headers=None):
+        """Performs operation of posting a money-moving request, recording it in the journal if any.
+            Args:
+                self: Current self class
+                kind: "transfer", "refund" or "void".
+                url: URL where request needs to be posted
+                params: Request parameters to be posted.
+                headers: Optional extra headers; their Idempotency-Key names the journal records.
+
+            Returns:
+                JSON response received from the server
+
+            Raises:
+                Exception: An error occurred while posting request or parsing response.
+        """
+        journal = self.journal
+        if journal is None:
+            return self.POST_request(url, params, headers=headers, idempotent=True)
+        key = headers and headers.get("Idempotency-Key") or new_idempotency_key()
+        journal.begin(key, kind, params).result()
+        try:
+            status, response_content = self.POST_request(url, params, headers=headers,
+                                                         idempotent=True, with_status=True)
+        except Exception as e:
+            journal.finish(key, kind, error=e, sent=getattr(e, "sent", True))
+            raise
+        journal.finish(key, kind, response_content, status=status)
         return response_content
 
+    def get_result(self, result_class, response_content):
+        """Performs operation of converting a response to result_class when typed_results is set."""
+        if self.typed_results:
+            return result_class.from_content(response_content)
+        return response_content
 
-    def refund_funds(self, amount, notes, transaction_id=False, **kwargs):
-        """Performs operation doing refund of funds with MIMO Payment Gateway.
+    def store_token(self, response_content, context=None):
+        """Performs operation of remembering the OAuth token response in the context or the session cookies."""
+        if context is not None:
+            context.access_token = response_content.get("access_token", False)
+        else:
+            self.set_cookies(response_content)
+
+    def store_transaction_id(self, response_content, context=None):
+        """Performs operation of remembering the transaction id of a transfer or refund response."""
+        if context is not None:
+            context.transaction_id = response_content.get("transaction_id")
+        else:
+            self.set_cookies({"transaction_id":response_content.get("transaction_id")})
+
+    def transfer_funds(self, amount, notes, context=None, **kwargs):
+        """Performs operation doing transfer of funds with MIMO Payment Gateway.
             Args:
                 self: Current self class
                 amount: Double amount to be transferred.
                 notes: String memo notes to be attached with this transfer
+                context: Optional MimoContext to use instead of the session cookies.
+                idempotency_key: Optional key identifying this payment across retries, generated when missing.
           
             Returns:
                 String JSON response received from the server
@@ -288,24 +846,44 @@ class MimoRestClient:
             Raises:
                 Exception: An error occurred while posting request or parsing response.
         """
+        headers = self.get_idempotency_headers(kwargs)
+        params = self.get_transfer_params(amount, notes, context, **kwargs)
+        response_content = self.post_journaled("transfer", self.transfer_url, params, headers)
+        self.store_transaction_id(response_content, context)
+        return self.get_result(TransferResponse, response_content)
+
+
+    def get_refund_params(self, amount, notes, transaction_id=False, context=None, **kwargs):
+        """Performs operation of building the refund request parameters.
+            Args:
+                self: Current self class
+                amount: Double amount to be transferred.
+                notes: String memo notes to be attached with this transfer
+                transaction_id: Integer transaction id to be refunded.
+          
+            Returns:
+                Dict of parameters to be posted to the refund URL
+        """
         kwargs = kwargs and kwargs or {}
         if "access_token" not in kwargs:
-            kwargs.update({'access_token':self.get_session_cookies_dict().get("access_token", False)})
+            kwargs.update({'access_token':self.get_credential("access_token", context)})
 
         kwargs.update({
                                  "amount":amount,
-                                 "transaction_id":transaction_id and transaction_id or self.get_session_cookies_dict().get("transaction_id", False),
+                                 "transaction_id":transaction_id and transaction_id or self.get_credential("transaction_id", context),
                                  "notes":notes
                                  })
-        response_content = self.POST_request(self.refund_url, kwargs)
-        self.set_cookies({"transaction_id":response_content.get("transaction_id")})
-        return response_content
+        return kwargs
 
-    def void_transfer(self, transaction_id=False, **kwargs):
-        """Performs operation doing voiding of transfer funds transaction which has not yet being completed with MIMO Payment Gateway.
+    def refund_funds(self, amount, notes, transaction_id=False, context=None, **kwargs):
+        """Performs operation doing refund of funds with MIMO Payment Gateway.
             Args:
                 self: Current self class
-                transaction_id: Integer transaction id to be voided.
+                amount: Double amount to be transferred.
+                notes: String memo notes to be attached with this transfer
+                transaction_id: Integer transaction id to be refunded.
+                context: Optional MimoContext to use instead of the session cookies.
+                idempotency_key: Optional key identifying this payment across retries, generated when missing.
           
             Returns:
                 String JSON response received from the server
@@ -313,14 +891,63 @@ class MimoRestClient:
             Raises:
                 Exception: An error occurred while posting request or parsing response.
         """
+        headers = self.get_idempotency_headers(kwargs)
+        params = self.get_refund_params(amount, notes, transaction_id, context, **kwargs)
+        response_content = self.post_journaled("refund", self.refund_url, params, headers)
+        self.store_transaction_id(response_content, context)
+        return self.get_result(RefundResponse, response_content)
+
+    def get_void_params(self, transaction_id=False, context=None, **kwargs):
+        """Performs operation of building the void request parameters.
+            Args:
+                self: Current self class
+                transaction_id: Integer transaction id to be voided.
+          
+            Returns:
+                Dict of parameters to be posted to the void URL
+        """
         kwargs = kwargs and kwargs or {}
         if "access_token" not in kwargs:
-            kwargs.update({'access_token':self.get_session_cookies_dict().get("access_token", False)})
+            kwargs.update({'access_token':self.get_credential("access_token", context)})
 
-        kwargs.update({"transaction_id":transaction_id and transaction_id or 	
-				self.get_session_cookies_dict().get("transaction_id", False)})
+        kwargs.update({"transaction_id":transaction_id and transaction_id or
+                       self.get_credential("transaction_id", context)})
+        return kwargs
 
-        return self.POST_request(self.void_url, kwargs)
+    def void_transfer(self, transaction_id=False, context=None, **kwargs):
+        """Performs operation doing voiding of transfer funds transaction which has not yet being completed with MIMO Payment Gateway.
+            Args:
+                self: Current self class
+                transaction_id: Integer transaction id to be voided.
+                context: Optional MimoContext to use instead of the session cookies.
+          
+            Returns:
+                String JSON response received from the server
+        
+            Raises:
+                Exception: An error occurred while posting request or parsing response.
+        """
+        params = self.get_void_params(transaction_id, context, **kwargs)
+        response_content = self.post_journaled("void", self.void_url, params)
+        return self.get_result(VoidResponse, response_content)
+
+    def get_registration_url(self, account_type,username,pin,email,password,challenge_question,
+                 challenge_answer,terms_and_conditions,address,address_2,dob,city,state,zipcode,country,address_type,
+                 first_name,middle_name,surname,gender,about,website,facebook,twitter,company_name,company_id_number,rc_incorporation_year,mobile_phone):
+        """Performs operation of building the registration URL for MIMO Payment Gateway.
+            Args:
+                self: Current self class
+                Same user details as MimoRestClient.register.
+          
+            Returns:
+                String registration URL with the user details encoded as query string.
+        """
+        
+        return self.templates["registration_url"].fill_url(
+            account_type, username, pin, email, password, challenge_question, challenge_answer,
+            terms_and_conditions, address, address_2, dob, city, state, zipcode, country,
+            address_type, first_name, middle_name, gender, about, website, facebook, twitter,
+            company_name, company_id_number, rc_incorporation_year, mobile_phone)
 
     def register(self, account_type,username,pin,email,password,challenge_question,
                  challenge_answer,terms_and_conditions,address,address_2,dob,city,state,zipcode,country,address_type,
@@ -382,37 +1009,8 @@ class MimoRestClient:
         
                  Exception: An error occurred while posting request or parsing response.
         """
-        
-        data = {'client_id':self.client_id,
-                'client_secret':self.client_secret,
-                'account_type':account_type,
-                        'username':username,
-                        'pin':pin,
-                        'email':email,
-                        'password':password,
-                        'challenge_question':challenge_question,
-                        'challenge_answer':challenge_answer,
-                        'terms_and_conditions':terms_and_conditions,
-                        'address':address,
-                        'address_2':address_2,
-                        'dob':dob,
-                        'city':city,
-                        'state':state,
-                        'zip':zipcode,
-                        'country':country,
-                        'address_type':address_type,
-                        'first_name':first_name,
-                        'middle_name':middle_name,
-                        'gender':gender,
-                        'about':about,
-                        'website':website,
-                        'facebook':facebook,
-                        'twitter':twitter,
-                        'company_name':company_name,
-                        'company_id_number':company_id_number,
-                        'rc_incorporation_year':rc_incorporation_year,
-                        'mobile_phone':mobile_phone}
-        params = '?' + urlencode(data)
-
 
-        return self.POST_request(self.registration_url+params, kwargs)
\ No newline at end of file
+        url = self.get_registration_url(account_type,username,pin,email,password,challenge_question,
+                                        challenge_answer,terms_and_conditions,address,address_2,dob,city,state,zipcode,country,address_type,
+                                        first_name,middle_name,surname,gender,about,website,facebook,twitter,company_name,company_id_number,rc_incorporation_year,mobile_phone)
+        return self.POST_request(url, kwargs)
@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.aio: asyncio support for Mimo's API
+===========================================
+
+AsyncMimoRestClient exposes coroutine versions of every MimoRestClient
+operation on top of a pooled aiohttp session. Requires Python >= 3.5 and
+the aiohttp module.
+
+'''
+import asyncio
+import inspect
+import logging
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from mimolib import MimoRestClient
+from mimolib.compat import iteritems, monotonic
+from mimolib.metrics import RequestEvent
+from mimolib.results import (TransferResponse, RefundResponse, VoidResponse,
+                             SearchResponse)
+from mimolib.retry import new_idempotency_key
+
+logger = logging.getLogger(__name__)
+
+REGISTRATION_FIELDS = tuple(inspect.signature(
+    MimoRestClient.get_registration_url).parameters)[1:]
+
+
+def make_trace_config():
+    """Performs operation of building the aiohttp hooks that fill in the RequestEvent timings."""
+    trace_config = aiohttp.TraceConfig()
+
+    async def on_request_start(session, ctx, params):
+        ctx.sent_at = monotonic()
+
+    async def on_connection_create_start(session, ctx, params):
+        ctx.connect_started = monotonic()
+
+    async def on_connection_create_end(session, ctx, params):
+        ctx.trace_request_ctx.connect_time += monotonic() - ctx.connect_started
+        ctx.trace_request_ctx.reused_connection = False
+
+    async def on_request_end(session, ctx, params):
+        ctx.trace_request_ctx.ttfb = monotonic() - ctx.sent_at
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_request_end.append(on_request_end)
+    return trace_config
+
+
+class AsyncMimoRestClient(MimoRestClient):
+    """AsyncMimoRestClient class used to call MIMO Payment API from asyncio code.
+
+    URL building, response parsing and access token handling are shared with
+    MimoRestClient; only the transport differs. All connections come from one
+    keep-alive aiohttp connection pool and at most max_concurrency requests are
+    in flight at once.
+
+    Attributes:
+        self: Current class.
+        client_id: An string client id provided by MIMO Payment Gateway.
+        client_secret: An string client secret key provided by MIMO Payment Gateway.
+        client_url: An string MIMO Payment Gateway url.
+    """
+    def __init__(self, client_id, client_secret, client_url, **kwargs):
+        """Inits AsyncMimoRestClient with the MimoRestClient arguments plus:
+            max_concurrency: Maximum number of requests in flight at once (default 100).
+            connection_limit: Maximum number of pooled connections (default max_concurrency).
+            connection_limit_per_host: Maximum pooled connections per host (default 0, no limit).
+            keepalive_timeout: Seconds an idle pooled connection is kept open (default 30).
+        Timeouts follow MimoRestClient; prewarm is ignored, await warm_up instead.
+        """
+        if aiohttp is None:
+            raise ImportError('aiohttp is required for AsyncMimoRestClient')
+        self.max_concurrency = kwargs.pop("max_concurrency", 100)
+        self.connection_limit = kwargs.pop("connection_limit", self.max_concurrency)
+        self.connection_limit_per_host = kwargs.pop("connection_limit_per_host", 0)
+        self.keepalive_timeout = kwargs.pop("keepalive_timeout", 30)
+        kwargs.pop("prewarm", None)
+        MimoRestClient.__init__(self, client_id, client_secret, client_url, **kwargs)
+        self.credentials = {}
+        self.aio_session = None
+        self.semaphore = None
+
+    def get_aio_session(self):
+        """Performs operation of creating the pooled aiohttp session on first use."""
+        if self.aio_session is None or self.aio_session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.connection_limit,
+                limit_per_host=self.connection_limit_per_host,
+                keepalive_timeout=self.keepalive_timeout)
+            auth = None
+            if self.auth_params:
+                auth = aiohttp.BasicAuth(*self.auth_params)
+            timeout = aiohttp.ClientTimeout(sock_connect=self.timeout[0],
+                                            sock_read=self.timeout[1])
+            self.aio_session = aiohttp.ClientSession(connector=connector, auth=auth,
+                                                     timeout=timeout,
+                                                     headers={"Accept-Encoding":
+                                                              self.accept_encoding},
+                                                     trace_configs=[make_trace_config()])
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self.aio_session
+
+    def get_session_cookies_dict(self):
+        """Performs operation of reading the credentials sent as cookies with every request."""
+        return dict(self.credentials)
+
+    def get_cookie(self, name):
+        return self.credentials.get(name)
+
+    def set_cookies(self, cookie_dict):
+        """Performs operation of setting cookie data, without creating a blocking requests session."""
+        for k,v in iteritems(cookie_dict):
+            if not isinstance(v, str):
+                cookie_dict[k] =  str(v)
+        self.credentials.update(cookie_dict)
+
+    async def close(self):
+        """Performs operation of closing the pooled connections."""
+        if self.aio_session is not None:
+            await self.aio_session.close()
+            self.aio_session = None
+
+    async def __aenter__(self):
+        self.get_aio_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def warm_up(self, connections):
+        """Coroutine version of MimoRestClient.warm_up, capped at connection_limit.
+
+            Returns:
+                Integer number of new connections now idle in the pool
+        """
+        session = self.get_aio_session()
+        connections = min(connections, self.connection_limit or connections)
+
+        async def connect():
+            event = RequestEvent("warm_up", "HEAD")
+            try:
+                response = await session.head(self.client_url, trace_request_ctx=event)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                return None
+            return response, event
+
+        held = [result for result in await asyncio.gather(*[connect() for _ in range(connections)])
+                if result is not None]
+        for response, event in held:
+            response.release()
+        return sum(1 for response, event in held if not event.reused_connection)
+
+    async def send_request(self, method, url, idempotent=False, with_status=False, **kwargs):
+        """Performs operation of sending one HTTP request through the connection pool,
+        retrying per retry_policy.
+            Args:
+                self: Current self class
+                method: HTTP method name
+                url: URL where request needs to be sent
+                idempotent: True when the call may safely be repeated.
+                with_status: Return the HTTP status of the last attempt along with the content.
+
+            Returns:
+                JSON response received from the server, or a tuple of (HTTP status, JSON response) with with_status
+
+            Raises:
+                Exception: An error occurred while sending request or parsing response,
+                           or the client is offline. Errors raised before anything was
+                           sent have sent=False.
+        """
+        if self.offline:
+            error = Exception('MimoRestClient is offline, %s %s was not sent' % (method, url))
+            error.sent = False
+            raise error
+        session = self.get_aio_session()
+        endpoint = self.get_endpoint_name(url)
+        event = RequestEvent(endpoint, method)
+        started = monotonic()
+        data = kwargs.get("data")
+        if isinstance(data, (bytes, str)):
+            event.bytes_sent = len(data)
+        policy = idempotent and self.retry_policy or None
+        if policy is not None:
+            policy.record_call()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                delay = self.admit_request(endpoint, attempt)
+            except Exception as e:
+                event.rejected = True
+                self.emit_failure(event, e, attempt, started)
+                raise
+            event.wait_time += delay
+            try:
+                if delay:
+                    await asyncio.sleep(delay)
+                async with self.semaphore:
+                    async with session.request(method, url,
+                                               cookies=self.credentials,
+                                               trace_request_ctx=event,
+                                               **kwargs) as response:
+                        status = response.status
+                        retry_after = response.headers.get("Retry-After")
+                        if self.stream_responses:
+                            raw = self.buffer_pool.get()
+                            size = 0
+                            async for chunk in response.content.iter_chunked(
+                                    self.buffer_pool.chunk_size):
+                                size = self.buffer_pool.write(raw, size, chunk)
+                        else:
+                            raw = await response.read()
+                            size = len(raw)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.record_outcome(False)
+                if policy is not None and policy.should_retry(attempt):
+                    delay = policy.get_delay(attempt)
+                else:
+                    logger.debug("%s %s failed: %s", method, endpoint, e)
+                    self.emit_failure(event, e, attempt, started)
+                    raise Exception(e)
+            except BaseException:
+                # Cancelled, e.g. by asyncio.wait_for, or failed outside the transport;
+                # a half-open probe slot must not stay taken.
+                self.release_admission()
+                raise
+            else:
+                self.record_outcome(status < 500)
+                if policy is not None and policy.is_retryable_status(status) \
+                        and policy.should_retry(attempt, status):
+                    delay = policy.get_delay(attempt, retry_after)
+                    if self.stream_responses:
+                        self.buffer_pool.put(raw)
+                else:
+                    break
+            await asyncio.sleep(delay)
+        decode_started = monotonic()
+        if self.stream_responses:
+            try:
+                content = self.parse_buffer(raw, size)
+            finally:
+                self.buffer_pool.put(raw)
+        else:
+            content = self.parse_content(raw)
+        event.decode_time = monotonic() - decode_started
+        event.latency = monotonic() - started
+        event.retries = attempt - 1
+        event.status = status
+        event.bytes_received = size
+        self.emit_event(event)
+        if with_status:
+            return status, content
+        return content
+
+    async def POST_request(self, url, params, **kwargs):
+        """Coroutine version of MimoRestClient.POST_request."""
+        headers = self.get_request_headers(kwargs.get("headers"))
+        data = self.compress_request_body(self.get_request_body(params), headers)
+        return await self.send_request("POST", url, kwargs.get("idempotent", False),
+                                       kwargs.get("with_status", False), data=data,
+                                       headers=headers)
+
+    async def GET_request(self, url, **kwargs):
+        """Coroutine version of MimoRestClient.GET_request."""
+        return await self.send_request("GET", url, True, kwargs.get("with_status", False))
+
+    async def request_oauth_token(self, code, context=None, **kwargs):
+        """Coroutine version of MimoRestClient.request_oauth_token."""
+        params = self.get_token_params(code, **kwargs)
+        response_content = await self.POST_request(self.token_url, params)
+        self.store_token(response_content, context)
+        return response_content
+
+    async def refresh_oauth_token(self, refresh_token, context=None, **kwargs):
+        """Coroutine version of MimoRestClient.refresh_oauth_token."""
+        params = self.get_refresh_params(refresh_token, **kwargs)
+        response_content = await self.POST_request(self.token_url, params)
+        self.store_token(response_content, context)
+        return response_content
+
+    async def search_user(self, context=None, **kwargs):
+        """Coroutine version of MimoRestClient.search_user."""
+        url = self.get_search_url(context, **kwargs)
+        if self.search_cache is not None:
+            found, content = self.search_cache.get(kwargs)
+            if found:
+                return self.get_result(SearchResponse, content)
+        status, content = await self.GET_request(url, with_status=True)
+        if self.search_cache is not None:
+            self.search_cache.set(kwargs, content, status)
+        return self.get_result(SearchResponse, content)
+
+    async def post_journaled(self, kind, url, params, headers=None):
+        """Coroutine version of MimoRestClient.post_journaled."""
+        journal = self.journal
+        if journal is None:
+            return await self.POST_request(url, params, headers=headers, idempotent=True)
+        key = headers and headers.get("Idempotency-Key") or new_idempotency_key()
+        await asyncio.wrap_future(journal.begin(key, kind, params))
+        try:
+            status, response_content = await self.POST_request(url, params, headers=headers,
+                                                               idempotent=True, with_status=True)
+        except Exception as e:
+            journal.finish(key, kind, error=e, sent=getattr(e, "sent", True))
+            raise
+        journal.finish(key, kind, response_content, status=status)
+        return response_content
+
+    async def transfer_funds(self, amount, notes, context=None, **kwargs):
+        """Coroutine version of MimoRestClient.transfer_funds."""
+        headers = self.get_idempotency_headers(kwargs)
+        params = self.get_transfer_params(amount, notes, context, **kwargs)
+        response_content = await self.post_journaled("transfer", self.transfer_url, params,
+                                                     headers)
+        self.store_transaction_id(response_content, context)
+        return self.get_result(TransferResponse, response_content)
+
+    async def refund_funds(self, amount, notes, transaction_id=False, context=None, **kwargs):
+        """Coroutine version of MimoRestClient.refund_funds."""
+        headers = self.get_idempotency_headers(kwargs)
+        params = self.get_refund_params(amount, notes, transaction_id, context, **kwargs)
+        response_content = await self.post_journaled("refund", self.refund_url, params,
+                                                     headers)
+        self.store_transaction_id(response_content, context)
+        return self.get_result(RefundResponse, response_content)
+
+    async def void_transfer(self, transaction_id=False, context=None, **kwargs):
+        """Coroutine version of MimoRestClient.void_transfer."""
+        params = self.get_void_params(transaction_id, context, **kwargs)
+        response_content = await self.post_journaled("void", self.void_url, params)
+        return self.get_result(VoidResponse, response_content)
+
+    async def register(self, *args, **kwargs):
+        """Coroutine version of MimoRestClient.register.
+
+        User details may be given positionally or by name, exactly as for
+        MimoRestClient.register; any other keyword is posted as a parameter.
+        """
+        fields = dict((name, kwargs.pop(name)) for name in REGISTRATION_FIELDS
+                      if name in kwargs)
+        url = self.get_registration_url(*args, **fields)
+        return await self.POST_request(url, kwargs)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.aio.bulk: bulk transfers on the asyncio client
+======================================================
+
+Asyncio counterpart of mimolib.bulk.BulkTransfer: a fixed pool of worker
+tasks (mimolib.aio.pool.bounded_map) drains a bounded queue and results are
+yielded as they complete.
+
+'''
+from mimolib.aio.pool import bounded_map
+from mimolib.bulk import BulkReport, TransferResult, split_transfer
+from mimolib.compat import monotonic
+
+
+class AsyncBulkTransfer(object):
+    """AsyncBulkTransfer class used to run many transfers on an AsyncMimoRestClient.
+
+    Attributes:
+        client: AsyncMimoRestClient used for the transfers.
+        concurrency: Number of worker tasks.
+        backlog: Extra transfers queued ahead of the workers.
+        report: BulkReport of the current or last run.
+    """
+    def __init__(self, client, concurrency=100, backlog=None):
+        self.client = client
+        self.concurrency = concurrency
+        self.backlog = backlog is None and concurrency or backlog
+        self.report = BulkReport()
+
+    async def transfer_one(self, index, item):
+        """Performs operation of running one transfer and capturing its outcome."""
+        started = monotonic()
+        try:
+            amount, notes, recipient = split_transfer(item)
+            response = await self.client.transfer_funds(amount, notes, **recipient)
+        except Exception as e:
+            return TransferResult(index, item, error=e, latency=monotonic() - started)
+        return TransferResult(index, item, response=response, latency=monotonic() - started)
+
+    async def transfer_job(self, job):
+        return await self.transfer_one(*job)
+
+    async def run(self, transfers):
+        """Performs operation of running transfers and yielding results as they complete.
+            Args:
+                self: Current self class
+                transfers: Iterable of (amount, notes[, recipient kwargs]) tuples.
+
+            Returns:
+                Async generator of TransferResult in completion order
+        """
+        self.report = report = BulkReport()
+        report.start()
+        results = bounded_map(self.transfer_job, enumerate(transfers),
+                              self.concurrency, self.backlog)
+        try:
+            async for result in results:
+                report.add(result)
+                yield result
+        finally:
+            await results.aclose()
+            report.finish()
+
+    async def run_all(self, transfers):
+        """Performs operation of running transfers to completion.
+
+            Returns:
+                BulkReport of the run
+        """
+        async for _ in self.run(transfers):
+            pass
+        return self.report
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.aio.oauth: OAuth token management on the asyncio client
+================================================================
+
+Asyncio counterpart of mimolib.oauth.TokenManager for AsyncMimoRestClient.
+Renewals run as tasks on the event loop and concurrent callers share the
+single renewal in flight, so a pool of worker tasks noticing an expired
+token at once sends one token request between them.
+
+'''
+import asyncio
+import inspect
+import logging
+
+from mimolib import MimoContext
+from mimolib.oauth import TokenContext, TokenManager
+
+logger = logging.getLogger(__name__)
+
+
+async def resolve(result):
+    """Performs operation of awaiting result when it is awaitable, so sync and async callables both work."""
+    if inspect.isawaitable(result):
+        return await result
+    return result
+
+
+def consume_error(future):
+    # The renewal may have no awaiter left; reading its error avoids "never retrieved" warnings.
+    if not future.cancelled():
+        future.exception()
+
+
+class AsyncTokenContext(TokenContext):
+    """TokenContext for AsyncMimoRestClient; reading access_token never blocks the event loop.
+
+    It returns the cached token and, once that token is due, starts the
+    manager's renewal in the background. Await manager.get_token() or call
+    manager.start() so a valid token is in place before the first call.
+    """
+    __slots__ = ()
+
+    @property
+    def access_token(self):
+        return self.manager.peek_token()
+
+
+class AsyncTokenManager(TokenManager):
+    """AsyncTokenManager class used to keep a valid OAuth access token for an AsyncMimoRestClient.
+
+    Attributes:
+        client: AsyncMimoRestClient used to renew the token.
+        refresh_margin: Seconds before expiry at which the token is renewed.
+        default_ttl: Token lifetime in seconds when the server sends no expires_in.
+        fetch_token: Optional callable or coroutine function returning a fresh
+                     token response dict, used instead of the refresh_token grant.
+        renewal: Future of the renewal in flight, if any.
+    """
+    asynchronous = True
+
+    def __init__(self, client, **kwargs):
+        TokenManager.__init__(self, client, **kwargs)
+        self.renewal = None
+        self.task = None
+
+    async def authorize(self, code, **kwargs):
+        """Coroutine version of TokenManager.authorize."""
+        response_content = await resolve(self.client.request_oauth_token(
+            code, context=MimoContext(), **kwargs))
+        self.set_token(response_content)
+        return response_content
+
+    async def renew(self):
+        """Performs operation of requesting a new token; use start_renewal to share it."""
+        if self.fetch_token is not None:
+            response_content = await resolve(self.fetch_token())
+        elif self.refresh_token:
+            response_content = await resolve(self.client.refresh_oauth_token(
+                self.refresh_token, context=MimoContext()))
+        else:
+            raise ValueError('no refresh_token or fetch_token available to renew the access token')
+        self.set_token(response_content)
+        self.renewals += 1
+
+    def start_renewal(self):
+        """Performs operation of returning the renewal in flight, starting one if there is none."""
+        if self.renewal is None or self.renewal.done():
+            self.renewal = asyncio.ensure_future(self.renew())
+            self.renewal.add_done_callback(consume_error)
+        return self.renewal
+
+    async def get_token(self):
+        """Coroutine version of TokenManager.get_token.
+
+            While the token is still valid a due renewal runs in the background;
+            once it has expired every caller awaits the same renewal.
+        """
+        now = self.clock()
+        if self.access_token and now < self.refresh_at:
+            return self.access_token
+        if self.access_token and now < self.expires_at:
+            self.start_renewal()
+            return self.access_token
+        # Shielded, so a cancelled caller does not cancel the renewal others await.
+        await asyncio.shield(self.start_renewal())
+        return self.access_token
+
+    def peek_token(self):
+        """Performs operation of returning the cached token without waiting, starting a renewal when it is due."""
+        if self.access_token and self.clock() >= self.refresh_at:
+            self.start_renewal()
+        return self.access_token
+
+    def context(self, transaction_id=False):
+        """Performs operation of creating a per-caller context backed by this manager."""
+        return AsyncTokenContext(self, transaction_id)
+
+    def start(self):
+        """Performs operation of starting the background renewal task on the running loop."""
+        if self.task is not None and not self.task.done():
+            return
+        self.task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        """Performs operation of stopping the background renewal task."""
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def run(self):
+        """Background loop renewing the token at refresh_at, retrying every few seconds on errors."""
+        while True:
+            if not self.access_token and self.fetch_token is None:
+                await asyncio.sleep(1)
+                continue
+            delay = self.refresh_at - self.clock()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            try:
+                await asyncio.shield(self.start_renewal())
+            except Exception:
+                logger.warning("token refresh failed", exc_info=True)
+                await asyncio.sleep(min(5, max(self.expires_at - self.clock(), 1)))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.aio.pool: bounded worker tasks shared by the asyncio runners
+====================================================================
+
+Asyncio counterpart of mimolib.pool.bounded_map: a fixed pool of worker
+tasks drains a bounded queue fed from a lazily read iterable and results
+are yielded as they complete. AsyncBulkTransfer, AsyncReconciler and
+NotificationSender are built on it.
+
+'''
+import asyncio
+
+_DONE = object()
+
+
+async def bounded_map(function, items, concurrency, backlog=None):
+    """Performs operation of awaiting function on every item from a pool of worker tasks, yielding results as they complete.
+
+        Closing the generator cancels the workers.
+
+        Args:
+            function: Coroutine function of one item. It should capture its own
+                      errors in its result; an exception it raises ends the run.
+            items: Iterable of items, read lazily.
+            concurrency: Number of worker tasks.
+            backlog: Extra items queued ahead of the workers, concurrency by default.
+
+        Returns:
+            Async generator of function results in completion order
+    """
+    work = asyncio.Queue(backlog is None and concurrency or backlog)
+    results = asyncio.Queue()
+
+    async def stop_workers():
+        for _ in range(concurrency):
+            await work.put(_DONE)
+
+    async def feed():
+        try:
+            for item in items:
+                await work.put(item)
+        except Exception:
+            await stop_workers()
+            raise
+        await stop_workers()
+
+    async def worker():
+        try:
+            while True:
+                item = await work.get()
+                if item is _DONE:
+                    break
+                await results.put(await function(item))
+        finally:
+            await results.put(_DONE)
+
+    tasks = [asyncio.ensure_future(feed())]
+    tasks.extend(asyncio.ensure_future(worker()) for _ in range(concurrency))
+    try:
+        running = concurrency
+        while running:
+            result = await results.get()
+            if result is _DONE:
+                running -= 1
+                for task in tasks[1:]:
+                    # A worker stopping early means function raised.
+                    if task.done() and not task.cancelled() and task.exception() is not None:
+                        raise task.exception()
+                continue
+            yield result
+        tasks[0].result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
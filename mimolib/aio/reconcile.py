@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.aio.reconcile: concurrent reconciliation on the asyncio client
+======================================================================
+
+AsyncReconciler streams local transaction records, typically
+mimolib.reconcile.journal_records(journal), looks each one up at the
+gateway with bounded parallelism and yields a Mismatch as soon as one is
+found. Matching records are dropped immediately, so memory is bounded by
+the number of lookups in flight.
+
+'''
+from mimolib.aio.pool import bounded_map
+from mimolib.compat import urlencode, monotonic
+from mimolib.metrics import RunReport
+from mimolib.reconcile import Mismatch, ERROR, compare
+
+
+def http_lookup(client, path="/partner/transactions", context=None):
+    """Performs operation of building a lookup that GETs a transaction from the gateway.
+        Args:
+            client: AsyncMimoRestClient.
+            path: Path of the gateway's transaction lookup endpoint, relative to client_url.
+            context: Optional MimoContext holding the access token.
+
+        Returns:
+            Coroutine function of transaction_id returning the gateway record, None when
+            the gateway answers 404; any other non-2xx answer or error body raises, so it
+            is reported as an "error" mismatch instead of a match
+    """
+    url = client.client_url + path
+    client.add_route("lookup_url", url)
+
+    async def lookup(transaction_id):
+        query = urlencode({"access_token": client.get_credential("access_token", context),
+                           "transaction_id": transaction_id})
+        status, content = await client.GET_request(url + "?" + query, with_status=True)
+        if status == 404:
+            return None
+        if not 200 <= status < 300:
+            raise Exception('transaction lookup failed with HTTP %d: %r' % (status, content))
+        if not isinstance(content, dict) or "error" in content or "errors" in content:
+            raise Exception('transaction lookup returned an error: %r' % (content,))
+        return content
+
+    return lookup
+
+
+class ReconcileReport(RunReport):
+    """Counters of a reconciliation run, with the lookup latency histogram.
+
+    last_seq can be passed as since to journal_records so the next run only
+    checks newer records. It is a low-watermark: the seq of the last record
+    that, like every record before it, was conclusively checked. It never
+    passes a record still in flight and stops before the first lookup error,
+    so the next run checks that record again.
+    """
+
+    def __init__(self):
+        RunReport.__init__(self)
+        self.checked = 0
+        self.matched = 0
+        self.mismatched = 0
+        self.errors = 0
+        self.last_seq = 0
+        self.position = 0
+        self.concluded = {}
+        self.stalled = False
+
+    def advance(self, position, seq, conclusive):
+        """Performs operation of recording the record at position, in feed order, as checked and moving last_seq up."""
+        if self.stalled:
+            return
+        self.concluded[position] = (conclusive, seq)
+        while self.position in self.concluded:
+            conclusive, seq = self.concluded.pop(self.position)
+            if not conclusive:
+                self.stalled = True
+                self.concluded.clear()
+                return
+            self.last_seq = max(self.last_seq, seq or 0)
+            self.position += 1
+
+    @property
+    def total(self):
+        return self.checked
+
+    def as_dict(self):
+        row = RunReport.as_dict(self)
+        row.update({'checked': self.checked,
+                    'matched': self.matched,
+                    'mismatched': self.mismatched,
+                    'errors': self.errors,
+                    'last_seq': self.last_seq})
+        return row
+
+    def __repr__(self):
+        return ("ReconcileReport(checked=%(checked)d, matched=%(matched)d, "
+                "mismatched=%(mismatched)d, errors=%(errors)d)" % self.as_dict())
+
+
+class AsyncReconciler(object):
+    """AsyncReconciler class used to check local records against the gateway concurrently.
+
+    Attributes:
+        client: AsyncMimoRestClient used for the lookups.
+        lookup: Coroutine function of transaction_id returning the gateway
+                record dict, or None when the gateway does not know it;
+                http_lookup(client) by default.
+        concurrency: Number of lookups in flight.
+        backlog: Extra records queued ahead of the lookups.
+        report: ReconcileReport of the current or last run.
+    """
+    def __init__(self, client, lookup=None, concurrency=50, backlog=None):
+        self.client = client
+        self.lookup = lookup or http_lookup(client)
+        self.concurrency = concurrency
+        self.backlog = backlog is None and concurrency or backlog
+        self.report = ReconcileReport()
+
+    async def check_one(self, record):
+        """Performs operation of looking up one record and comparing it.
+
+            Returns:
+                Mismatch, None when the gateway agrees
+        """
+        try:
+            remote = await self.lookup(record.transaction_id)
+        except Exception as e:
+            return Mismatch(record.transaction_id, ERROR, record, e)
+        return compare(record, remote)
+
+    async def check_job(self, job):
+        position, record = job
+        started = monotonic()
+        mismatch = await self.check_one(record)
+        return position, record, mismatch, monotonic() - started
+
+    async def run(self, records):
+        """Performs operation of reconciling records and yielding mismatches as they are found.
+            Args:
+                self: Current self class
+                records: Iterable of mimolib.reconcile.LocalRecord.
+
+            Returns:
+                Async generator of Mismatch in completion order
+        """
+        self.report = report = ReconcileReport()
+        report.start()
+        results = bounded_map(self.check_job, enumerate(records), self.concurrency, self.backlog)
+        try:
+            async for position, record, mismatch, latency in results:
+                report.checked += 1
+                report.latency.add(latency)
+                report.advance(position, record.seq, mismatch is None or mismatch.reason != ERROR)
+                if mismatch is None:
+                    report.matched += 1
+                    continue
+                if mismatch.reason == ERROR:
+                    report.errors += 1
+                else:
+                    report.mismatched += 1
+                yield mismatch
+        finally:
+            await results.aclose()
+            report.finish()
+
+    async def run_all(self, records):
+        """Performs operation of reconciling records to completion.
+
+            Returns:
+                List of Mismatch
+        """
+        return [mismatch async for mismatch in self.run(records)]
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.aio.webhooks: asyncio receiver for gateway notifications
+================================================================
+
+WebhookReceiver accepts the gateway's signed transfer notifications over
+HTTP, so outcomes arrive as they happen instead of by polling. Each request
+is verified against the client_secret, deduplicated and acknowledged at
+once; the events are then handed to the registered handlers by a fixed
+pool of worker tasks draining a bounded queue. When the queue is full the
+receiver answers 503 with Retry-After so the gateway redelivers later.
+
+NotificationSender is a local stand-in for the gateway that signs and posts
+notifications, for tests and benchmarks.
+
+'''
+import asyncio
+import json
+from time import time
+
+try:
+    import aiohttp
+    from aiohttp import web
+except ImportError:
+    aiohttp = None
+
+from mimolib.aio.pool import bounded_map
+from mimolib.compat import monotonic
+from mimolib.webhooks import (SIGNATURE_HEADER, TIMESTAMP_HEADER, DedupeIndex, WebhookReport,
+                              parse_event, sign, verify)
+
+_DONE = object()
+
+
+class WebhookReceiver(object):
+    """WebhookReceiver class used to verify gateway notifications and dispatch them to handlers.
+
+    Attributes:
+        secret: client_secret the notifications are signed with.
+        path: URL path notifications are posted to.
+        workers: Number of worker tasks running handlers.
+        backlog: Events queued ahead of the workers before requests are refused with 503.
+        tolerance: Seconds a signed notification stays valid, None to accept any age.
+        dedupe: DedupeIndex of recently accepted event keys.
+        handlers: Dict of event type, or None for every type, to handler list.
+        on_error: Optional callable of (event, exception) for handlers that raise.
+        report: WebhookReport of the receiver.
+        url: Notification URL once start() has bound a port.
+    """
+    def __init__(self, client=None, secret=None, path="/mimo/notifications", workers=16,
+                 backlog=4096, dedupe_size=100000, tolerance=300, on_error=None):
+        if aiohttp is None:
+            raise ImportError('aiohttp is required for WebhookReceiver')
+        if secret is None and client is None:
+            raise ValueError('WebhookReceiver needs a client or a secret')
+        self.secret = secret is None and client.client_secret or secret
+        self.loads = client is not None and client.codec.loads or json.loads
+        self.path = path
+        self.workers = workers
+        self.backlog = backlog
+        self.tolerance = tolerance
+        self.dedupe = DedupeIndex(dedupe_size)
+        self.handlers = {}
+        self.on_error = on_error
+        self.report = WebhookReport()
+        self.queue = None
+        self.tasks = []
+        self.runner = None
+        self.url = None
+
+    def add_handler(self, handler, event_type=None):
+        """Performs operation of registering a handler.
+            Args:
+                self: Current self class
+                handler: Callable or coroutine function of WebhookEvent. Plain
+                         callables run on the event loop and must not block.
+                event_type: Only dispatch events of this type, e.g. "success"; every event when None.
+        """
+        self.handlers.setdefault(event_type, []).append(handler)
+        return handler
+
+    def on(self, event_type=None):
+        """Performs operation of registering the decorated function as a handler of event_type."""
+        def decorator(handler):
+            return self.add_handler(handler, event_type)
+        return decorator
+
+    def get_handlers(self, event_type):
+        handlers = self.handlers.get(event_type, [])
+        if event_type is not None:
+            handlers = handlers + self.handlers.get(None, [])
+        return handlers
+
+    async def handle(self, request):
+        """Performs operation of answering one notification request; an aiohttp request handler."""
+        report = self.report
+        report.received += 1
+        received = monotonic()
+        body = await request.read()
+        if not verify(self.secret, body, request.headers.get(SIGNATURE_HEADER),
+                      request.headers.get(TIMESTAMP_HEADER), self.tolerance):
+            report.unauthorized += 1
+            return web.Response(status=401, text="invalid signature")
+        try:
+            event = parse_event(self.loads(body), received)
+        except Exception:
+            report.invalid += 1
+            return web.Response(status=400, text="invalid notification")
+        if self.queue is None or self.queue.full():
+            report.overloaded += 1
+            return web.Response(status=503, headers={"Retry-After": "1"}, text="busy")
+        if not self.dedupe.add(event.key):
+            report.duplicates += 1
+            return web.Response(text="duplicate")
+        self.queue.put_nowait(event)
+        report.accepted += 1
+        return web.Response(text="ok")
+
+    async def dispatch(self, event):
+        """Performs operation of running every handler of an event.
+
+            Raises:
+                Exception: The first error a handler raised; later handlers still run.
+        """
+        error = None
+        for handler in self.get_handlers(event.type):
+            try:
+                result = handler(event)
+                if asyncio.iscoroutine(result) or isinstance(result, asyncio.Future):
+                    await result
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+
+    async def worker(self):
+        report = self.report
+        while True:
+            event = await self.queue.get()
+            try:
+                if event is _DONE:
+                    break
+                try:
+                    await self.dispatch(event)
+                except Exception as e:
+                    report.failed += 1
+                    self.dedupe.discard(event.key)
+                    if self.on_error is not None:
+                        self.on_error(event, e)
+                    continue
+                report.handled += 1
+                report.latency.add(monotonic() - event.received)
+            finally:
+                self.queue.task_done()
+
+    async def start_workers(self, app=None):
+        """Performs operation of starting the worker tasks; usable as an aiohttp on_startup hook."""
+        self.queue = asyncio.Queue(self.backlog)
+        self.tasks = [asyncio.ensure_future(self.worker()) for _ in range(self.workers)]
+
+    async def stop_workers(self, app=None):
+        """Performs operation of letting the workers finish the queued events and stopping them; usable as an aiohttp on_cleanup hook."""
+        queue, self.queue = self.queue, None
+        if queue is None:
+            return
+        for _ in self.tasks:
+            await queue.put(_DONE)
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def drain(self):
+        """Performs operation of waiting until every accepted event has been dispatched."""
+        if self.queue is not None:
+            await self.queue.join()
+
+    def setup(self, app):
+        """Performs operation of mounting the receiver on an existing aiohttp application."""
+        app.router.add_post(self.path, self.handle)
+        app.on_startup.append(self.start_workers)
+        app.on_cleanup.append(self.stop_workers)
+        return app
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Performs operation of serving the receiver on its own port.
+
+            Returns:
+                self, with url set to the notification URL
+        """
+        self.runner = web.AppRunner(self.setup(web.Application()), access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        bound_host, bound_port = self.runner.addresses[0][:2]
+        self.url = "http://%s:%d%s" % (bound_host, bound_port, self.path)
+        return self
+
+    async def stop(self):
+        """Performs operation of closing the listening socket and stopping the workers."""
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+
+class NotificationSender(object):
+    """NotificationSender class used as a local stand-in for the gateway's notification calls.
+
+    Attributes:
+        url: Notification URL of the receiver.
+        secret: client_secret to sign with.
+        concurrency: Number of notifications in flight in send_many.
+        retries: Redeliveries of a notification answered with 503.
+        statuses: Dict of final HTTP status to count, over every send.
+    """
+    def __init__(self, url, secret, concurrency=64, retries=5, dumps=json.dumps):
+        if aiohttp is None:
+            raise ImportError('aiohttp is required for NotificationSender')
+        self.url = url
+        self.secret = secret
+        self.concurrency = concurrency
+        self.retries = retries
+        self.dumps = dumps
+        self.statuses = {}
+        self.session = None
+
+    def get_session(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency))
+        return self.session
+
+    async def send(self, payload, timestamp=None, secret=None):
+        """Performs operation of signing and posting one notification, redelivering on 503.
+            Args:
+                self: Current self class
+                payload: Dict notification body.
+                timestamp: Unix time to sign with, the current time by default.
+                secret: Secret to sign with instead of self.secret, e.g. to test rejection.
+
+            Returns:
+                Integer HTTP status of the last delivery
+        """
+        body = self.dumps(payload).encode("utf-8")
+        attempt = 0
+        while True:
+            signed_at = int(timestamp is None and time() or timestamp)
+            headers = {"Content-Type": "application/json",
+                       SIGNATURE_HEADER: sign(secret or self.secret, body, signed_at),
+                       TIMESTAMP_HEADER: str(signed_at)}
+            async with self.get_session().post(self.url, data=body, headers=headers) as response:
+                await response.read()
+                status = response.status
+                retry_after = response.headers.get("Retry-After")
+            if status != 503 or attempt >= self.retries:
+                break
+            attempt += 1
+            await asyncio.sleep(min(float(retry_after or 0.05), 0.05 * 2 ** attempt))
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        return status
+
+    async def send_many(self, payloads):
+        """Performs operation of sending notifications with bounded concurrency.
+
+            Returns:
+                Dict of HTTP status to count for this batch
+        """
+        statuses = {}
+        async for status in bounded_map(self.deliver, payloads, self.concurrency):
+            statuses[status] = statuses.get(status, 0) + 1
+        return statuses
+
+    async def deliver(self, payload):
+        """Performs operation of sending one notification for send_many; connection errors give a None status."""
+        try:
+            return await self.send(payload)
+        except aiohttp.ClientError:
+            return None
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.bulk: bulk transfers for Mimo's API
+===========================================
+
+BulkTransfer runs many MimoRestClient.transfer_funds calls through a bounded
+thread pool (mimolib.pool.bounded_map) and streams back one TransferResult
+per transfer as soon as it completes. Requires concurrent.futures (the
+futures backport on Python 2).
+
+'''
+from mimolib.compat import monotonic
+from mimolib.metrics import RunReport
+from mimolib.pool import bounded_map
+
+
+def percentile(sorted_values, pct):
+    """Performs operation of picking the nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    rank = int(round(pct / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[rank]
+
+
+def split_transfer(item):
+    """Performs operation of unpacking a bulk item into (amount, notes, recipient kwargs).
+        Args:
+            item: Tuple of (amount, notes) or (amount, notes, recipient_kwargs).
+
+        Returns:
+            Tuple of amount, notes and a dict of recipient kwargs
+
+        Raises:
+            ValueError: If item does not have two or three elements.
+    """
+    if len(item) == 2:
+        amount, notes = item
+        return amount, notes, {}
+    if len(item) == 3:
+        amount, notes, recipient = item
+        return amount, notes, dict(recipient or {})
+    raise ValueError('bulk transfer item must be (amount, notes[, recipient kwargs])')
+
+
+class TransferResult(object):
+    """Outcome of one transfer in a bulk run.
+
+    Attributes:
+        index: Position of the transfer in the submitted iterable.
+        item: The (amount, notes, recipient kwargs) tuple that was submitted.
+        response: JSON response received from the server, None on error.
+        error: Exception raised by the transfer, None on success.
+        latency: Seconds spent in transfer_funds.
+        in_doubt: True when the transfer may or may not have been executed, e.g. its
+                  worker died before answering; re-send it with its idempotency_key.
+    """
+    __slots__ = ("index", "item", "response", "error", "latency", "in_doubt")
+
+    def __init__(self, index, item, response=None, error=None, latency=0.0, in_doubt=False):
+        self.index = index
+        self.item = item
+        self.response = response
+        self.error = error
+        self.latency = latency
+        self.in_doubt = in_doubt
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def idempotency_key(self):
+        """idempotency_key the transfer was submitted with, None when it was generated by transfer_funds."""
+        return split_transfer(self.item)[2].get("idempotency_key")
+
+    def __repr__(self):
+        return "TransferResult(index=%r, ok=%r, latency=%.4f)" % (self.index, self.ok, self.latency)
+
+
+class BulkReport(RunReport):
+    """Summary of a bulk run: counts, throughput, latency percentiles and failures.
+
+    Latencies are kept in a Histogram, so the report does not grow with the
+    number of transfers; only failed and unanswered transfers are listed.
+
+    Transfers in doubt are counted apart from the failed ones, and listed in
+    unanswered as (index, idempotency_key) pairs.
+    """
+
+    def __init__(self):
+        RunReport.__init__(self)
+        self.succeeded = 0
+        self.failed = 0
+        self.in_doubt = 0
+        self.failures = []
+        self.unanswered = []
+
+    def add(self, result):
+        """Performs operation of accounting one TransferResult."""
+        self.latency.add(result.latency)
+        if result.in_doubt:
+            self.in_doubt += 1
+            self.unanswered.append((result.index, result.idempotency_key))
+        elif result.ok:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+            self.failures.append((result.index, result.error))
+
+    @property
+    def total(self):
+        return self.succeeded + self.failed + self.in_doubt
+
+    def as_dict(self):
+        """Performs operation of summarising the report as a plain dict."""
+        row = RunReport.as_dict(self)
+        row.update({'succeeded': self.succeeded,
+                    'failed': self.failed,
+                    'in_doubt': self.in_doubt})
+        return row
+
+    def __repr__(self):
+        return ("BulkReport(total=%(total)d, succeeded=%(succeeded)d, failed=%(failed)d, "
+                "in_doubt=%(in_doubt)d, throughput=%(throughput).1f/s, p50=%(p50).4fs, "
+                "p95=%(p95).4fs, p99=%(p99).4fs)" % self.as_dict())
+
+
+class BulkTransfer(object):
+    """BulkTransfer class used to run many transfers with bounded concurrency.
+
+    Items are pulled lazily from the submitted iterable so that at most
+    concurrency + backlog transfers are pending at any time, which keeps
+    memory flat for very large payroll runs.
+
+    Attributes:
+        client: MimoRestClient used for the transfers.
+        concurrency: Number of worker threads.
+        backlog: Extra transfers queued ahead of the workers.
+        report: BulkReport of the current or last run.
+    """
+    def __init__(self, client, concurrency=10, backlog=None):
+        self.client = client
+        self.concurrency = concurrency
+        self.backlog = backlog is None and concurrency or backlog
+        self.report = BulkReport()
+
+    def transfer_one(self, index, item):
+        """Performs operation of running one transfer and capturing its outcome."""
+        started = monotonic()
+        try:
+            amount, notes, recipient = split_transfer(item)
+            response = self.client.transfer_funds(amount, notes, **recipient)
+        except Exception as e:
+            return TransferResult(index, item, error=e, latency=monotonic() - started)
+        return TransferResult(index, item, response=response, latency=monotonic() - started)
+
+    def transfer_job(self, job):
+        return self.transfer_one(*job)
+
+    def run(self, transfers):
+        """Performs operation of running transfers and yielding results as they complete.
+            Args:
+                self: Current self class
+                transfers: Iterable of (amount, notes[, recipient kwargs]) tuples.
+
+            Returns:
+                Generator of TransferResult in completion order
+        """
+        self.report = report = BulkReport()
+        report.start()
+        results = bounded_map(self.transfer_job, enumerate(transfers),
+                              self.concurrency, self.backlog)
+        try:
+            for result in results:
+                report.add(result)
+                yield result
+        finally:
+            results.close()
+            report.finish()
+
+    def run_all(self, transfers):
+        """Performs operation of running transfers to completion.
+
+            Returns:
+                BulkReport of the run
+        """
+        for _ in self.run(transfers):
+            pass
+        return self.report
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.cache: search_user lookup cache
+=======================================
+
+SearchCache remembers search_user answers keyed on the normalized search
+values, with LRU eviction, a TTL, short-lived caching of "not found" answers
+and hit/miss counters. Storage is pluggable: MemoryCache keeps entries in
+process, SQLiteCache keeps them in a file shared by several processes.
+
+'''
+import copy
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from time import time
+
+from mimolib.compat import iteritems, string_types, text_type, urlencode
+
+CASE_INSENSITIVE_FIELDS = ("username", "email")
+
+
+class MemoryCache(object):
+    """In-process LRU backend with per-entry expiry.
+
+    Values are copied in and out, so callers changing a response they got
+    back never change what later hits return.
+
+    Attributes:
+        maxsize: Maximum number of entries kept before the least recently used is evicted.
+    """
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Performs operation of reading an entry.
+
+            Returns:
+                Tuple of (found, value)
+        """
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at <= time():
+                return False, None
+            self.entries[key] = entry
+        return True, copy.deepcopy(value)
+
+    def set(self, key, value, ttl):
+        """Performs operation of storing an entry for ttl seconds."""
+        value = copy.deepcopy(value)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time() + ttl, value)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SQLiteCache(object):
+    """File backed LRU backend that several worker processes can share.
+
+    Values are stored as JSON. Each thread uses its own SQLite connection.
+
+    Attributes:
+        path: Path of the SQLite database file.
+        maxsize: Maximum number of entries kept before the least recently used are evicted.
+    """
+    def __init__(self, path, maxsize=100000):
+        self.path = path
+        self.maxsize = maxsize
+        self.local = threading.local()
+        self.writes = 0
+        self.connect().execute(
+            "CREATE TABLE IF NOT EXISTS search_cache ("
+            "key TEXT PRIMARY KEY, value TEXT, expires_at REAL, used_at REAL)")
+
+    def connect(self):
+        """Performs operation of returning this thread's connection to the cache file."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+
+    def get(self, key):
+        """Performs operation of reading an entry.
+
+            Returns:
+                Tuple of (found, value)
+        """
+        conn = self.connect()
+        now = time()
+        row = conn.execute("SELECT value, expires_at FROM search_cache WHERE key = ?",
+                           (key,)).fetchone()
+        if row is None or row[1] <= now:
+            return False, None
+        conn.execute("UPDATE search_cache SET used_at = ? WHERE key = ?", (now, key))
+        return True, json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        """Performs operation of storing an entry for ttl seconds."""
+        conn = self.connect()
+        now = time()
+        conn.execute("INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?, ?)",
+                     (key, json.dumps(value), now + ttl, now))
+        self.writes += 1
+        if self.writes % 1000 == 0:
+            self.evict()
+
+    def evict(self):
+        """Performs operation of dropping expired entries and trimming to maxsize."""
+        conn = self.connect()
+        conn.execute("DELETE FROM search_cache WHERE expires_at <= ?", (time(),))
+        conn.execute("DELETE FROM search_cache WHERE key IN (SELECT key FROM search_cache "
+                     "ORDER BY used_at DESC LIMIT -1 OFFSET ?)", (self.maxsize,))
+
+    def clear(self):
+        self.connect().execute("DELETE FROM search_cache")
+
+    def __len__(self):
+        return self.connect().execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+
+
+def is_not_found(content):
+    """Performs operation of deciding whether a search response body says the user does not exist."""
+    if isinstance(content, dict):
+        error = content.get("error") or content.get("message") or ""
+        return isinstance(error, string_types) and "not found" in error.lower()
+    return False
+
+
+def is_cacheable(content):
+    """Performs operation of deciding whether a search response is a real answer worth caching."""
+    return isinstance(content, dict) and bool(content) and \
+        not ("error" in content or "errors" in content)
+
+
+class SearchCache(object):
+    """SearchCache class used by MimoRestClient.search_user to skip repeated lookups.
+
+    Found users (2xx) are cached for ttl seconds, "not found" answers (404)
+    for negative_ttl seconds; other statuses, error and empty bodies are
+    never cached, nor are bodies that are not a JSON object or text.
+
+    Attributes:
+        backend: Storage with get(key) and set(key, value, ttl), MemoryCache by default.
+        ttl: Seconds a found user is cached.
+        negative_ttl: Seconds a "not found" answer is cached.
+        hits, misses, negative_hits: Lookup counters.
+    """
+    def __init__(self, backend=None, maxsize=10000, ttl=300, negative_ttl=30,
+                 not_found=is_not_found):
+        if backend is None:
+            backend = MemoryCache(maxsize)
+        self.backend = backend
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.not_found = not_found
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.lock = threading.Lock()
+
+    def make_key(self, params):
+        """Performs operation of normalizing search parameters into a cache key.
+
+        The access token is ignored, values are stripped and username/email
+        compared case-insensitively.
+        """
+        items = []
+        for k, v in iteritems(params):
+            if k == "access_token":
+                continue
+            if isinstance(v, string_types):
+                v = v.strip()
+                if k in CASE_INSENSITIVE_FIELDS:
+                    v = v.lower()
+            items.append((k, v))
+        return urlencode(sorted(items))
+
+    def get(self, params):
+        """Performs operation of looking up cached search results.
+
+            Returns:
+                Tuple of (found, content)
+        """
+        found, entry = self.backend.get(self.make_key(params))
+        with self.lock:
+            if not found:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            if entry[0]:
+                self.negative_hits += 1
+        return True, entry[1]
+
+    def set(self, params, content, status=None):
+        """Performs operation of caching a search response when it is a definite answer.
+            Args:
+                self: Current self class
+                params: Search parameters.
+                content: Parsed response content.
+                status: HTTP status of the response; without it only the body is judged.
+        """
+        if status is not None and status != 404 and not 200 <= status < 300:
+            return
+        if not isinstance(content, (dict, str, text_type)):
+            return
+        if status == 404 or self.not_found(content):
+            self.store(params, True, content, self.negative_ttl)
+        elif is_cacheable(content):
+            self.store(params, False, content, self.ttl)
+
+    def store(self, params, negative, content, ttl):
+        try:
+            self.backend.set(self.make_key(params), (negative, content), ttl)
+        except (TypeError, ValueError):
+            # A body the backend cannot serialise is left uncached rather than failing the search.
+            pass
+
+    def stats(self):
+        """Performs operation of reporting the hit/miss counters."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'negative_hits': self.negative_hits,
+                    'hit_ratio': lookups and float(self.hits) / lookups or 0.0}
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.coalesce: micro-batching of small independent calls
+===========================================================
+
+RequestCoalescer collects calls submitted by many threads into micro-batches
+of up to max_batch calls or max_wait seconds, whichever comes first, and
+fans each batch out over the client's keep-alive connection pool. Identical
+search_user lookups in the same batch are sent once and the answer is shared
+by all their callers. Every caller gets its own concurrent.futures.Future.
+Requires concurrent.futures (the futures backport on Python 2).
+
+'''
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from mimolib.pool import drain_batches
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+# Read-only calls whose identical requests may share one answer.
+COALESCED_CALLS = ("search_user",)
+
+_CLOSE = object()
+
+
+class RequestCoalescer(object):
+    """RequestCoalescer class used to group chatty calls into concurrent micro-batches.
+
+    Attributes:
+        client: MimoRestClient making the calls; it should pool at least
+                max_batch connections (pool_maxsize).
+        max_batch: Maximum calls in one batch, also the number of calls in flight.
+        max_wait: Seconds a batch waits for more calls after its first one.
+        coalesce: Names of the client methods whose identical calls are merged.
+        batches: Number of batches dispatched so far.
+        calls: Number of calls submitted so far.
+        merged: Number of calls answered by another identical call.
+    """
+    def __init__(self, client, max_batch=32, max_wait=0.005, coalesce=COALESCED_CALLS):
+        self.client = client
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.coalesce = coalesce
+        self.batches = 0
+        self.calls = 0
+        self.merged = 0
+        self.queue = Queue()
+        self.executor = ThreadPoolExecutor(max_workers=max_batch)
+        self.dispatcher = threading.Thread(target=self.run, name="mimo-coalescer")
+        self.dispatcher.daemon = True
+        self.dispatcher.start()
+
+    def submit(self, name, *args, **kwargs):
+        """Performs operation of queueing a call of client method name for the next batch.
+
+            Returns:
+                Future of the method's return value
+        """
+        future = Future()
+        self.queue.put((name, args, kwargs, future))
+        return future
+
+    def search_user(self, context=None, **kwargs):
+        """Performs operation of queueing a MimoRestClient.search_user call; returns a Future."""
+        return self.submit("search_user", context=context, **kwargs)
+
+    def void_transfer(self, transaction_id=False, context=None, **kwargs):
+        """Performs operation of queueing a MimoRestClient.void_transfer call; returns a Future."""
+        return self.submit("void_transfer", transaction_id, context=context, **kwargs)
+
+    def get_key(self, name, args, kwargs):
+        """Performs operation of keying a call for merging, None when it must be sent on its own."""
+        if name not in self.coalesce:
+            return None
+        context = kwargs.get("context")
+        items = [(key, value) for key, value in sorted(kwargs.items()) if key != "context"]
+        key = (name, args, tuple(items),
+               context is not None and context.access_token or None)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def run(self):
+        """Performs operation of collecting and dispatching batches until closed."""
+        for batch in drain_batches(self.queue, self.max_batch, self.max_wait, _CLOSE):
+            self.dispatch(batch)
+
+    def dispatch(self, batch):
+        """Performs operation of merging identical calls of a batch and starting them concurrently."""
+        groups = OrderedDict()
+        for name, args, kwargs, future in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            key = self.get_key(name, args, kwargs)
+            if key is None:
+                key = id(future)
+            elif key in groups:
+                groups[key][3].append(future)
+                self.merged += 1
+                continue
+            groups[key] = (name, args, kwargs, [future])
+        self.batches += 1
+        self.calls += len(batch)
+        for name, args, kwargs, futures in groups.values():
+            self.executor.submit(self.call, name, args, kwargs, futures)
+
+    def call(self, name, args, kwargs, futures):
+        try:
+            result = getattr(self.client, name)(*args, **kwargs)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+        else:
+            for future in futures:
+                future.set_result(result)
+
+    def close(self):
+        """Performs operation of dispatching queued calls and waiting for them to finish."""
+        if self.dispatcher.is_alive():
+            self.queue.put(_CLOSE)
+            self.dispatcher.join()
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.codec: JSON encoding and decoding for Mimo's API
+========================================================
+
+get_codec picks the fastest JSON library that is installed, orjson, then
+ujson, then the standard json module, behind one dumps/loads interface.
+
+'''
+from mimolib.compat import json_dumps
+
+CODEC_PREFERENCE = ("orjson", "ujson", "json")
+
+
+class JSONCodec(object):
+    """JSON codec used by MimoRestClient for request bodies and responses.
+
+    Attributes:
+        name: Name of the underlying library.
+    """
+    name = "json"
+
+    def __init__(self, encoding="utf-8"):
+        import json
+        self.encoding = encoding
+        self.loads = json.loads
+
+    def dumps(self, obj):
+        return json_dumps(obj, encoding=self.encoding)
+
+    def loads_buffer(self, view):
+        """Performs operation of decoding JSON from a memoryview of a response buffer."""
+        return self.loads(view.tobytes())
+
+
+class OrjsonCodec(JSONCodec):
+    name = "orjson"
+
+    def __init__(self, encoding="utf-8"):
+        import orjson
+        JSONCodec.__init__(self, encoding)
+        self.dumps = orjson.dumps
+        self.loads = orjson.loads
+        # orjson reads memoryviews directly, without copying the buffer.
+        self.loads_buffer = orjson.loads
+
+
+class UjsonCodec(JSONCodec):
+    name = "ujson"
+
+    def __init__(self, encoding="utf-8"):
+        import ujson
+        JSONCodec.__init__(self, encoding)
+        self.dumps = ujson.dumps
+        self.loads = ujson.loads
+
+
+CODECS = {"orjson": OrjsonCodec, "ujson": UjsonCodec, "json": JSONCodec}
+
+
+def get_codec(name=None, encoding="utf-8"):
+    """Performs operation of creating a JSON codec.
+        Args:
+            name: "orjson", "ujson" or "json"; None picks the first one installed.
+            encoding: Encoding used by the standard json module on Python 2.
+
+        Returns:
+            JSONCodec instance
+
+        Raises:
+            ImportError: If the named library is not installed.
+            ValueError: If name is not a known codec.
+    """
+    if name is not None:
+        if name not in CODECS:
+            raise ValueError('unknown JSON codec %r, expected one of %s'
+                             % (name, ", ".join(CODEC_PREFERENCE)))
+        return CODECS[name](encoding)
+    for candidate in CODEC_PREFERENCE:
+        try:
+            return CODECS[candidate](encoding)
+        except ImportError:
+            continue
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.compat
+==============
+
+Python 2 / Python 3 compatibility helpers used across mimolib.
+
+'''
+import sys
+
+PY2 = sys.version_info[0] == 2
+
+if PY2:
+    from urllib import urlencode, quote_plus
+    string_types = basestring
+    text_type = unicode
+else:
+    from urllib.parse import urlencode, quote_plus
+    string_types = (str, bytes)
+    text_type = str
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+
+def iteritems(d):
+    """Performs operation of iterating over the items of a dict on any Python version."""
+    if PY2:
+        return d.iteritems()
+    return iter(d.items())
+
+
+def json_dumps(obj, encoding="utf-8"):
+    """Performs operation of serializing obj to JSON honouring encoding on Python 2."""
+    import json
+    if PY2:
+        return json.dumps(obj, encoding=encoding)
+    return json.dumps(obj)
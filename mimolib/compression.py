@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.compression: payload compression and response buffers for Mimo's API
+=============================================================================
+
+compress() gzips or deflates request bodies for MimoRestClient's
+compress_requests option. BufferPool lends out reusable bytearrays that
+streamed responses are read into, so large lookup results are decoded
+from one long-lived buffer instead of a fresh bytes object per read.
+
+'''
+import threading
+import zlib
+
+ENCODINGS = ("gzip", "deflate")
+
+
+def compress(data, encoding="gzip", level=6):
+    """Performs operation of compressing a request body.
+        Args:
+            data: Bytes to compress.
+            encoding: "gzip" or "deflate" (the zlib format, as HTTP defines it).
+            level: zlib compression level, 1 (fastest) to 9 (smallest).
+
+        Returns:
+            Compressed bytes
+
+        Raises:
+            ValueError: If encoding is not supported.
+    """
+    if encoding == "gzip":
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+    if encoding == "deflate":
+        return zlib.compress(data, level)
+    raise ValueError('unsupported content encoding %r, expected one of %s'
+                     % (encoding, ", ".join(ENCODINGS)))
+
+
+class BufferPool(object):
+    """Pool of reusable bytearrays, safe to share between threads and asyncio tasks.
+
+    Attributes:
+        chunk_size: Bytes requested from the socket per read.
+        max_size: Buffers grown past this size are dropped instead of returned
+                  to the pool, so one huge response does not pin its memory.
+        max_buffers: Buffers kept in the pool.
+    """
+    def __init__(self, chunk_size=65536, max_size=4 * 1024 * 1024, max_buffers=16):
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+        self.max_buffers = max_buffers
+        self.buffers = []
+        self.lock = threading.Lock()
+
+    def get(self):
+        """Performs operation of borrowing a buffer; its length is its capacity, not its content."""
+        with self.lock:
+            if self.buffers:
+                return self.buffers.pop()
+        return bytearray(self.chunk_size)
+
+    def put(self, buffer):
+        """Performs operation of returning a buffer to the pool."""
+        if len(buffer) <= self.max_size:
+            with self.lock:
+                if len(self.buffers) < self.max_buffers:
+                    self.buffers.append(buffer)
+
+    def reserve(self, buffer, size):
+        """Performs operation of growing buffer so that a chunk fits after its first size bytes."""
+        if len(buffer) - size < self.chunk_size:
+            buffer.extend(bytearray(max(self.chunk_size, size)))
+
+    def read_into(self, buffer, stream):
+        """Performs operation of reading a file-like stream to its end into buffer.
+
+            Returns:
+                Number of bytes read, the content being buffer[:size]
+        """
+        size = 0
+        while True:
+            self.reserve(buffer, size)
+            view = memoryview(buffer)
+            read = stream.readinto(view[size:])
+            del view
+            if not read:
+                return size
+            size += read
+
+    def write(self, buffer, size, chunk):
+        """Performs operation of appending chunk after the first size bytes of buffer.
+
+            Returns:
+                New content size
+        """
+        self.reserve(buffer, size + len(chunk) - self.chunk_size)
+        buffer[size:size + len(chunk)] = chunk
+        return size + len(chunk)
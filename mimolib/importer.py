@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.importer: streaming bulk user registration for Mimo's API
+=================================================================
+
+RegistrationImporter reads sign-ups from a CSV or JSONL file one row at a
+time, validates them locally, maps columns onto MimoRestClient.register
+fields and registers them through a bounded thread pool
+(mimolib.pool.bounded_map). Results are
+appended to an output JSONL file as they complete and progress is saved to
+a checkpoint file, so memory stays flat for any file size and an interrupted
+import resumes where it stopped. Requires concurrent.futures (the futures
+backport on Python 2).
+
+'''
+import csv
+import io
+import json
+import os
+import re
+
+from mimolib.compat import PY2, string_types, text_type, monotonic
+from mimolib.metrics import RunReport
+from mimolib.pool import bounded_map
+
+REGISTRATION_FIELDS = ("account_type", "username", "pin", "email", "password",
+                       "challenge_question", "challenge_answer", "terms_and_conditions",
+                       "address", "address_2", "dob", "city", "state", "zipcode", "country",
+                       "address_type", "first_name", "middle_name", "surname", "gender",
+                       "about", "website", "facebook", "twitter", "company_name",
+                       "company_id_number", "rc_incorporation_year", "mobile_phone")
+
+# Required for every account, as listed in MimoRestClient.register.
+REQUIRED_FIELDS = ("account_type", "username", "pin", "email", "password", "dob",
+                   "challenge_question", "challenge_answer", "terms_and_conditions",
+                   "mobile_phone")
+
+# Additionally required for merchant accounts.
+MERCHANT_FIELDS = ("company_name", "company_id_number", "rc_incorporation_year")
+
+# The gateway calls zipcode "zip"; accept either column name.
+DEFAULT_COLUMNS = {"zip": "zipcode"}
+
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+DOB_RE = re.compile(r"^(0[1-9]|1[0-2])/(0[1-9]|[12][0-9]|3[01])/[0-9]{4}$")
+
+
+class RegistrationError(ValueError):
+    """Raised for rows that fail local validation; they are never sent to the gateway."""
+
+
+class InvalidRow(object):
+    """Placeholder read_rows yields for a line it cannot decode, so the rows after it keep their index.
+
+    Attributes:
+        line: Text of the line.
+        error: Error raised while decoding it.
+    """
+    __slots__ = ("line", "error")
+
+    def __init__(self, line, error):
+        self.line = line
+        self.error = error
+
+    def __repr__(self):
+        return "InvalidRow(line=%r, error=%r)" % (self.line, self.error)
+
+
+def read_rows(path, format=None):
+    """Performs operation of lazily reading rows from a CSV or JSONL file.
+        Args:
+            path: File to read.
+            format: "csv" or "jsonl", guessed from the file extension when None.
+
+        Returns:
+            Generator of dicts, one per row; a JSONL line that is not valid JSON
+            gives an InvalidRow
+    """
+    if format is None:
+        format = path.lower().endswith((".jsonl", ".json", ".ndjson")) and "jsonl" or "csv"
+    if format == "jsonl":
+        with io.open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        row = json.loads(line)
+                    except ValueError as e:
+                        row = InvalidRow(line, e)
+                    yield row
+    elif PY2:
+        with open(path, "rb") as f:
+            for row in csv.DictReader(f):
+                yield dict((key, value.decode("utf-8")) for key, value in row.items()
+                           if key is not None and value is not None)
+    else:
+        with io.open(path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                yield row
+
+
+def check_row(row):
+    """Performs operation of checking that a source row can be mapped at all.
+
+        Returns:
+            Error message, None for a dict row
+    """
+    if isinstance(row, InvalidRow):
+        return "invalid row: %s" % (row.error,)
+    if not isinstance(row, dict):
+        return "invalid row: expected an object, got %s" % type(row).__name__
+    return None
+
+
+def map_row(row, columns=None):
+    """Performs operation of turning a source row into register keyword arguments.
+        Args:
+            row: Dict read from the source file.
+            columns: Dict mapping source column names to register field names;
+                     columns already named after a field need no entry.
+
+        Returns:
+            Dict with every register field, missing ones set to an empty string
+    """
+    mapping = dict(DEFAULT_COLUMNS)
+    mapping.update(columns or {})
+    fields = dict.fromkeys(REGISTRATION_FIELDS, "")
+    for key, value in row.items():
+        name = mapping.get(key, key)
+        if name in fields and value is not None:
+            if not isinstance(value, string_types):
+                value = text_type(value)
+            fields[name] = value.strip()
+    return fields
+
+
+def validate_registration(fields, required=REQUIRED_FIELDS):
+    """Performs operation of checking register fields locally.
+
+        Returns:
+            List of error messages, empty when the fields are valid
+    """
+    errors = ["%s is required" % name for name in required if not fields.get(name)]
+    if fields.get("account_type") == "merchant":
+        errors.extend("%s is required for merchant accounts" % name
+                      for name in MERCHANT_FIELDS if not fields.get(name))
+    elif fields.get("account_type") and fields["account_type"] != "personal":
+        errors.append("account_type must be 'personal' or 'merchant'")
+    if fields.get("email") and not EMAIL_RE.match(fields["email"]):
+        errors.append("email is not a valid address")
+    if fields.get("dob") and not DOB_RE.match(fields["dob"]):
+        errors.append("dob must be in MM/dd/yyyy format")
+    if fields.get("terms_and_conditions") and fields["terms_and_conditions"] not in ("0", "1"):
+        errors.append("terms_and_conditions must be 0 or 1")
+    if fields.get("pin") and not fields["pin"].isdigit():
+        errors.append("pin must be numeric")
+    if fields.get("address_type") and fields["address_type"] not in ("home", "business", "mailing"):
+        errors.append("address_type must be 'home', 'business' or 'mailing'")
+    return errors
+
+
+class ImportResult(object):
+    """Outcome of one row of an import.
+
+    Attributes:
+        index: Zero-based position of the row in the source file.
+        username: Username of the row, for reporting.
+        response: JSON response received from the server, None on error.
+        error: Exception raised by validation or registration, None on success.
+        latency: Seconds spent in register, 0 for invalid rows.
+    """
+    __slots__ = ("index", "username", "response", "error", "latency")
+
+    def __init__(self, index, username, response=None, error=None, latency=0.0):
+        self.index = index
+        self.username = username
+        self.response = response
+        self.error = error
+        self.latency = latency
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def as_dict(self):
+        record = {"row": self.index, "username": self.username, "ok": self.ok}
+        if self.ok:
+            record["response"] = self.response
+        else:
+            record["error"] = str(self.error)
+        return record
+
+    def __repr__(self):
+        return "ImportResult(index=%r, username=%r, ok=%r)" % (self.index, self.username, self.ok)
+
+
+class ImportReport(RunReport):
+    """Summary of an import; keeps counters and a latency histogram only, so its size is fixed."""
+
+    def __init__(self):
+        RunReport.__init__(self)
+        self.succeeded = 0
+        self.failed = 0
+        self.invalid = 0
+        self.skipped = 0
+
+    def add(self, result):
+        """Performs operation of accounting one ImportResult."""
+        if result.ok:
+            self.succeeded += 1
+        elif isinstance(result.error, RegistrationError):
+            self.invalid += 1
+        else:
+            self.failed += 1
+        if result.latency:
+            self.latency.add(result.latency)
+
+    @property
+    def total(self):
+        return self.succeeded + self.failed + self.invalid
+
+    def as_dict(self):
+        """Performs operation of summarising the report as a plain dict."""
+        row = RunReport.as_dict(self)
+        row.update({'succeeded': self.succeeded,
+                    'failed': self.failed,
+                    'invalid': self.invalid,
+                    'skipped': self.skipped})
+        return row
+
+    def __repr__(self):
+        return ("ImportReport(total=%(total)d, succeeded=%(succeeded)d, failed=%(failed)d, "
+                "invalid=%(invalid)d, skipped=%(skipped)d, throughput=%(throughput).1f/s)"
+                % self.as_dict())
+
+
+class Checkpoint(object):
+    """Progress of an import, saved atomically to a small JSON file.
+
+    Rows finish out of order, so progress is kept as a position below which
+    every row is done, plus the few rows above it that are already done. The
+    latter never exceed the worker pool window.
+
+    Attributes:
+        path: File the checkpoint is saved to, None to keep it in memory only.
+        position: Index of the first row not known to be done.
+        done: Set of finished row indices at or above position.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.position = 0
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.position = state.get("position", 0)
+            self.done = set(state.get("done", ()))
+
+    def is_done(self, index):
+        return index < self.position or index in self.done
+
+    def mark(self, index):
+        """Performs operation of recording row index as finished."""
+        self.done.add(index)
+        while self.position in self.done:
+            self.done.discard(self.position)
+            self.position += 1
+
+    def save(self):
+        """Performs operation of writing the checkpoint file atomically."""
+        if not self.path:
+            return
+        tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+        with open(tmp_path, "w") as f:
+            json.dump({"position": self.position, "done": sorted(self.done)}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, self.path)
+
+
+class RegistrationImporter(object):
+    """RegistrationImporter class used to register users from a CSV or JSONL file.
+
+    At most concurrency + backlog rows are in flight at any time. Every
+    finished row is appended to the output file before the checkpoint is
+    advanced past it, so after a crash rows are never lost; a row that
+    finished after the last checkpoint save may be registered a second time,
+    which the gateway rejects as a duplicate username.
+
+    Attributes:
+        client: MimoRestClient used for the registrations.
+        columns: Dict mapping source column names to register field names.
+        concurrency: Number of worker threads.
+        backlog: Extra rows queued ahead of the workers.
+        required: Field names every row must fill in.
+        checkpoint_every: Rows finished between two checkpoint saves.
+        report: ImportReport of the current or last run.
+    """
+    def __init__(self, client, columns=None, concurrency=10, backlog=None,
+                 required=REQUIRED_FIELDS, checkpoint_every=100):
+        self.client = client
+        self.columns = columns
+        self.concurrency = concurrency
+        self.backlog = backlog is None and concurrency or backlog
+        self.required = required
+        self.checkpoint_every = checkpoint_every
+        self.report = ImportReport()
+
+    def register_one(self, index, fields):
+        """Performs operation of registering one mapped row and capturing its outcome."""
+        started = monotonic()
+        try:
+            response = self.client.register(**fields)
+        except Exception as e:
+            return ImportResult(index, fields["username"], error=e, latency=monotonic() - started)
+        return ImportResult(index, fields["username"], response=response,
+                            latency=monotonic() - started)
+
+    def import_one(self, job):
+        """Performs operation of registering one prepared row, or reporting why it is invalid."""
+        index, fields, errors = job
+        if errors:
+            return ImportResult(index, fields["username"], error=RegistrationError("; ".join(errors)))
+        return self.register_one(index, fields)
+
+    def prepare(self, rows, checkpoint):
+        """Performs operation of skipping finished rows, mapping and validating the others.
+
+            Returns:
+                Generator of (index, fields, errors) tuples
+        """
+        for index, row in enumerate(rows):
+            if checkpoint.is_done(index):
+                self.report.skipped += 1
+                continue
+            error = check_row(row)
+            if error is not None:
+                yield index, {"username": ""}, [error]
+                continue
+            fields = map_row(row, self.columns)
+            yield index, fields, validate_registration(fields, self.required)
+
+    def run(self, source, output, checkpoint=None, format=None):
+        """Performs operation of importing source and yielding results as they complete.
+            Args:
+                self: Current self class
+                source: Path of a CSV or JSONL file, or an iterable of row dicts.
+                output: Path of the JSONL file results are appended to.
+                checkpoint: Path of the checkpoint file; when it exists the import resumes from it.
+                format: "csv" or "jsonl", guessed from the source extension when None.
+
+            Returns:
+                Generator of ImportResult in completion order
+        """
+        self.report = report = ImportReport()
+        report.start()
+        state = Checkpoint(checkpoint)
+        rows = isinstance(source, string_types) and read_rows(source, format) or source
+        unsaved = 0
+        out = io.open(output, (state.position or state.done) and "a" or "w", encoding="utf-8")
+        results = bounded_map(self.import_one, self.prepare(rows, state),
+                              self.concurrency, self.backlog)
+        try:
+            for result in results:
+                out.write(text_type(json.dumps(result.as_dict(), default=str)) + u"\n")
+                out.flush()
+                report.add(result)
+                state.mark(result.index)
+                unsaved += 1
+                if unsaved >= self.checkpoint_every:
+                    os.fsync(out.fileno())
+                    state.save()
+                    unsaved = 0
+                yield result
+        finally:
+            # Rows still running finish before the output is closed, but are not written.
+            results.close()
+            out.flush()
+            os.fsync(out.fileno())
+            out.close()
+            state.save()
+            report.finish()
+
+    def run_all(self, source, output, checkpoint=None, format=None):
+        """Performs operation of importing source to completion.
+
+            Returns:
+                ImportReport of the run
+        """
+        for _ in self.run(source, output, checkpoint, format):
+            pass
+        return self.report
@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.journal: write-ahead journal of money-moving calls
+==========================================================
+
+With MimoRestClient(journal=Journal(path)), every transfer, refund and void
+is recorded durably before it is sent and its outcome is recorded after the
+gateway answers. After a crash, Journal.in_doubt() lists the calls whose
+outcome is unknown, with the idempotency key and parameters needed to
+re-check or re-send them.
+
+Calls are grouped by idempotency key: re-sending a call with the same key
+adds a new intent, each outcome is linked to the intent it answers, and a
+key is settled once any of its calls succeeded.
+
+The journal is an append-only SQLite table in WAL mode. A single writer
+thread commits records in groups, so one fsync covers every call that
+arrived during the same few milliseconds. Requires concurrent.futures (the
+futures backport on Python 2).
+
+'''
+import json
+import sqlite3
+import threading
+
+from concurrent.futures import Future
+from time import time
+
+from mimolib.pool import drain_batches
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+INTENT = "intent"
+OUTCOME = "outcome"
+
+PENDING = "pending"
+OK = "ok"
+ERROR = "error"
+NOT_SENT = "not_sent"
+
+# Parameters never written to the journal.
+SECRET_PARAMS = ("access_token", "client_secret", "password", "pin")
+
+_CLOSE = object()
+
+
+class JournalEntry(object):
+    """One journal record.
+
+    Attributes:
+        seq: Position of the record in the journal.
+        key: Idempotency key shared by the intent and outcome of a call.
+        kind: "transfer", "refund" or "void".
+        phase: "intent" or "outcome".
+        status: "pending" for intents; "ok", "error" or "not_sent" for outcomes.
+        transaction_id: Transaction id returned by the gateway, if any.
+        data: Request parameters for intents, response content for outcomes.
+        error: Error message of a failed call, None otherwise.
+        created_at: Unix time the record was written.
+    """
+    __slots__ = ("seq", "key", "kind", "phase", "status", "transaction_id", "data",
+                 "error", "created_at")
+
+    def __init__(self, seq, key, kind, phase, status, transaction_id, data, error, created_at):
+        self.seq = seq
+        self.key = key
+        self.kind = kind
+        self.phase = phase
+        self.status = status
+        self.transaction_id = transaction_id
+        self.data = data
+        self.error = error
+        self.created_at = created_at
+
+    @classmethod
+    def from_row(cls, row):
+        seq, key, kind, phase, status, transaction_id, data, error, created_at = row
+        return cls(seq, key, kind, phase, status, transaction_id,
+                   data and json.loads(data) or None, error, created_at)
+
+    def __repr__(self):
+        return ("JournalEntry(key=%r, kind=%r, phase=%r, status=%r, transaction_id=%r)"
+                % (self.key, self.kind, self.phase, self.status, self.transaction_id))
+
+
+class Journal(object):
+    """Journal class recording money-moving calls in a durable, append-only log.
+
+    Thread-safe; one journal may be shared by several clients of the same
+    process. begin() and finish() return a concurrent.futures.Future that
+    completes once the record is on disk.
+
+    Attributes:
+        path: Path of the SQLite journal file.
+        batch_size: Maximum records committed by one fsync.
+        max_wait: Seconds the writer waits for more records before committing a batch.
+        sync: Set to False to skip the fsync, trading durability for speed.
+        batches: Number of commits made so far.
+    """
+    def __init__(self, path, batch_size=512, max_wait=0.002, sync=True):
+        self.path = path
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.sync = sync
+        self.batches = 0
+        self.local = threading.local()
+        self.queue = Queue()
+        self.conn = self.open()
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS journal ("
+            "seq INTEGER PRIMARY KEY, key TEXT, kind TEXT, phase TEXT, status TEXT, "
+            "transaction_id TEXT, data TEXT, error TEXT, created_at REAL, intent_seq INTEGER)")
+        self.migrate()
+        self.conn.execute("CREATE INDEX IF NOT EXISTS journal_key ON journal (key, phase)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS journal_intent ON journal (intent_seq)")
+        self.writer = threading.Thread(target=self.run, name="mimo-journal")
+        self.writer.daemon = True
+        self.writer.start()
+
+    def open(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=%s" % (self.sync and "FULL" or "OFF"))
+        return conn
+
+    def migrate(self):
+        """Performs operation of adding intent_seq to journals written before it existed,
+            linking each outcome to the latest earlier intent of its key.
+        """
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(journal)")]
+        if "intent_seq" in columns:
+            return
+        self.conn.execute("ALTER TABLE journal ADD COLUMN intent_seq INTEGER")
+        self.conn.execute(
+            "UPDATE journal SET intent_seq = (SELECT MAX(i.seq) FROM journal i "
+            "WHERE i.key = journal.key AND i.phase = 'intent' AND i.seq < journal.seq) "
+            "WHERE phase = 'outcome'")
+
+    def connect(self):
+        """Performs operation of returning this thread's read connection to the journal file."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = self.open()
+        return conn
+
+    def append(self, record):
+        """Performs operation of queueing one record for the next group commit; None only waits for it.
+
+            Returns:
+                Future completing when the record is durable
+        """
+        future = Future()
+        self.queue.put((record, future))
+        return future
+
+    def begin(self, key, kind, params):
+        """Performs operation of recording that a call is about to be sent.
+            Args:
+                self: Current self class
+                key: Idempotency key of the call.
+                kind: "transfer", "refund" or "void".
+                params: Request parameters; credentials are left out.
+
+            Returns:
+                Future completing when the intent is durable
+        """
+        data = dict((name, value) for name, value in params.items() if name not in SECRET_PARAMS)
+        return self.append((key, kind, INTENT, PENDING, None,
+                            json.dumps(data, default=str), None, time()))
+
+    def finish(self, key, kind, content=None, error=None, status=None, sent=True):
+        """Performs operation of recording the outcome of a call.
+
+            The call is only recorded "ok" when it got a 2xx JSON object without
+            an error. Any other answer is an "error" and stays in doubt, since the
+            gateway may have executed it. A call refused before anything was sent
+            is recorded "not_sent", a definite outcome. The outcome is linked to
+            the latest intent of the key that has none yet.
+
+            Args:
+                self: Current self class
+                key: Idempotency key given to begin.
+                kind: "transfer", "refund" or "void".
+                content: Parsed response content.
+                error: Exception raised by the call, if any.
+                status: HTTP status of the response, if any.
+                sent: False when the call failed before any request was sent.
+
+            Returns:
+                Future completing when the outcome is durable
+        """
+        transaction_id = None
+        body_error = 'unexpected response body'
+        if isinstance(content, dict):
+            transaction_id = content.get("transaction_id")
+            body_error = content.get("error") or content.get("errors")
+        if error is None and status is not None and not 200 <= status < 300:
+            error = 'HTTP %d' % status + (body_error and ': %s' % (body_error,) or '')
+        elif error is None:
+            error = body_error
+        if not sent:
+            outcome = NOT_SENT
+        else:
+            outcome = error is None and OK or ERROR
+        return self.append((key, kind, OUTCOME, outcome,
+                            transaction_id is not None and str(transaction_id) or None,
+                            json.dumps(content, default=str),
+                            error is not None and str(error) or None, time()))
+
+    def run(self):
+        """Performs operation of committing queued records in groups until closed."""
+        for batch in drain_batches(self.queue, self.batch_size, self.max_wait, _CLOSE):
+            self.commit(batch)
+
+    def commit(self, batch):
+        try:
+            self.conn.execute("BEGIN")
+            # Outcomes find their intent inside the transaction, so an intent
+            # committed in the same batch is already visible.
+            self.conn.executemany(
+                "INSERT INTO journal (key, kind, phase, status, transaction_id, data, error, "
+                "created_at, intent_seq) VALUES (?, ?, ?, ?, ?, ?, ?, ?, CASE WHEN ? = 'outcome' "
+                "THEN (SELECT MAX(i.seq) FROM journal i WHERE i.key = ? AND i.phase = 'intent' "
+                "AND NOT EXISTS (SELECT 1 FROM journal o WHERE o.intent_seq = i.seq)) END)",
+                [record + (record[2], record[0]) for record, future in batch if record is not None])
+            self.conn.execute("COMMIT")
+        except Exception as e:
+            try:
+                self.conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            for record, future in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        for record, future in batch:
+            future.set_result(None)
+
+    def flush(self):
+        """Performs operation of waiting until every record queued so far is durable."""
+        self.append(None).result()
+
+    def in_doubt(self, include_errors=True):
+        """Performs operation of scanning for calls whose outcome is unknown.
+
+            A call is in doubt when its intent has no outcome (the process died
+            while it was in flight) or, with include_errors, when it failed with
+            an error or a non-2xx answer; the request may still have reached the
+            gateway. Calls recorded "not_sent" are never in doubt, nor is any
+            call of a key that has succeeded since the gateway executes a key once.
+
+            Returns:
+                Generator of the intent JournalEntry of each call in doubt, oldest first
+        """
+        condition = include_errors and "(o.seq IS NULL OR o.status = 'error')" or "o.seq IS NULL"
+        cursor = self.connect().execute(
+            "SELECT i.seq, i.key, i.kind, i.phase, i.status, o.transaction_id, i.data, "
+            "o.error, i.created_at FROM journal i LEFT JOIN journal o "
+            "ON o.intent_seq = i.seq "
+            "WHERE i.phase = 'intent' AND " + condition + " AND NOT EXISTS (SELECT 1 FROM journal s "
+            "WHERE s.key = i.key AND s.phase = 'outcome' AND s.status = 'ok') ORDER BY i.seq")
+        for row in cursor:
+            yield JournalEntry.from_row(row)
+
+    def settled(self, kind=None, since=0):
+        """Performs operation of streaming the calls that completed successfully, in order.
+
+            Each key is returned once, with its first successful call.
+
+            Args:
+                self: Current self class
+                kind: "transfer", "refund" or "void" to read only one kind, None for all.
+                since: Only calls whose outcome seq is greater than this one are returned.
+
+            Returns:
+                Generator of (intent, outcome) JournalEntry pairs
+        """
+        columns = "seq, key, kind, phase, status, transaction_id, data, error, created_at"
+        query = ("SELECT " + ", ".join("i." + name for name in columns.split(", ")) + ", "
+                 + ", ".join("o." + name for name in columns.split(", ")) +
+                 " FROM journal o JOIN journal i ON i.seq = o.intent_seq "
+                 "WHERE o.phase = 'outcome' AND o.status = 'ok' AND o.seq > ? "
+                 "AND NOT EXISTS (SELECT 1 FROM journal p WHERE p.key = o.key "
+                 "AND p.phase = 'outcome' AND p.status = 'ok' AND p.seq < o.seq)")
+        args = (since,)
+        if kind is not None:
+            query += " AND o.kind = ?"
+            args += (kind,)
+        for row in self.connect().execute(query + " ORDER BY o.seq", args):
+            yield JournalEntry.from_row(row[:9]), JournalEntry.from_row(row[9:])
+
+    def entries(self, phase=None, since=0):
+        """Performs operation of streaming journal records in order.
+            Args:
+                self: Current self class
+                phase: "intent" or "outcome" to read only one phase, None for both.
+                since: Only records with a seq greater than this one are returned.
+
+            Returns:
+                Generator of JournalEntry
+        """
+        query = ("SELECT seq, key, kind, phase, status, transaction_id, data, error, created_at "
+                 "FROM journal WHERE seq > ?")
+        args = (since,)
+        if phase is not None:
+            query += " AND phase = ?"
+            args += (phase,)
+        for row in self.connect().execute(query + " ORDER BY seq", args):
+            yield JournalEntry.from_row(row)
+
+    def prune(self, before):
+        """Performs operation of deleting the keys settled, or never sent, before a Unix time.
+
+            A key is deleted with all its records once one of its calls succeeded
+            before that time, or once every one of its calls was recorded
+            "not_sent" before it. Keys with a call in doubt are kept whatever their age.
+
+            Returns:
+                Number of records deleted
+        """
+        self.flush()
+        conn = self.connect()
+        cursor = conn.execute(
+            "DELETE FROM journal WHERE key IN (SELECT key FROM journal WHERE phase = 'outcome' "
+            "AND status = 'ok' AND created_at < ?) OR key IN (SELECT i.key FROM journal i "
+            "WHERE i.phase = 'intent' GROUP BY i.key HAVING MIN(COALESCE((SELECT o.status = "
+            "'not_sent' AND o.created_at < ? FROM journal o WHERE o.intent_seq = i.seq), 0)) = 1)",
+            (before, before))
+        return cursor.rowcount
+
+    def close(self):
+        """Performs operation of committing pending records and stopping the writer."""
+        if self.writer.is_alive():
+            self.queue.put(_CLOSE)
+            self.writer.join()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.metrics: request instrumentation for Mimo's API
+=======================================================
+
+Every MimoRestClient call emits one RequestEvent to the client's observers,
+any object with an on_request(event) method. HistogramCollector aggregates
+events into per-endpoint latency histograms and counters, and
+PrometheusFileExporter writes them out in the Prometheus text format.
+Connect times are measured by mimolib.transport.TimedHTTPAdapter. RunReport
+is the fixed-size base of the bulk, import, reconciliation and webhook
+reports.
+
+'''
+import bisect
+import os
+import threading
+
+from mimolib.compat import monotonic
+
+_local = threading.local()
+
+
+class RequestEvent(object):
+    """Timings and sizes of one client call, retries included.
+
+    Attributes:
+        endpoint: Endpoint name, e.g. "transfer_url".
+        method: HTTP method.
+        status: HTTP status of the last attempt, None when no response was received.
+        bytes_sent: Size of the request body.
+        bytes_received: Size of the response body.
+        connect_time: Seconds spent opening new connections (DNS, TCP and TLS).
+        ttfb: Seconds from sending the last attempt to receiving the response headers.
+        latency: Total seconds of the call, including retries and backoff.
+        decode_time: Seconds spent decoding the response body.
+        retries: Number of attempts after the first one.
+        reused_connection: True when no new connection had to be opened.
+        wait_time: Seconds spent waiting for the rate limiter.
+        rejected: True when the circuit breaker refused the call before it was sent.
+        error: Exception raised by the call, None on success.
+    """
+    __slots__ = ("endpoint", "method", "status", "bytes_sent", "bytes_received",
+                 "connect_time", "ttfb", "latency", "decode_time", "retries",
+                 "reused_connection", "wait_time", "rejected", "error")
+
+    def __init__(self, endpoint, method):
+        self.endpoint = endpoint
+        self.method = method
+        self.status = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.connect_time = 0.0
+        self.ttfb = None
+        self.latency = 0.0
+        self.decode_time = 0.0
+        self.retries = 0
+        self.reused_connection = True
+        self.wait_time = 0.0
+        self.rejected = False
+        self.error = None
+
+    def __repr__(self):
+        return ("RequestEvent(endpoint=%r, status=%r, latency=%.4f, retries=%d)"
+                % (self.endpoint, self.status, self.latency, self.retries))
+
+
+def set_current_event(event):
+    """Performs operation of binding event to this thread so new connections are charged to it."""
+    _local.event = event
+
+
+def record_connect(seconds):
+    event = getattr(_local, "event", None)
+    if event is not None:
+        event.connect_time += seconds
+        event.reused_connection = False
+
+
+def make_buckets(start=0.0005, factor=1.25, stop=120.0):
+    bounds = []
+    bound = start
+    while bound < stop:
+        bounds.append(bound)
+        bound *= factor
+    bounds.append(stop)
+    return bounds
+
+
+LATENCY_BUCKETS = make_buckets()
+
+
+class Histogram(object):
+    """Fixed log-scale bucket histogram; percentiles are accurate to one bucket (25%)."""
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def percentile(self, pct):
+        """Performs operation of estimating a percentile as the upper bound of its bucket."""
+        if not self.count:
+            return 0.0
+        rank = pct / 100.0 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.bounds[min(index, len(self.bounds) - 1)]
+        return self.bounds[-1]
+
+
+class RunReport(object):
+    """Base of the reports of long runs: timing, throughput and a latency Histogram.
+
+    Subclasses keep their own counters and define total; their size stays
+    fixed whatever the number of items.
+
+    Attributes:
+        latency: Histogram of seconds per item.
+        started: monotonic() time the run started, None before.
+        finished: monotonic() time the run finished, None while it runs.
+    """
+    def __init__(self):
+        self.latency = Histogram()
+        self.started = None
+        self.finished = None
+
+    def start(self):
+        self.started = monotonic()
+
+    def finish(self):
+        self.finished = monotonic()
+
+    @property
+    def total(self):
+        """Items accounted so far."""
+        raise NotImplementedError
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or monotonic()) - self.started
+
+    @property
+    def throughput(self):
+        """Items accounted per second."""
+        elapsed = self.elapsed
+        return elapsed and self.total / elapsed or 0.0
+
+    def latency_percentiles(self, pcts=(50, 95, 99)):
+        """Performs operation of estimating latency percentiles in seconds, keyed by percentile."""
+        return dict((pct, self.latency.percentile(pct)) for pct in pcts)
+
+    def as_dict(self):
+        """Performs operation of summarising total, elapsed time, throughput and latency percentiles as a plain dict."""
+        row = {'total': self.total,
+               'elapsed': self.elapsed,
+               'throughput': self.throughput}
+        for pct, value in self.latency_percentiles().items():
+            row['p%d' % pct] = value
+        return row
+
+
+class EndpointStats(object):
+    def __init__(self):
+        self.latency = Histogram()
+        self.ttfb = Histogram()
+        self.connect = Histogram()
+        self.wait = Histogram()
+        self.errors = 0
+        self.rejected = 0
+        self.retries = 0
+        self.new_connections = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.statuses = {}
+
+
+class HistogramCollector(object):
+    """Observer aggregating RequestEvents into per-endpoint histograms and counters.
+
+    Thread-safe; register it with MimoRestClient(observers=[collector]).
+    """
+    def __init__(self):
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def on_request(self, event):
+        with self.lock:
+            stats = self.endpoints.get(event.endpoint)
+            if stats is None:
+                stats = self.endpoints[event.endpoint] = EndpointStats()
+            stats.latency.add(event.latency)
+            if event.ttfb is not None:
+                stats.ttfb.add(event.ttfb)
+            if not event.reused_connection:
+                stats.new_connections += 1
+                stats.connect.add(event.connect_time)
+            stats.wait.add(event.wait_time)
+            if event.error is not None:
+                stats.errors += 1
+            if event.rejected:
+                stats.rejected += 1
+            stats.retries += event.retries
+            stats.bytes_sent += event.bytes_sent
+            stats.bytes_received += event.bytes_received
+            stats.statuses[event.status] = stats.statuses.get(event.status, 0) + 1
+
+    def report(self, pcts=(50, 95, 99)):
+        """Performs operation of summarising the collected calls per endpoint.
+
+            Returns:
+                Dict of endpoint name to a dict of counters and latency percentiles
+        """
+        summary = {}
+        with self.lock:
+            for endpoint, stats in self.endpoints.items():
+                row = {'count': stats.latency.count,
+                       'errors': stats.errors,
+                       'rejected': stats.rejected,
+                       'retries': stats.retries,
+                       'new_connections': stats.new_connections,
+                       'bytes_sent': stats.bytes_sent,
+                       'bytes_received': stats.bytes_received}
+                for pct in pcts:
+                    row['p%d' % pct] = stats.latency.percentile(pct)
+                    row['ttfb_p%d' % pct] = stats.ttfb.percentile(pct)
+                summary[endpoint] = row
+        return summary
+
+    def prometheus_text(self, prefix="mimo"):
+        """Performs operation of rendering the collected metrics in the Prometheus text format."""
+        lines = []
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            for name, attr in (("request_latency_seconds", "latency"),
+                               ("time_to_first_byte_seconds", "ttfb"),
+                               ("connect_seconds", "connect"),
+                               ("rate_limit_wait_seconds", "wait")):
+                metric = "%s_%s" % (prefix, name)
+                lines.append("# TYPE %s summary" % metric)
+                for endpoint, stats in endpoints:
+                    histogram = getattr(stats, attr)
+                    for quantile in (0.5, 0.95, 0.99):
+                        lines.append('%s{endpoint="%s",quantile="%s"} %.6f'
+                                     % (metric, endpoint, quantile,
+                                        histogram.percentile(quantile * 100)))
+                    lines.append('%s_sum{endpoint="%s"} %.6f' % (metric, endpoint, histogram.total))
+                    lines.append('%s_count{endpoint="%s"} %d' % (metric, endpoint, histogram.count))
+            for name, attr in (("request_errors_total", "errors"),
+                               ("request_rejected_total", "rejected"),
+                               ("request_retries_total", "retries"),
+                               ("new_connections_total", "new_connections"),
+                               ("bytes_sent_total", "bytes_sent"),
+                               ("bytes_received_total", "bytes_received")):
+                metric = "%s_%s" % (prefix, name)
+                lines.append("# TYPE %s counter" % metric)
+                for endpoint, stats in endpoints:
+                    lines.append('%s{endpoint="%s"} %d' % (metric, endpoint, getattr(stats, attr)))
+            metric = "%s_responses_total" % prefix
+            lines.append("# TYPE %s counter" % metric)
+            for endpoint, stats in endpoints:
+                for status, count in sorted(stats.statuses.items(), key=lambda item: str(item[0])):
+                    lines.append('%s{endpoint="%s",status="%s"} %d'
+                                 % (metric, endpoint, status or "error", count))
+        return "\n".join(lines) + "\n"
+
+
+class PrometheusFileExporter(object):
+    """Observer feeding a HistogramCollector and rewriting a Prometheus text file.
+
+    The file is replaced atomically at most once every interval seconds, so it
+    can be picked up by the node_exporter textfile collector.
+
+    Attributes:
+        collector: HistogramCollector holding the metrics.
+        path: Path of the .prom file to write.
+        interval: Minimum seconds between two writes.
+    """
+    def __init__(self, path, collector=None, interval=15, prefix="mimo"):
+        if collector is None:
+            collector = HistogramCollector()
+        self.collector = collector
+        self.path = path
+        self.interval = interval
+        self.prefix = prefix
+        self.written_at = 0
+        self.lock = threading.Lock()
+
+    def on_request(self, event):
+        self.collector.on_request(event)
+        if monotonic() - self.written_at >= self.interval:
+            self.write()
+
+    def write(self):
+        """Performs operation of writing the current metrics to path."""
+        with self.lock:
+            self.written_at = monotonic()
+            tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+            with open(tmp_path, "w") as f:
+                f.write(self.collector.prometheus_text(self.prefix))
+            os.rename(tmp_path, self.path)
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.mockgateway: local stand-in for the Mimo gateway
+========================================================
+
+MockGateway serves the token, search, transfer, refund, void, registration
+and transaction lookup endpoints from an in-process threaded HTTP server with
+configurable latency, error rate and throttling, for tests and benchmarks.
+
+    python -m mimolib.mockgateway --port 8089 --latency 0.02 --error-rate 0.01
+
+'''
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+import zlib
+
+from mimolib.compat import PY2
+from mimolib.compression import compress
+from mimolib.throttle import TokenBucket
+
+if PY2:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qsl
+else:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qsl
+
+ENDPOINTS = {
+    ("POST", "oauth/v2/token"): "token",
+    ("GET", "partner/user/card_id"): "search",
+    ("POST", "partner/transfers"): "transfer",
+    ("POST", "partner/refunds"): "refund",
+    ("POST", "partner/transfers/void"): "void",
+    ("POST", "partner/registration"): "register",
+    ("GET", "partner/transactions"): "transaction",
+}
+
+# Searches for these usernames answer "not found".
+UNKNOWN_USERS = ("unknown", "nobody")
+
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_call("GET")
+
+    def do_POST(self):
+        self.handle_call("POST")
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def handle_call(self, method):
+        gateway = self.server.gateway
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = length and self.rfile.read(length) or b""
+        encoding = self.headers.get("Content-Encoding")
+        if encoding == "gzip":
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        elif encoding == "deflate":
+            body = zlib.decompress(body)
+        name = ENDPOINTS.get((method, url.path.strip("/")))
+        if name is None:
+            return self.reply(404, {"error": "Not found"})
+        params = dict(parse_qsl(url.query))
+        params.update(gateway.parse_body(body, self.headers.get("Content-Type", "")))
+        status, content, headers = gateway.handle(name, params, self.headers)
+        self.reply(status, content, headers)
+
+    def reply(self, status, content, headers=None):
+        raw = json.dumps(content).encode("utf-8")
+        accepted = self.headers.get("Accept-Encoding") or ""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if len(raw) >= 512 and "gzip" in accepted:
+            raw = compress(raw, "gzip")
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(raw)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(raw)
+
+
+class GatewayServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+
+class MockGateway(object):
+    """MockGateway class serving a local imitation of the Mimo Payment API.
+
+    Attributes:
+        latency: Seconds added to every call.
+        jitter: Extra random seconds, uniformly distributed, added to every call.
+        error_rate: Fraction of calls answered with HTTP 500.
+        rate_limit: Calls per second accepted before answering 429, None for no limit.
+        seed: Seed of the random generator, for reproducible runs.
+        transactions: Dict of transaction id to the recorded transfer or refund.
+        calls: Dict of endpoint name to the number of calls received.
+    """
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 rate_limit=None, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.bucket = rate_limit and TokenBucket(rate_limit) or None
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1000)
+        self.transactions = {}
+        self.idempotency_keys = {}
+        self.calls = {}
+        self.server = GatewayServer((host, port), GatewayHandler)
+        self.server.gateway = self
+        self.thread = None
+
+    @property
+    def url(self):
+        """Base URL of the gateway, to be used as client_url."""
+        host, port = self.server.server_address[:2]
+        return "http://%s:%d/" % (host, port)
+
+    def start(self):
+        """Performs operation of serving requests on a background thread."""
+        self.thread = threading.Thread(target=self.server.serve_forever, name="mimo-mock-gateway")
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Performs operation of shutting the server down."""
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def parse_body(self, body, content_type):
+        if not body:
+            return {}
+        body = body.decode("utf-8")
+        if "json" in content_type:
+            try:
+                return json.loads(body)
+            except ValueError:
+                return {}
+        return dict(parse_qsl(body))
+
+    def handle(self, name, params, headers):
+        """Performs operation of answering one call.
+
+            Returns:
+                Tuple of (HTTP status, JSON content, extra headers)
+        """
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            delay = self.latency + (self.jitter and self.random.uniform(0, self.jitter))
+            fail = self.error_rate and self.random.random() < self.error_rate
+        if self.bucket is not None and not self.bucket.try_acquire():
+            return 429, {"error": "Too many requests"}, {"Retry-After": "1"}
+        if delay:
+            time.sleep(delay)
+        if fail:
+            return 500, {"error": "Internal server error"}, None
+        if name != "token" and name != "register" and not params.get("access_token"):
+            return 401, {"error": "access_token is missing"}, None
+        return getattr(self, "handle_" + name)(params, headers)
+
+    def handle_token(self, params, headers):
+        return 200, {"access_token": uuid.uuid4().hex,
+                     "refresh_token": uuid.uuid4().hex,
+                     "expires_in": 3600,
+                     "token_type": "bearer"}, None
+
+    def handle_search(self, params, headers):
+        username = params.get("username", "")
+        if username in UNKNOWN_USERS:
+            return 404, {"error": "User not found"}, None
+        return 200, {"card_id": "CARD-%s" % username,
+                     "username": username or "mimo-user",
+                     "name": "Mimo User"}, None
+
+    def record_transaction(self, kind, params, headers):
+        key = headers.get("Idempotency-Key")
+        with self.lock:
+            if key in self.idempotency_keys:
+                return self.transactions[self.idempotency_keys[key]]
+            transaction_id = next(self.ids)
+            transaction = {"transaction_id": transaction_id,
+                           "type": kind,
+                           "status": "success",
+                           "amount": params.get("amount"),
+                           "idempotency_key": key}
+            self.transactions[transaction_id] = transaction
+            if key:
+                self.idempotency_keys[key] = transaction_id
+            return transaction
+
+    def handle_transfer(self, params, headers):
+        transaction = self.record_transaction("transfer", params, headers)
+        return 200, {"transaction_id": transaction["transaction_id"],
+                     "status": transaction["status"],
+                     "amount": transaction["amount"]}, None
+
+    def handle_refund(self, params, headers):
+        transaction = self.record_transaction("refund", params, headers)
+        return 200, {"transaction_id": transaction["transaction_id"],
+                     "status": transaction["status"],
+                     "amount": transaction["amount"]}, None
+
+    def handle_void(self, params, headers):
+        try:
+            transaction_id = int(params.get("transaction_id"))
+        except (TypeError, ValueError):
+            transaction_id = None
+        with self.lock:
+            transaction = self.transactions.get(transaction_id)
+            if transaction is None:
+                return 404, {"error": "Transaction not found"}, None
+            transaction["status"] = "voided"
+        return 200, {"transaction_id": transaction_id, "status": "voided"}, None
+
+    def handle_transaction(self, params, headers):
+        try:
+            transaction_id = int(params.get("transaction_id"))
+        except (TypeError, ValueError):
+            transaction_id = None
+        with self.lock:
+            transaction = self.transactions.get(transaction_id)
+            if transaction is None:
+                return 404, {"error": "Transaction not found"}, None
+            return 200, dict(transaction), None
+
+    def handle_register(self, params, headers):
+        if not params.get("username"):
+            return 400, {"error": "username is required"}, None
+        return 200, {"status": "success", "username": params["username"]}, None
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the Mimo gateway.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    gateway = MockGateway(args.host, args.port, args.latency, args.jitter, args.error_rate,
+                          args.rate_limit, args.seed)
+    print ("Mock Mimo gateway listening on %s" % gateway.url)
+    sys.stdout.flush()
+    try:
+        gateway.server.serve_forever()
+    except KeyboardInterrupt:
+        gateway.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
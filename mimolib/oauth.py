@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.oauth: OAuth token management for Mimo's API
+====================================================
+
+TokenManager caches the access token together with its expiry, renews it
+shortly before it lapses and makes sure concurrent callers trigger a single
+token request between them. It blocks while renewing, so it only takes the
+sync MimoRestClient; AsyncMimoRestClient uses mimolib.aio.oauth.AsyncTokenManager.
+
+'''
+import logging
+import sys
+import threading
+
+from mimolib import MimoContext
+from mimolib.compat import monotonic
+
+logger = logging.getLogger(__name__)
+
+
+class TokenContext(MimoContext):
+    """MimoContext whose access token is always read from a TokenManager.
+
+    Attributes:
+        manager: TokenManager supplying the access token.
+        transaction_id: Transaction id returned by the last transfer or refund.
+    """
+    __slots__ = ("manager",)
+
+    def __init__(self, manager, transaction_id=False):
+        self.manager = manager
+        self.transaction_id = transaction_id
+
+    @property
+    def access_token(self):
+        return self.manager.get_token()
+
+
+class TokenManager(object):
+    """TokenManager class used to keep a valid OAuth access token for a client.
+
+    The token is renewed refresh_margin seconds before it expires: either by a
+    background thread (see start) or by the first caller that notices. While
+    the old token is still valid, other callers keep using it instead of
+    waiting; once it has expired they wait for the single renewal in flight.
+
+    Attributes:
+        client: MimoRestClient used to renew the token.
+        refresh_margin: Seconds before expiry at which the token is renewed.
+        default_ttl: Token lifetime in seconds when the server sends no expires_in.
+        fetch_token: Optional callable returning a fresh token response dict,
+                     used instead of the refresh_token grant.
+
+    Raises:
+        TypeError: If client is an AsyncMimoRestClient.
+    """
+    asynchronous = False
+
+    def __init__(self, client, refresh_margin=60, default_ttl=3600, fetch_token=None,
+                 clock=monotonic):
+        aio = sys.modules.get("mimolib.aio")
+        if not self.asynchronous and aio is not None and isinstance(client, aio.AsyncMimoRestClient):
+            raise TypeError('TokenManager would block the event loop; use '
+                            'mimolib.aio.oauth.AsyncTokenManager with AsyncMimoRestClient')
+        self.client = client
+        self.refresh_margin = refresh_margin
+        self.default_ttl = default_ttl
+        self.fetch_token = fetch_token
+        self.clock = clock
+        self.access_token = None
+        self.refresh_token = None
+        self.expires_at = 0
+        self.refresh_at = 0
+        self.renewals = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def set_token(self, response_content):
+        """Performs operation of caching a token response and computing its expiry.
+            Args:
+                self: Current self class
+                response_content: Dict token response received from the server.
+
+            Raises:
+                ValueError: If the response has no access_token.
+        """
+        if not isinstance(response_content, dict) or not response_content.get("access_token"):
+            raise ValueError('token response has no access_token: %r' % (response_content,))
+        ttl = float(response_content.get("expires_in") or self.default_ttl)
+        now = self.clock()
+        self.refresh_token = response_content.get("refresh_token", self.refresh_token)
+        self.access_token = response_content["access_token"]
+        self.expires_at = now + ttl
+        self.refresh_at = now + max(ttl - self.refresh_margin, ttl / 2.0)
+
+    def authorize(self, code, **kwargs):
+        """Performs operation of exchanging an authentication code for the first token.
+
+            Returns:
+                String HTTP response received from the server
+        """
+        response_content = self.client.request_oauth_token(code, context=MimoContext(), **kwargs)
+        with self.lock:
+            self.set_token(response_content)
+        return response_content
+
+    def renew(self):
+        """Performs operation of requesting a new token. Callers must hold the lock."""
+        if self.fetch_token is not None:
+            response_content = self.fetch_token()
+        elif self.refresh_token:
+            response_content = self.client.refresh_oauth_token(self.refresh_token,
+                                                               context=MimoContext())
+        else:
+            raise ValueError('no refresh_token or fetch_token available to renew the access token')
+        self.set_token(response_content)
+        self.renewals += 1
+
+    def get_token(self):
+        """Performs operation of returning a valid access token, renewing it when needed.
+
+            Returns:
+                String access token
+
+            Raises:
+                ValueError: If the token cannot be renewed.
+                Exception: An error occurred while posting request or parsing response.
+        """
+        now = self.clock()
+        if self.access_token and now < self.refresh_at:
+            return self.access_token
+        if self.access_token and now < self.expires_at:
+            # Still valid: renew only if nobody else is already doing it.
+            if not self.lock.acquire(False):
+                return self.access_token
+            try:
+                if self.clock() >= self.refresh_at:
+                    self.renew()
+            except Exception:
+                pass
+            finally:
+                self.lock.release()
+            return self.access_token
+        with self.lock:
+            if not self.access_token or self.clock() >= self.refresh_at:
+                self.renew()
+            return self.access_token
+
+    def context(self, transaction_id=False):
+        """Performs operation of creating a per-caller context backed by this manager."""
+        return TokenContext(self, transaction_id)
+
+    def start(self):
+        """Performs operation of starting the background renewal thread."""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name="mimo-token-refresh")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Performs operation of stopping the background renewal thread."""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        """Background loop renewing the token at refresh_at, retrying every few seconds on errors."""
+        while not self.stopped.is_set():
+            if not self.access_token and self.fetch_token is None:
+                self.stopped.wait(1)
+                continue
+            delay = self.refresh_at - self.clock()
+            if delay > 0:
+                self.stopped.wait(delay)
+                continue
+            try:
+                with self.lock:
+                    if self.clock() >= self.refresh_at:
+                        self.renew()
+            except Exception:
+                logger.warning("token refresh failed", exc_info=True)
+                self.stopped.wait(min(5, max(self.expires_at - self.clock(), 1)))
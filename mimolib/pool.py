@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.pool: bounded thread pool and queue batching
+====================================================
+
+bounded_map runs a function over a lazily read iterable on a thread pool
+and yields the results as they complete, with at most concurrency + backlog
+calls pending at any time, so memory stays flat for any number of items.
+BulkTransfer and RegistrationImporter are built on it; the asyncio
+counterpart is mimolib.aio.pool. drain_batches groups the items of a queue
+into batches for the background threads of Journal and RequestCoalescer.
+Requires concurrent.futures (the futures backport on Python 2).
+
+'''
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from mimolib.compat import monotonic
+
+try:
+    from queue import Empty
+except ImportError:
+    from Queue import Empty
+
+
+def bounded_map(function, items, concurrency, backlog=None):
+    """Performs operation of calling function on every item on a thread pool, yielding results as they complete.
+
+        Closing the generator cancels the calls not started yet and waits for
+        the running ones.
+
+        Args:
+            function: Callable of one item. It should capture its own errors in
+                      its result; an exception it raises ends the run.
+            items: Iterable of items, read lazily.
+            concurrency: Number of worker threads.
+            backlog: Extra items queued ahead of the workers, concurrency by default.
+
+        Returns:
+            Generator of function results in completion order
+    """
+    limit = concurrency + (backlog is None and concurrency or backlog)
+    items = iter(items)
+    pending = set()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < limit:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.add(executor.submit(function, item))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def drain_batches(queue, batch_size, max_wait, close):
+    """Performs operation of reading a queue in batches until the close marker is read.
+
+        Each batch waits for its first item, then takes whatever else arrives
+        within max_wait seconds, up to batch_size items.
+
+        Args:
+            queue: Queue to read.
+            batch_size: Maximum items in one batch.
+            max_wait: Seconds a batch waits for more items after its first one.
+            close: Marker object ending the stream once its batch is returned.
+
+        Returns:
+            Generator of non-empty lists of items, the close marker left out
+    """
+    closing = False
+    while not closing:
+        batch = [queue.get()]
+        deadline = monotonic() + max_wait
+        while len(batch) < batch_size:
+            try:
+                batch.append(queue.get(timeout=max(deadline - monotonic(), 0)))
+            except Empty:
+                break
+        closing = any(item is close for item in batch)
+        batch = [item for item in batch if item is not close]
+        if batch:
+            yield batch
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.reconcile: matching local transaction records to gateway state
+======================================================================
+
+journal_records() streams the transfers and refunds a mimolib.journal.Journal
+recorded, with the status they should have at the gateway. compare() checks
+one of them against the gateway's record, and reconcile_streams() matches a
+local stream to a gateway statement stream through hash indexes that only
+hold unmatched records. Mismatches are yielded as soon as they are known.
+The asyncio engine querying the gateway is mimolib.aio.reconcile.
+
+'''
+from mimolib.compat import text_type
+
+MISSING = "missing"
+UNEXPECTED = "unexpected"
+STATUS = "status"
+AMOUNT = "amount"
+ERROR = "error"
+
+SUCCESS = "success"
+VOIDED = "voided"
+
+
+class LocalRecord(object):
+    """One transaction as recorded locally.
+
+    Attributes:
+        transaction_id: Transaction id returned by the gateway, as a string.
+        kind: "transfer" or "refund".
+        amount: Amount sent.
+        status: Status the gateway should report, "success" or "voided".
+        key: Idempotency key of the call.
+        seq: Journal position of the outcome, to resume the next run after it.
+    """
+    __slots__ = ("transaction_id", "kind", "amount", "status", "key", "seq")
+
+    def __init__(self, transaction_id, kind, amount, status=SUCCESS, key=None, seq=None):
+        self.transaction_id = transaction_id
+        self.kind = kind
+        self.amount = amount
+        self.status = status
+        self.key = key
+        self.seq = seq
+
+    def __repr__(self):
+        return ("LocalRecord(transaction_id=%r, kind=%r, amount=%r, status=%r)"
+                % (self.transaction_id, self.kind, self.amount, self.status))
+
+
+class Mismatch(object):
+    """A difference between the local and gateway view of one transaction.
+
+    Attributes:
+        transaction_id: Transaction id, as a string.
+        reason: "missing", "unexpected", "status", "amount" or "error".
+        local: LocalRecord, None for transactions only the gateway knows.
+        remote: Gateway record dict, or the exception raised looking it up.
+    """
+    __slots__ = ("transaction_id", "reason", "local", "remote")
+
+    def __init__(self, transaction_id, reason, local=None, remote=None):
+        self.transaction_id = transaction_id
+        self.reason = reason
+        self.local = local
+        self.remote = remote
+
+    def __repr__(self):
+        return "Mismatch(transaction_id=%r, reason=%r)" % (self.transaction_id, self.reason)
+
+
+def journal_records(journal, since=0):
+    """Performs operation of streaming the transfers and refunds recorded in journal.
+
+        Only the transaction ids of successful voids are kept in memory, to
+        report the transactions they voided with the "voided" status.
+
+        Args:
+            journal: mimolib.journal.Journal to read.
+            since: Only calls journaled after this LocalRecord.seq are returned.
+
+        Returns:
+            Generator of LocalRecord in journal order
+    """
+    voided = set()
+    for intent, outcome in journal.settled("void"):
+        voided.add(text_type((intent.data or {}).get("transaction_id")))
+    for intent, outcome in journal.settled(since=since):
+        if outcome.kind == "void" or outcome.transaction_id is None:
+            continue
+        yield LocalRecord(outcome.transaction_id, outcome.kind, (intent.data or {}).get("amount"),
+                          outcome.transaction_id in voided and VOIDED or SUCCESS,
+                          outcome.key, outcome.seq)
+
+
+def normalize_amount(value):
+    try:
+        return round(float(value), 2)
+    except (TypeError, ValueError):
+        return None
+
+
+def compare(local, remote):
+    """Performs operation of checking a LocalRecord against the gateway's record of it.
+        Args:
+            local: LocalRecord.
+            remote: Gateway record dict, None when the gateway does not know the transaction.
+
+        Returns:
+            Mismatch, None when both agree; a record that is not a dict or names
+            another transaction is an "error" mismatch, never a match
+    """
+    if remote is None:
+        return Mismatch(local.transaction_id, MISSING, local, remote)
+    if not isinstance(remote, dict) or \
+            text_type(remote.get("transaction_id")) != text_type(local.transaction_id):
+        return Mismatch(local.transaction_id, ERROR, local, remote)
+    status = remote.get("status")
+    if status and local.status and status != local.status:
+        return Mismatch(local.transaction_id, STATUS, local, remote)
+    amount = normalize_amount(remote.get("amount"))
+    if amount is not None and amount != normalize_amount(local.amount):
+        return Mismatch(local.transaction_id, AMOUNT, local, remote)
+    return None
+
+
+def reconcile_streams(local, remote):
+    """Performs operation of matching a local stream to a gateway statement stream.
+
+        Both streams are read alternately and in any order. Each record is
+        looked up in a dict of the other side's unmatched records, so memory
+        holds only records whose counterpart has not arrived yet.
+
+        Args:
+            local: Iterable of LocalRecord.
+            remote: Iterable of gateway record dicts carrying a transaction_id.
+
+        Returns:
+            Generator of Mismatch
+    """
+    local_pending = {}
+    remote_pending = {}
+    sides = [iter(local), iter(remote)]
+    while sides[0] is not None or sides[1] is not None:
+        for side in (0, 1):
+            if sides[side] is None:
+                continue
+            try:
+                item = next(sides[side])
+            except StopIteration:
+                sides[side] = None
+                continue
+            if side == 0:
+                transaction_id = text_type(item.transaction_id)
+                other = remote_pending.pop(transaction_id, None)
+                if other is None:
+                    local_pending[transaction_id] = item
+                    continue
+                local_record, remote_record = item, other
+            else:
+                transaction_id = text_type(item.get("transaction_id"))
+                other = local_pending.pop(transaction_id, None)
+                if other is None:
+                    remote_pending[transaction_id] = item
+                    continue
+                local_record, remote_record = other, item
+            mismatch = compare(local_record, remote_record)
+            if mismatch is not None:
+                yield mismatch
+    for transaction_id, record in local_pending.items():
+        yield Mismatch(transaction_id, MISSING, record, None)
+    for transaction_id, record in remote_pending.items():
+        yield Mismatch(transaction_id, UNEXPECTED, None, record)
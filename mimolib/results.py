@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.results: compact response objects for Mimo's API
+========================================================
+
+With typed_results=True, MimoRestClient returns these __slots__ objects
+instead of plain dicts for transfers, refunds, voids and searches. Known
+fields become attributes; anything else the gateway sends is kept in extra.
+They still support get() and item access, so code written for dicts keeps
+working.
+
+'''
+
+
+class MimoResponse(object):
+    """Base class of the typed responses.
+
+    Attributes:
+        extra: Dict of response fields without a dedicated slot, None when there are none.
+    """
+    __slots__ = ("extra",)
+    fields = ()
+
+    def __init__(self, content=None):
+        content = dict(content or {})
+        for name in self.fields:
+            setattr(self, name, content.pop(name, None))
+        self.extra = content or None
+
+    @classmethod
+    def from_content(cls, content):
+        """Performs operation of building a typed response from parsed JSON; non-dict content is returned as is."""
+        if not isinstance(content, dict):
+            return content
+        return cls(content)
+
+    def get(self, key, default=None):
+        if key in self.fields:
+            value = getattr(self, key)
+            return default if value is None else value
+        return (self.extra or {}).get(key, default)
+
+    def __getitem__(self, key):
+        if key in self.fields:
+            return getattr(self, key)
+        return (self.extra or {})[key]
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def as_dict(self):
+        """Performs operation of converting the response back to a plain dict."""
+        content = dict(self.extra or {})
+        for name in self.fields:
+            value = getattr(self, name)
+            if value is not None:
+                content[name] = value
+        return content
+
+    def __eq__(self, other):
+        if isinstance(other, MimoResponse):
+            other = other.as_dict()
+        return self.as_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__,
+                           ", ".join("%s=%r" % item for item in sorted(self.as_dict().items())))
+
+
+class TransferResponse(MimoResponse):
+    __slots__ = ("transaction_id", "status", "amount", "message")
+    fields = __slots__
+
+
+class RefundResponse(MimoResponse):
+    __slots__ = ("transaction_id", "status", "amount", "message")
+    fields = __slots__
+
+
+class VoidResponse(MimoResponse):
+    __slots__ = ("transaction_id", "status", "message")
+    fields = __slots__
+
+
+class SearchResponse(MimoResponse):
+    __slots__ = ("card_id", "username", "email", "phone", "name", "message")
+    fields = __slots__
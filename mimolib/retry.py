@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.retry: retry policy for Mimo's API
+==========================================
+
+RetryPolicy decides whether a failed call is retried and how long to wait:
+exponential backoff with full jitter, a list of retryable HTTP statuses,
+the server's Retry-After hint, and a RetryBudget shared by all calls so
+that an outage does not multiply the load on the gateway.
+
+'''
+import random
+import threading
+
+RETRYABLE_STATUSES = (408, 429, 500, 502, 503, 504)
+
+
+def new_idempotency_key():
+    """Performs operation of generating a client-side idempotency key."""
+    import uuid
+    return uuid.uuid4().hex
+
+
+class RetryBudget(object):
+    """Caps retries at a fraction of the calls made.
+
+    Every first attempt deposits ratio tokens, every retry withdraws one;
+    min_tokens are always available so that low traffic can still retry.
+
+    Attributes:
+        ratio: Retries allowed per first attempt, e.g. 0.2 for 20%.
+        min_tokens: Tokens kept available regardless of traffic.
+        max_tokens: Upper bound of saved up tokens.
+    """
+    def __init__(self, ratio=0.2, min_tokens=10, max_tokens=1000):
+        self.ratio = ratio
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.tokens = float(min_tokens)
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.tokens + self.ratio, self.max_tokens)
+
+    def withdraw(self):
+        """Performs operation of taking one retry token.
+
+            Returns:
+                True when the retry is within budget
+        """
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class RetryPolicy(object):
+    """RetryPolicy class used by MimoRestClient to retry transient failures.
+
+    Only calls marked idempotent are retried: searches, voids, and transfers
+    and refunds, which carry an Idempotency-Key header.
+
+    Attributes:
+        max_attempts: Total attempts per call, including the first one.
+        backoff: Base delay in seconds, doubled on every attempt.
+        max_backoff: Upper bound of a single delay in seconds.
+        jitter: Randomize delays between 0 and the backoff (full jitter).
+        retry_statuses: HTTP statuses that are retried.
+        budget: RetryBudget shared by every call, a default RetryBudget when None.
+    """
+    def __init__(self, max_attempts=3, backoff=0.5, max_backoff=10, jitter=True,
+                 retry_statuses=RETRYABLE_STATUSES, budget=None):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        if budget is None:
+            budget = RetryBudget()
+        self.budget = budget
+        self.retries = 0
+
+    def record_call(self):
+        """Performs operation of crediting the retry budget for a new call."""
+        self.budget.deposit()
+
+    def is_retryable_status(self, status):
+        return status in self.retry_statuses
+
+    def should_retry(self, attempt, status=None):
+        """Performs operation of deciding whether attempt number attempt is retried.
+            Args:
+                self: Current self class
+                attempt: Number of attempts already made.
+                status: HTTP status of the failed attempt, None for a transport error.
+
+            Returns:
+                True when another attempt should be made
+        """
+        if attempt >= self.max_attempts:
+            return False
+        if status is not None and not self.is_retryable_status(status):
+            return False
+        if not self.budget.withdraw():
+            return False
+        self.retries += 1
+        return True
+
+    def get_delay(self, attempt, retry_after=None):
+        """Performs operation of computing the wait before the next attempt.
+            Args:
+                self: Current self class
+                attempt: Number of attempts already made.
+                retry_after: Value of the server's Retry-After header, if any.
+
+            Returns:
+                Float seconds to wait
+        """
+        delay = min(self.backoff * (2 ** (attempt - 1)), self.max_backoff)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), self.max_backoff))
+            except ValueError:
+                pass
+        return delay
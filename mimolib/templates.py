@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.templates: precompiled request templates for Mimo's API
+===============================================================
+
+MimoRestClient compiles one RequestTemplate per endpoint when it is built.
+The template holds the endpoint URL, its query string prefix with the static
+parameters already encoded, and the encoded names of its query fields, so
+each call only has to quote its own values.
+
+'''
+from mimolib.compat import urlencode, quote_plus, string_types
+
+
+def quote_value(value):
+    """Performs operation of quoting one query value the way urlencode does."""
+    if not isinstance(value, string_types):
+        value = str(value)
+    return quote_plus(value)
+
+
+class RequestTemplate(object):
+    """Precompiled parts of the requests sent to one endpoint.
+
+    Attributes:
+        name: Endpoint name, e.g. "transfer_url".
+        url: Full endpoint URL.
+        query_prefix: URL, "?" and the encoded static parameters.
+        separator: "&" joining the static parameters to the variable ones, empty without static parameters.
+        field_prefixes: Encoded "name=" of each positional field of fill_url.
+    """
+    __slots__ = ("name", "url", "query_prefix", "separator", "field_prefixes")
+
+    def __init__(self, name, url, static_params=None, fields=()):
+        self.name = name
+        self.url = url
+        query = static_params and urlencode(static_params) or ""
+        self.query_prefix = url + "?" + query
+        self.separator = query and "&" or ""
+        self.field_prefixes = tuple(quote_plus(field) + "=" for field in fields)
+
+    def join(self, query):
+        """Performs operation of appending an encoded query to the query prefix."""
+        if not query:
+            return self.query_prefix
+        return self.query_prefix + self.separator + query
+
+    def build_url(self, params):
+        """Performs operation of appending a dict of parameters to the query prefix."""
+        return self.join(urlencode(params))
+
+    def fill_url(self, *values):
+        """Performs operation of appending values, in the order of the template fields, to the query prefix."""
+        return self.join("&".join([prefix + quote_value(value) for prefix, value
+                                   in zip(self.field_prefixes, values)]))
+
+    def __repr__(self):
+        return "RequestTemplate(name=%r, url=%r)" % (self.name, self.url)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.throttle: rate limiting and circuit breaking for Mimo's API
+===================================================================
+
+RateLimiter keeps calls under per-endpoint token bucket limits and
+CircuitBreaker fails calls fast while the gateway is unhealthy. Both are
+thread-safe and may be shared by several clients.
+
+'''
+import threading
+
+from mimolib.compat import monotonic
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the gateway while the circuit breaker is open."""
+
+
+class TokenBucket(object):
+    """Token bucket allowing rate calls per second with bursts of up to burst calls.
+
+    Attributes:
+        rate: Tokens added per second.
+        burst: Bucket capacity.
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.tokens = self.burst
+        self.updated = monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        """Performs operation of taking one token only if one is available now.
+
+            Returns:
+                True when a token was taken
+        """
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def reserve(self):
+        """Performs operation of taking one token, possibly ahead of time.
+
+            Returns:
+                Float seconds the caller must wait before using the token
+        """
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class RateLimiter(object):
+    """RateLimiter class used to keep each endpoint under its call rate.
+
+    Attributes:
+        limits: Dict mapping endpoint names (e.g. "transfer_url") to
+                (rate, burst) tuples.
+        default: (rate, burst) tuple for endpoints not in limits, None for no limit.
+    """
+    def __init__(self, limits=None, default=None):
+        self.buckets = {}
+        for endpoint, limit in (limits or {}).items():
+            self.buckets[endpoint] = TokenBucket(*limit)
+        self.default = default
+        self.lock = threading.Lock()
+
+    def get_bucket(self, endpoint):
+        bucket = self.buckets.get(endpoint)
+        if bucket is None and self.default is not None:
+            with self.lock:
+                bucket = self.buckets.get(endpoint)
+                if bucket is None:
+                    bucket = self.buckets[endpoint] = TokenBucket(*self.default)
+        return bucket
+
+    def reserve(self, endpoint):
+        """Performs operation of reserving a call on endpoint.
+
+            Returns:
+                Float seconds to wait before making the call
+        """
+        bucket = self.get_bucket(endpoint)
+        if bucket is None:
+            return 0.0
+        return bucket.reserve()
+
+
+class CircuitBreaker(object):
+    """CircuitBreaker class used to stop calling a failing gateway.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    raise CircuitOpenError for recovery_timeout seconds. It then half-opens and
+    lets up to half_open_calls probe calls through: a success closes it again,
+    a failure re-opens it.
+
+    Attributes:
+        failure_threshold: Consecutive failures that open the circuit.
+        recovery_timeout: Seconds the circuit stays open before probing.
+        half_open_calls: Concurrent probe calls allowed while half open.
+        state: One of "closed", "open" or "half_open".
+    """
+    def __init__(self, failure_threshold=5, recovery_timeout=30, half_open_calls=1):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_calls = half_open_calls
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.probes = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Performs operation of admitting a call.
+
+            Raises:
+                CircuitOpenError: If the circuit is open or all probe slots are taken.
+        """
+        with self.lock:
+            if self.state == OPEN:
+                if monotonic() - self.opened_at < self.recovery_timeout:
+                    raise CircuitOpenError('Mimo gateway circuit is open')
+                self.state = HALF_OPEN
+                self.probes = 0
+            if self.state == HALF_OPEN:
+                if self.probes >= self.half_open_calls:
+                    raise CircuitOpenError('Mimo gateway circuit is half open, probe in flight')
+                self.probes += 1
+
+    def release(self):
+        """Performs operation of giving back the probe slot of an admitted call that ended
+            without an outcome, e.g. cancelled, so the half-open circuit can probe again.
+        """
+        with self.lock:
+            if self.state == HALF_OPEN and self.probes > 0:
+                self.probes -= 1
+
+    def record_success(self):
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = monotonic()
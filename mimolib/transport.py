@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.transport: requests transport for Mimo's API
+====================================================
+
+TimedHTTPAdapter is the connection-pooling adapter mounted on every
+MimoRestClient session; its connections report their connect time to the
+current mimolib.metrics.RequestEvent. This module imports requests and
+urllib3, so it is only loaded when a client first goes on the network.
+
+'''
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from mimolib.compat import monotonic
+from mimolib.metrics import record_connect
+
+
+class TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        started = monotonic()
+        HTTPConnection.connect(self)
+        record_connect(monotonic() - started)
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        started = monotonic()
+        HTTPSConnection.connect(self)
+        record_connect(monotonic() - started)
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections report their connect time to the current RequestEvent."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        HTTPAdapter.init_poolmanager(self, *args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": TimedHTTPConnectionPool,
+                                                   "https": TimedHTTPSConnectionPool}
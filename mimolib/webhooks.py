@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.webhooks: signed gateway notifications
+==============================================
+
+Helpers shared by the notification receiver in mimolib.aio.webhooks and by
+anything that sends or checks gateway callbacks. A notification is a JSON
+body signed with the client_secret: the signature header carries the hex
+HMAC-SHA256 of "<timestamp>.<body>" and the timestamp header the Unix time
+it was signed at, so replays outside the tolerance window are refused.
+
+'''
+import hashlib
+import hmac
+import threading
+from collections import OrderedDict
+from time import time
+
+from mimolib.compat import text_type, monotonic
+from mimolib.metrics import RunReport
+
+SIGNATURE_HEADER = "X-Mimo-Signature"
+TIMESTAMP_HEADER = "X-Mimo-Timestamp"
+
+
+def to_bytes(value, encoding="utf-8"):
+    if isinstance(value, text_type):
+        return value.encode(encoding)
+    return value
+
+
+def sign(secret, body, timestamp):
+    """Performs operation of signing a notification body.
+        Args:
+            secret: client_secret shared with the gateway.
+            body: Raw request body, bytes.
+            timestamp: Integer Unix time the notification is sent at.
+
+        Returns:
+            String hex HMAC-SHA256 of "<timestamp>.<body>"
+    """
+    message = to_bytes(str(int(timestamp))) + b"." + to_bytes(body)
+    return hmac.new(to_bytes(secret), message, hashlib.sha256).hexdigest()
+
+
+def verify(secret, body, signature, timestamp, tolerance=300, now=None):
+    """Performs operation of checking the signature of a notification in constant time.
+        Args:
+            secret: client_secret shared with the gateway.
+            body: Raw request body, bytes.
+            signature: Value of the signature header.
+            timestamp: Value of the timestamp header.
+            tolerance: Seconds a notification stays valid, None to accept any age.
+            now: Unix time to check against, the current time by default.
+
+        Returns:
+            True when the signature matches and the timestamp is within tolerance
+    """
+    if not signature or not timestamp:
+        return False
+    try:
+        timestamp = int(timestamp)
+    except ValueError:
+        return False
+    if tolerance is not None and abs((now or time()) - timestamp) > tolerance:
+        return False
+    try:
+        return hmac.compare_digest(sign(secret, body, timestamp), str(signature))
+    except (TypeError, UnicodeError):
+        return False
+
+
+class DedupeIndex(object):
+    """Bounded set of recently seen event keys; the oldest key is forgotten first.
+
+    Attributes:
+        maxsize: Maximum number of keys remembered.
+    """
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.keys = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, key):
+        """Performs operation of remembering a key.
+
+            Returns:
+                True when the key is new, False when it was already seen
+        """
+        with self.lock:
+            if key in self.keys:
+                return False
+            self.keys[key] = None
+            if len(self.keys) > self.maxsize:
+                self.keys.popitem(last=False)
+            return True
+
+    def discard(self, key):
+        """Performs operation of forgetting a key, so a redelivery of its event is accepted."""
+        with self.lock:
+            self.keys.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class WebhookEvent(object):
+    """One verified gateway notification.
+
+    Attributes:
+        transaction_id: Transaction the notification is about.
+        type: Event type, the "type" field or else the "status" field of the payload.
+        payload: Decoded JSON body.
+        received: monotonic() time the notification was received.
+    """
+    __slots__ = ("transaction_id", "type", "payload", "received")
+
+    def __init__(self, transaction_id, type, payload, received):
+        self.transaction_id = transaction_id
+        self.type = type
+        self.payload = payload
+        self.received = received
+
+    @property
+    def key(self):
+        """Dedupe key: a transfer's success and its later void are two events."""
+        return (self.transaction_id, self.type)
+
+    def __repr__(self):
+        return ("WebhookEvent(transaction_id=%r, type=%r)"
+                % (self.transaction_id, self.type))
+
+
+def parse_event(payload, received=None):
+    """Performs operation of turning a decoded notification body into a WebhookEvent.
+
+        Raises:
+            ValueError: If the payload is not an object with a transaction_id.
+    """
+    if not isinstance(payload, dict) or payload.get("transaction_id") in (None, ""):
+        raise ValueError('notification has no transaction_id')
+    return WebhookEvent(payload["transaction_id"], payload.get("type") or payload.get("status"),
+                        payload, received is None and monotonic() or received)
+
+
+class WebhookReport(RunReport):
+    """Counters of a notification receiver; keeps a latency histogram only, so its size is fixed.
+
+    Attributes:
+        received: Requests received.
+        accepted: Events queued for the handlers.
+        duplicates: Events acknowledged without dispatch because their key was seen.
+        unauthorized: Requests refused for a missing or wrong signature.
+        invalid: Signed requests whose body is not a notification.
+        overloaded: Requests refused with 503 because the queue was full.
+        handled: Events every handler completed.
+        failed: Events a handler raised on.
+        latency: Histogram of seconds from receipt to the last handler returning.
+    """
+    def __init__(self):
+        RunReport.__init__(self)
+        self.start()
+        self.received = 0
+        self.accepted = 0
+        self.duplicates = 0
+        self.unauthorized = 0
+        self.invalid = 0
+        self.overloaded = 0
+        self.handled = 0
+        self.failed = 0
+
+    @property
+    def total(self):
+        return self.handled + self.failed
+
+    def as_dict(self):
+        """Performs operation of summarising the report as a plain dict."""
+        row = RunReport.as_dict(self)
+        elapsed = row['elapsed']
+        row.update({'received': self.received,
+                    'accepted': self.accepted,
+                    'duplicates': self.duplicates,
+                    'unauthorized': self.unauthorized,
+                    'invalid': self.invalid,
+                    'overloaded': self.overloaded,
+                    'handled': self.handled,
+                    'failed': self.failed,
+                    'events_per_second': elapsed and self.handled / elapsed or 0.0})
+        return row
+
+    def __repr__(self):
+        return ("WebhookReport(received=%(received)d, accepted=%(accepted)d, "
+                "duplicates=%(duplicates)d, handled=%(handled)d, failed=%(failed)d)"
+                % self.as_dict())
@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+
+mimolib.workers: multi-process payout runner
+============================================
+
+ProcessPayoutRunner spreads transfers over a pool of worker processes, each
+with its own pooled MimoRestClient and a few sender threads ("lanes").
+Transfers are sharded by recipient onto a lane, so all the transfers of one
+recipient are sent in submission order. Results come back to the parent as
+small tuples, along with each worker's HistogramCollector report. Interrupting
+the parent (Ctrl-C) or calling drain() stops feeding new transfers, but lets
+the workers finish the ones already queued. Every transfer is given its
+idempotency key in the parent, so if a worker fails to start or dies, the
+transfers it had not answered are reported in doubt with the key to re-send
+them with; the run carries on with the other workers, and once none is left,
+intake stops as after drain().
+
+'''
+import multiprocessing
+import pickle
+import signal
+import threading
+import zlib
+
+from mimolib.bulk import BulkReport, TransferResult, split_transfer
+from mimolib.compat import text_type, monotonic
+from mimolib.metrics import HistogramCollector
+from mimolib.retry import new_idempotency_key
+
+try:
+    from queue import Queue, Empty, Full
+except ImportError:
+    from Queue import Queue, Empty, Full
+
+# Recipient kwargs identifying who a transfer is for, in order of preference.
+RECIPIENT_FIELDS = ("card_id", "username", "email", "phone")
+
+_DONE = "done"
+
+
+def recipient_key(item):
+    """Performs operation of picking the recipient of a bulk transfer item, used for sharding."""
+    amount, notes, recipient = split_transfer(item)
+    for name in RECIPIENT_FIELDS:
+        if recipient.get(name):
+            return text_type(recipient[name])
+    return None
+
+
+def with_idempotency_key(item):
+    """Performs operation of returning item as (amount, notes, recipient kwargs) with an idempotency_key, keeping one already given."""
+    amount, notes, recipient = split_transfer(item)
+    if not recipient.get("idempotency_key"):
+        recipient["idempotency_key"] = new_idempotency_key()
+    return amount, notes, recipient
+
+
+def run_lane(client, lane, outbox):
+    while True:
+        job = lane.get()
+        if job is None:
+            break
+        index, item = job
+        started = monotonic()
+        try:
+            amount, notes, recipient = split_transfer(item)
+            response = client.transfer_funds(amount, notes, **recipient)
+            # Pickled here, as multiprocessing would silently drop an unpicklable message.
+            payload = pickle.dumps(response, pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            outbox.put((index, None, text_type(e), monotonic() - started))
+            continue
+        outbox.put((index, payload, None, monotonic() - started))
+
+
+def worker_main(worker_id, client_factory, threads, backlog, inbox, outbox):
+    """Performs operation of running one worker process until it receives the stop message.
+
+        The stop report is always sent, with the error that ended the worker if any.
+    """
+    # The parent handles Ctrl-C by draining; workers must not die mid-transfer.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    collector = HistogramCollector()
+    lanes = []
+    senders = []
+    error = None
+    try:
+        client = client_factory()
+        client.add_observer(collector)
+        lanes = [Queue(max(backlog // threads, 1)) for _ in range(threads)]
+        senders = [threading.Thread(target=run_lane, args=(client, lane, outbox)) for lane in lanes]
+        for sender in senders:
+            sender.start()
+        while True:
+            message = inbox.get()
+            if message is None:
+                break
+            index, lane, item = message
+            lanes[lane].put((index, item))
+    except Exception as e:
+        error = 'worker %d failed: %s' % (worker_id, e)
+    finally:
+        for lane in lanes:
+            lane.put(None)
+        for sender in senders:
+            sender.join()
+        outbox.put((_DONE, worker_id, collector.report(), error))
+
+
+class ProcessPayoutRunner(object):
+    """ProcessPayoutRunner class used to run transfers on every core of the machine.
+
+    Attributes:
+        client_factory: Picklable callable returning a ready to use MimoRestClient
+                        in each worker, e.g. functools.partial(MimoRestClient, ...).
+        processes: Number of worker processes, the number of CPUs by default.
+        threads: Sender threads per worker process.
+        backlog: Transfers queued ahead of each worker, in its inbox and again in its lanes.
+        shard_key: Function of a bulk item returning its recipient; items with
+                   no recipient are spread round robin.
+        poll_interval: Seconds between checks that the worker processes are alive.
+        report: BulkReport of the current or last run.
+        metrics: Dict of worker number to its HistogramCollector report.
+        errors: Dict of worker number to the error that stopped it early.
+    """
+    def __init__(self, client_factory, processes=None, threads=4, backlog=100,
+                 shard_key=recipient_key, poll_interval=0.5):
+        self.client_factory = client_factory
+        self.processes = processes or multiprocessing.cpu_count()
+        self.threads = threads
+        self.backlog = backlog
+        self.shard_key = shard_key
+        self.poll_interval = poll_interval
+        self.report = BulkReport()
+        self.metrics = {}
+        self.errors = {}
+        self.draining = threading.Event()
+        self.lock = threading.Lock()
+
+    def get_lane(self, index, item):
+        """Performs operation of mapping an item to a (worker, lane) pair."""
+        key = self.shard_key(item)
+        lanes = self.processes * self.threads
+        if key is None:
+            slot = index % lanes
+        else:
+            slot = zlib.crc32(key.encode("utf-8")) % lanes
+        return slot % self.processes, slot // self.processes
+
+    def drain(self):
+        """Performs operation of stopping the intake; queued transfers still complete."""
+        self.draining.set()
+
+    def put(self, inbox, message, worker, stopped):
+        """Performs operation of queuing a message for a worker, giving up once the worker has stopped.
+
+            Returns:
+                True when the message was queued
+        """
+        while worker not in stopped:
+            try:
+                inbox.put(message, timeout=self.poll_interval)
+                return True
+            except Full:
+                continue
+        return False
+
+    def feed(self, transfers, inboxes, pending, stopped):
+        try:
+            for index, item in enumerate(transfers):
+                if self.draining.is_set() or len(stopped) == len(inboxes):
+                    break
+                worker, lane = self.get_lane(index, item)
+                item = with_idempotency_key(item)
+                with self.lock:
+                    pending[index] = (worker, item)
+                # Transfers for a stopped worker stay pending and are settled by fail_pending.
+                self.put(inboxes[worker], (index, lane, item), worker, stopped)
+        finally:
+            for worker, inbox in enumerate(inboxes):
+                self.put(inbox, None, worker, stopped)
+
+    def fail_pending(self, pending, worker=None):
+        """Performs operation of reporting the unanswered transfers of a stopped worker, or of every worker.
+
+            They are in doubt: the worker may have sent them before it stopped.
+
+            Returns:
+                List of TransferResult with in_doubt set
+        """
+        with self.lock:
+            indexes = [index for index, (number, item) in pending.items()
+                       if worker is None or number == worker]
+            entries = [(index, pending.pop(index)) for index in indexes]
+        return [TransferResult(index, item, None, Exception(
+                    self.errors.get(number) or 'worker %d stopped before answering' % number),
+                    in_doubt=True)
+                for index, (number, item) in entries]
+
+    def read(self, message, pending, stopped):
+        """Performs operation of handling one worker message.
+
+            Returns:
+                List of TransferResult
+        """
+        if message[0] == _DONE:
+            number, metrics, error = message[1:]
+            self.metrics[number] = metrics
+            if error is not None:
+                self.errors[number] = error
+            stopped.add(number)
+            return self.fail_pending(pending, number)
+        index, payload, error, latency = message
+        with self.lock:
+            number, item = pending.pop(index, (None, None))
+        response = payload is not None and pickle.loads(payload) or None
+        return [TransferResult(index, item, response,
+                               error is not None and Exception(error) or None, latency)]
+
+    def collect(self, outbox, pending, workers, stopped):
+        """Performs operation of reading worker messages until every worker has stopped or died."""
+        while len(stopped) < len(workers):
+            try:
+                message = outbox.get(timeout=self.poll_interval)
+            except KeyboardInterrupt:
+                self.drain()
+                continue
+            except Empty:
+                exited = [number for number, worker in enumerate(workers)
+                          if number not in stopped and worker.exitcode is not None]
+                if not exited:
+                    continue
+                # Read what the exited workers sent before giving up on them.
+                while True:
+                    try:
+                        message = outbox.get(timeout=self.poll_interval)
+                    except Empty:
+                        break
+                    for result in self.read(message, pending, stopped):
+                        yield result
+                for number in exited:
+                    if number not in stopped:
+                        self.errors[number] = ('worker %d exited with code %s'
+                                               % (number, workers[number].exitcode))
+                        stopped.add(number)
+                        for result in self.fail_pending(pending, number):
+                            yield result
+                continue
+            for result in self.read(message, pending, stopped):
+                yield result
+
+    def run(self, transfers):
+        """Performs operation of running transfers on the worker pool, yielding results as they complete.
+            Args:
+                self: Current self class
+                transfers: Iterable of (amount, notes[, recipient kwargs]) tuples; an
+                           idempotency_key in the recipient kwargs is kept, others are generated.
+
+            Returns:
+                Generator of TransferResult in completion order
+        """
+        self.report = report = BulkReport()
+        self.metrics = {}
+        self.errors = {}
+        self.draining.clear()
+        report.start()
+        outbox = multiprocessing.Queue()
+        inboxes = [multiprocessing.Queue(self.backlog) for _ in range(self.processes)]
+        workers = [multiprocessing.Process(target=worker_main, name="mimo-worker-%d" % number,
+                                           args=(number, self.client_factory, self.threads,
+                                                 self.backlog, inboxes[number], outbox))
+                   for number in range(self.processes)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        pending = {}
+        stopped = set()
+        feeder = threading.Thread(target=self.feed, args=(transfers, inboxes, pending, stopped),
+                                  name="mimo-feeder")
+        feeder.daemon = True
+        feeder.start()
+        try:
+            for result in self.collect(outbox, pending, workers, stopped):
+                report.add(result)
+                yield result
+            feeder.join()
+            for result in self.fail_pending(pending):
+                report.add(result)
+                yield result
+        finally:
+            self.drain()
+            # Workers only exit once their results are read, so keep reading.
+            for result in self.collect(outbox, pending, workers, stopped):
+                report.add(result)
+            feeder.join()
+            for result in self.fail_pending(pending):
+                report.add(result)
+            for inbox in inboxes:
+                # Messages left for a stopped worker must not block the parent's exit.
+                inbox.cancel_join_thread()
+            for worker in workers:
+                worker.join()
+            report.finish()
+
+    def run_all(self, transfers):
+        """Performs operation of running transfers to completion.
+
+            Returns:
+                BulkReport of the run
+        """
+        for _ in self.run(transfers):
+            pass
+        return self.report
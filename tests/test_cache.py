@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+'''
+
+search_user cache tests against the local mock gateway.
+
+'''
+import pytest
+
+from mimolib import MimoRestClient, MimoContext
+from mimolib.cache import SearchCache, MemoryCache, SQLiteCache
+from mimolib.mockgateway import MockGateway
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryCache()
+    return SQLiteCache(str(tmp_path / "cache.db"))
+
+
+@pytest.fixture
+def context():
+    return MimoContext("token")
+
+
+def make_client(gateway, cache):
+    return MimoRestClient("id", "secret", gateway.url, search_url="partner/user/card_id",
+                          search_cache=cache)
+
+
+def test_found_user_is_served_from_the_cache(backend, context):
+    cache = SearchCache(backend)
+    with MockGateway() as gateway:
+        client = make_client(gateway, cache)
+        first = client.search_user(context, username="Alice")
+        second = client.search_user(context, username=" alice ")
+
+    assert gateway.calls["search"] == 1
+    assert second == first
+    assert cache.stats()["hits"] == 1
+
+
+def test_not_found_is_cached_briefly(backend, context):
+    cache = SearchCache(backend, negative_ttl=30)
+    with MockGateway() as gateway:
+        client = make_client(gateway, cache)
+        client.search_user(context, username="unknown")
+        client.search_user(context, username="unknown")
+
+    assert gateway.calls["search"] == 1
+    assert cache.stats()["negative_hits"] == 1
+
+
+@pytest.mark.parametrize("status", [500, 429, 401])
+def test_failed_lookup_is_not_cached(backend, status):
+    cache = SearchCache(backend)
+    cache.set({"username": "alice"}, {"card_id": "CARD-alice"}, status)
+
+    assert cache.get({"username": "alice"}) == (False, None)
+
+
+def test_body_that_is_not_json_is_not_cached(backend):
+    cache = SearchCache(backend)
+    cache.set({"username": "alice"}, b"<html>Not Found</html>", 404)
+
+    assert cache.get({"username": "alice"}) == (False, None)
+
+
+def test_answer_the_backend_cannot_store_is_left_uncached(tmp_path):
+    cache = SearchCache(SQLiteCache(str(tmp_path / "cache.db")))
+    cache.set({"username": "alice"}, {"card_id": object()}, 200)
+
+    assert cache.get({"username": "alice"}) == (False, None)
+
+
+def test_changing_a_cached_answer_does_not_change_the_cache(backend, context):
+    cache = SearchCache(backend)
+    with MockGateway() as gateway:
+        client = make_client(gateway, cache)
+        client.search_user(context, username="alice")["card_id"] = "changed"
+        client.search_user(context, username="alice")["name"] = "changed"
+        answer = client.search_user(context, username="alice")
+
+    assert answer["card_id"] == "CARD-alice"
+    assert answer["name"] == "Mimo User"
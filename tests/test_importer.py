@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+'''
+
+Bulk registration import tests against the local mock gateway.
+
+'''
+import io
+import json
+
+import pytest
+
+from mimolib import MimoRestClient
+from mimolib.importer import RegistrationImporter
+from mimolib.mockgateway import MockGateway
+
+
+def make_row(index):
+    return {"account_type": "personal", "username": "user%d" % index, "pin": "1234",
+            "email": "user%d@example.com" % index, "password": "secret",
+            "dob": "01/31/1990", "challenge_question": "pet", "challenge_answer": "cat",
+            "terms_and_conditions": "1", "mobile_phone": "555-0100"}
+
+
+def write_jsonl(path, lines):
+    with io.open(path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(line + u"\n")
+    return path
+
+
+def read_output(path):
+    with io.open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return dict((name, str(tmp_path / name))
+                for name in ("signups.jsonl", "results.jsonl", "checkpoint.json"))
+
+
+def make_client(gateway):
+    return MimoRestClient("id", "secret", gateway.url)
+
+
+def test_malformed_rows_are_reported_and_skipped(paths):
+    source = write_jsonl(paths["signups.jsonl"],
+                         [json.dumps(make_row(0)), u'{"username": "broken"', u'[1, 2]',
+                          json.dumps(make_row(3))])
+    with MockGateway() as gateway:
+        importer = RegistrationImporter(make_client(gateway), concurrency=2)
+        report = importer.run_all(source, paths["results.jsonl"])
+
+    records = sorted(read_output(paths["results.jsonl"]), key=lambda record: record["row"])
+    assert [record["ok"] for record in records] == [True, False, False, True]
+    assert records[1]["error"].startswith("invalid row")
+    assert records[2]["error"] == "invalid row: expected an object, got list"
+    assert (report.succeeded, report.invalid) == (2, 2)
+    assert gateway.calls["register"] == 2
+
+
+def test_interrupted_import_resumes_from_the_checkpoint(paths):
+    source = write_jsonl(paths["signups.jsonl"], [json.dumps(make_row(i)) for i in range(10)])
+    with MockGateway() as gateway:
+        importer = RegistrationImporter(make_client(gateway), concurrency=1, backlog=1,
+                                        checkpoint_every=1)
+        results = importer.run(source, paths["results.jsonl"], paths["checkpoint.json"])
+        first = [next(results) for _ in range(4)]
+        results.close()
+
+        report = importer.run_all(source, paths["results.jsonl"], paths["checkpoint.json"])
+
+    assert report.skipped == len(first)
+    assert report.succeeded == 10 - len(first)
+    assert sorted(record["row"] for record in read_output(paths["results.jsonl"])) \
+        == list(range(10))
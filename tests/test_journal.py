@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+'''
+
+Write-ahead journal tests against the local mock gateway.
+
+'''
+import sqlite3
+from time import time
+
+import pytest
+
+from mimolib import MimoRestClient, MimoContext
+from mimolib.journal import Journal, OK, ERROR, NOT_SENT
+from mimolib.mockgateway import MockGateway
+from mimolib.throttle import CircuitBreaker
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / "journal.db")
+
+
+@pytest.fixture
+def context():
+    return MimoContext("token")
+
+
+def make_client(gateway, journal, **kwargs):
+    return MimoRestClient("id", "secret", gateway.url, transfer_url="partner/transfers",
+                          journal=journal, **kwargs)
+
+
+def outcomes(journal):
+    return [entry.status for entry in journal.entries("outcome")]
+
+
+def test_intent_without_outcome_is_in_doubt(journal_path):
+    journal = Journal(journal_path)
+    journal.begin("crash-1", "transfer", {"amount": 10, "access_token": "secret"}).result()
+    journal.close()
+
+    # A restarted process finds the call it was sending when it died.
+    journal = Journal(journal_path)
+    try:
+        in_doubt = list(journal.in_doubt())
+    finally:
+        journal.close()
+
+    assert [(entry.key, entry.kind) for entry in in_doubt] == [("crash-1", "transfer")]
+    assert in_doubt[0].data == {"amount": 10}
+
+
+def test_successful_transfer_is_settled(journal_path, context):
+    with MockGateway() as gateway, Journal(journal_path) as journal:
+        response = make_client(gateway, journal).transfer_funds(10, "rent", context=context)
+        journal.flush()
+
+        assert outcomes(journal) == [OK]
+        assert list(journal.in_doubt()) == []
+        [(intent, outcome)] = list(journal.settled())
+        assert outcome.transaction_id == str(response["transaction_id"])
+
+
+def test_server_error_stays_in_doubt(journal_path, context):
+    with MockGateway(error_rate=1.0) as gateway, Journal(journal_path) as journal:
+        make_client(gateway, journal).transfer_funds(10, "rent", context=context)
+        journal.flush()
+
+        assert outcomes(journal) == [ERROR]
+        [entry] = list(journal.in_doubt())
+        assert entry.error.startswith("HTTP 500")
+        assert list(journal.settled()) == []
+
+
+def test_call_refused_before_sending_is_not_in_doubt(journal_path, context):
+    with MockGateway() as gateway, Journal(journal_path) as journal:
+        breaker = CircuitBreaker(failure_threshold=1)
+        breaker.record_failure()
+        client = make_client(gateway, journal, circuit_breaker=breaker)
+        with pytest.raises(Exception):
+            client.transfer_funds(10, "rent", context=context)
+        journal.flush()
+
+        assert outcomes(journal) == [NOT_SENT]
+        assert list(journal.in_doubt()) == []
+        assert gateway.calls.get("transfer") is None
+
+
+def test_resent_key_that_succeeds_is_no_longer_in_doubt(journal_path):
+    with Journal(journal_path) as journal:
+        journal.begin("payout-1", "transfer", {"amount": 10}).result()
+        journal.finish("payout-1", "transfer", {"error": "timeout"}, status=504).result()
+        journal.begin("payout-1", "transfer", {"amount": 10}).result()
+        journal.finish("payout-1", "transfer", {"transaction_id": 7}, status=200).result()
+
+        assert list(journal.in_doubt()) == []
+        [(intent, outcome)] = list(journal.settled())
+        assert outcome.transaction_id == "7"
+
+
+def test_settled_returns_each_key_once(journal_path):
+    with Journal(journal_path) as journal:
+        for transaction_id in (7, 7):
+            journal.begin("payout-1", "transfer", {"amount": 10}).result()
+            journal.finish("payout-1", "transfer", {"transaction_id": transaction_id},
+                           status=200).result()
+
+        assert [(intent.key, outcome.transaction_id)
+                for intent, outcome in journal.settled()] == [("payout-1", "7")]
+
+
+def test_prune_keeps_a_crashed_call_resent_but_not_sent(journal_path):
+    with Journal(journal_path) as journal:
+        journal.begin("payout-1", "transfer", {"amount": 10}).result()
+        # The process died; the re-send was refused before reaching the gateway.
+        journal.begin("payout-1", "transfer", {"amount": 10}).result()
+        journal.finish("payout-1", "transfer", error=Exception("circuit open"), sent=False).result()
+        journal.begin("payout-2", "transfer", {"amount": 20}).result()
+        journal.finish("payout-2", "transfer", error=Exception("circuit open"), sent=False).result()
+
+        assert journal.prune(time() + 1) == 2
+        assert [entry.key for entry in journal.in_doubt()] == ["payout-1"]
+
+
+def test_journal_without_intent_seq_is_migrated(journal_path):
+    conn = sqlite3.connect(journal_path)
+    conn.execute("CREATE TABLE journal (seq INTEGER PRIMARY KEY, key TEXT, kind TEXT, phase TEXT, "
+                 "status TEXT, transaction_id TEXT, data TEXT, error TEXT, created_at REAL)")
+    conn.executemany("INSERT INTO journal (key, kind, phase, status, data, created_at) "
+                     "VALUES (?, 'transfer', ?, ?, '{}', 0)",
+                     [("payout-1", "intent", "pending"), ("payout-1", "outcome", "error"),
+                      ("payout-2", "intent", "pending"), ("payout-2", "outcome", "ok")])
+    conn.commit()
+    conn.close()
+
+    with Journal(journal_path) as journal:
+        assert [entry.key for entry in journal.in_doubt()] == ["payout-1"]
+        assert [intent.key for intent, outcome in journal.settled()] == ["payout-2"]
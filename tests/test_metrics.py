@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+'''
+
+Request instrumentation tests against the local mock gateway.
+
+'''
+import asyncio
+import logging
+
+import pytest
+
+from mimolib import MimoRestClient, MimoContext
+from mimolib.aio import AsyncMimoRestClient
+from mimolib.metrics import HistogramCollector
+from mimolib.mockgateway import MockGateway
+from mimolib.throttle import CircuitBreaker, CircuitOpenError, RateLimiter
+
+
+class BrokenObserver(object):
+    def on_request(self, event):
+        raise RuntimeError("observer bug")
+
+
+def make_client(gateway, **kwargs):
+    return MimoRestClient("id", "secret", gateway.url, transfer_url="partner/transfers",
+                          **kwargs)
+
+
+@pytest.fixture
+def context():
+    return MimoContext("token")
+
+
+def test_call_refused_by_the_breaker_emits_an_event(context):
+    collector = HistogramCollector()
+    breaker = CircuitBreaker(failure_threshold=1)
+    breaker.record_failure()
+    with MockGateway() as gateway:
+        client = make_client(gateway, circuit_breaker=breaker, observers=[collector])
+        with pytest.raises(CircuitOpenError):
+            client.transfer_funds(10, "rent", context=context)
+
+    row = collector.report()["transfer_url"]
+    assert (row["count"], row["errors"], row["rejected"]) == (1, 1, 1)
+    assert 'mimo_request_rejected_total{endpoint="transfer_url"} 1' \
+        in collector.prometheus_text()
+
+
+def test_rate_limit_wait_is_recorded(context):
+    collector = HistogramCollector()
+    with MockGateway() as gateway:
+        client = make_client(gateway, rate_limiter=RateLimiter(default=(20, 1)),
+                             observers=[collector])
+        for _ in range(3):
+            client.transfer_funds(10, "rent", context=context)
+
+    stats = collector.endpoints["transfer_url"]
+    assert stats.wait.total >= 0.09
+
+
+def test_labels_never_carry_the_query(context):
+    collector = HistogramCollector()
+    with MockGateway() as gateway:
+        client = make_client(gateway, observers=[collector])
+        client.GET_request(gateway.url + "partner/transactions?access_token=secret-token")
+
+    text = collector.prometheus_text()
+    assert "secret-token" not in text
+    assert 'endpoint="other"' in text
+
+
+def test_observer_errors_are_logged_not_printed(context, capsys, caplog):
+    with MockGateway() as gateway:
+        client = make_client(gateway, observers=[BrokenObserver()])
+        with caplog.at_level(logging.WARNING, logger="mimolib"):
+            response = client.transfer_funds(10, "rent", context=context)
+
+    assert "transaction_id" in response
+    assert capsys.readouterr().out == ""
+    assert any("observer" in record.getMessage() for record in caplog.records)
+
+
+def test_warm_up_opens_one_connection_per_head():
+    with MockGateway() as gateway:
+        client = make_client(gateway, pool_maxsize=6)
+        assert client.warm_up(6) == 6
+        assert client.warm_up(6) == 0
+
+        collector = HistogramCollector()
+        client.observers.append(collector)
+        client.transfer_funds(10, "rent", context=MimoContext("token"))
+
+    assert collector.endpoints["transfer_url"].new_connections == 0
+
+
+def test_async_warm_up_opens_one_connection_per_head():
+    async def scenario():
+        client = AsyncMimoRestClient("id", "secret", gateway.url, connection_limit=6)
+        try:
+            return await client.warm_up(6), await client.warm_up(6)
+        finally:
+            await client.close()
+
+    with MockGateway() as gateway:
+        opened = asyncio.new_event_loop().run_until_complete(scenario())
+
+    assert opened == (6, 0)
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+'''
+
+Token manager single-flight tests.
+
+'''
+import asyncio
+import threading
+import time
+
+import pytest
+
+from mimolib import MimoRestClient
+from mimolib.aio import AsyncMimoRestClient
+from mimolib.aio.oauth import AsyncTokenManager
+from mimolib.oauth import TokenManager
+
+
+class Clock(object):
+    """Clock the tests move by hand."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenServer(object):
+    """fetch_token counting its calls and handing out numbered tokens."""
+
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("token endpoint down")
+        return {"access_token": "token-%d" % self.calls, "expires_in": 100}
+
+
+def make_manager(server, clock, manager_class=TokenManager, client=None):
+    client = client or MimoRestClient("id", "secret", "http://127.0.0.1:1/")
+    return manager_class(client, refresh_margin=10, fetch_token=server, clock=clock)
+
+
+def test_expired_token_is_renewed_once_for_all_threads():
+    clock = Clock()
+    server = TokenServer(delay=0.05)
+    manager = make_manager(server, clock)
+    tokens = []
+
+    def call():
+        tokens.append(manager.get_token())
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert server.calls == 1
+    assert tokens == ["token-1"] * 8
+
+
+def test_due_token_is_kept_when_renewal_fails():
+    clock = Clock()
+    server = TokenServer()
+    manager = make_manager(server, clock)
+    assert manager.get_token() == "token-1"
+
+    server.fail = True
+    clock.now += 95
+    assert manager.get_token() == "token-1"
+
+    clock.now += 10
+    with pytest.raises(RuntimeError):
+        manager.get_token()
+
+
+def test_sync_manager_refuses_the_async_client():
+    client = AsyncMimoRestClient("id", "secret", "http://127.0.0.1:1/")
+    with pytest.raises(TypeError):
+        make_manager(TokenServer(), Clock(), client=client)
+
+
+def test_async_expired_token_is_renewed_once_for_all_tasks():
+    clock = Clock()
+    calls = []
+
+    async def fetch_token():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"access_token": "token-%d" % len(calls), "expires_in": 100}
+
+    async def scenario():
+        manager = make_manager(fetch_token, clock, AsyncTokenManager,
+                               AsyncMimoRestClient("id", "secret", "http://127.0.0.1:1/"))
+        return await asyncio.gather(*[manager.get_token() for _ in range(10)])
+
+    tokens = asyncio.new_event_loop().run_until_complete(scenario())
+
+    assert len(calls) == 1
+    assert tokens == ["token-1"] * 10
+
+
+def test_async_due_token_is_returned_while_renewing_in_background():
+    clock = Clock()
+    calls = []
+
+    async def fetch_token():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"access_token": "token-%d" % len(calls), "expires_in": 100}
+
+    async def scenario():
+        manager = make_manager(fetch_token, clock, AsyncTokenManager,
+                               AsyncMimoRestClient("id", "secret", "http://127.0.0.1:1/"))
+        first = await manager.get_token()
+        clock.now += 95
+        due = [await manager.get_token() for _ in range(5)]
+        await manager.renewal
+        return first, due, await manager.get_token()
+
+    first, due, renewed = asyncio.new_event_loop().run_until_complete(scenario())
+
+    assert (first, due, renewed) == ("token-1", ["token-1"] * 5, "token-2")
+    assert len(calls) == 2
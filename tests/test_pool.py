@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+'''
+
+Bounded pool tests.
+
+'''
+import asyncio
+import threading
+
+import pytest
+
+from mimolib.aio.pool import bounded_map as async_bounded_map
+from mimolib.aio.reconcile import ReconcileReport
+from mimolib.bulk import BulkReport, TransferResult
+from mimolib.importer import ImportReport
+from mimolib.metrics import RunReport
+from mimolib.pool import bounded_map, drain_batches
+from mimolib.webhooks import WebhookReport
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+_CLOSE = object()
+
+
+class CountingItems(object):
+    """Iterable recording how far ahead of the finished calls it has been read."""
+
+    def __init__(self, count):
+        self.count = count
+        self.read = 0
+        self.finished = 0
+        self.ahead = 0
+        self.lock = threading.Lock()
+
+    def __iter__(self):
+        for item in range(self.count):
+            with self.lock:
+                self.read += 1
+                self.ahead = max(self.ahead, self.read - self.finished)
+            yield item
+
+    def done(self, item):
+        with self.lock:
+            self.finished += 1
+        return item * 2
+
+
+def test_bounded_map_reads_items_lazily():
+    items = CountingItems(200)
+    results = list(bounded_map(items.done, items, concurrency=4, backlog=4))
+
+    assert sorted(results) == [item * 2 for item in range(200)]
+    assert items.ahead <= 8
+
+
+def test_bounded_map_raises_what_the_function_raises():
+    def fail(item):
+        raise ValueError("bad item %d" % item)
+
+    with pytest.raises(ValueError):
+        list(bounded_map(fail, range(3), concurrency=2))
+
+
+def test_async_bounded_map_reads_items_lazily():
+    items = CountingItems(200)
+
+    async def done(item):
+        await asyncio.sleep(0)
+        return items.done(item)
+
+    async def scenario():
+        return [result async for result in async_bounded_map(done, items, 4, 4)]
+
+    results = asyncio.new_event_loop().run_until_complete(scenario())
+
+    assert sorted(results) == [item * 2 for item in range(200)]
+    assert items.ahead <= 4 + 4 + 1
+
+
+def test_async_bounded_map_raises_what_the_function_raises():
+    async def fail(item):
+        raise ValueError("bad item %d" % item)
+
+    async def scenario():
+        return [result async for result in async_bounded_map(fail, range(10), 2)]
+
+    with pytest.raises(ValueError):
+        asyncio.new_event_loop().run_until_complete(scenario())
+
+
+def test_bulk_report_size_does_not_grow_with_transfers():
+    report = BulkReport()
+    for index in range(10000):
+        report.add(TransferResult(index, (10, "rent"), {}, latency=0.01))
+
+    assert report.total == 10000
+    assert report.latency.count == 10000
+    assert 0.008 <= report.latency_percentiles()[50] <= 0.0125
+
+
+def test_drain_batches_groups_items_and_stops_at_the_close_marker():
+    queue = Queue()
+    for item in range(5):
+        queue.put(item)
+    queue.put(_CLOSE)
+
+    assert list(drain_batches(queue, 2, 0.01, _CLOSE)) == [[0, 1], [2, 3], [4]]
+
+
+def test_reports_share_the_run_report_summary():
+    for report in (BulkReport(), ImportReport(), ReconcileReport(), WebhookReport()):
+        assert isinstance(report, RunReport)
+        report.start()
+        report.latency.add(0.01)
+        report.finish()
+        row = report.as_dict()
+        assert set(['total', 'elapsed', 'throughput', 'p50', 'p95', 'p99']) <= set(row)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+'''
+
+Reconciliation tests against the local mock gateway.
+
+'''
+import asyncio
+
+import pytest
+
+from mimolib import MimoRestClient, MimoContext
+from mimolib.aio import AsyncMimoRestClient
+from mimolib.aio.reconcile import AsyncReconciler, ReconcileReport, http_lookup
+from mimolib.mockgateway import MockGateway
+from mimolib.reconcile import LocalRecord, MISSING, AMOUNT, ERROR
+
+
+class BrokenLookupGateway(MockGateway):
+    """MockGateway whose lookups of some transactions fail with a 500."""
+
+    def __init__(self, broken, **kwargs):
+        MockGateway.__init__(self, **kwargs)
+        self.broken = broken
+
+    def handle_transaction(self, params, headers):
+        if params.get("transaction_id") in self.broken:
+            return 500, {"error": "Internal server error"}, None
+        return MockGateway.handle_transaction(self, params, headers)
+
+
+@pytest.fixture
+def context():
+    return MimoContext("token")
+
+
+def make_records(gateway, context, count):
+    client = MimoRestClient("id", "secret", gateway.url, transfer_url="partner/transfers")
+    records = []
+    for seq in range(1, count + 1):
+        response = client.transfer_funds(10, "rent", context=context)
+        records.append(LocalRecord(str(response["transaction_id"]), "transfer", "10.00", seq=seq))
+    return records
+
+
+def reconcile(gateway, context, records, concurrency=4):
+    async def scenario():
+        client = AsyncMimoRestClient("id", "secret", gateway.url)
+        try:
+            reconciler = AsyncReconciler(client, http_lookup(client, "partner/transactions",
+                                                             context), concurrency=concurrency)
+            mismatches = await reconciler.run_all(records)
+            return reconciler.report, mismatches
+        finally:
+            await client.close()
+    return asyncio.new_event_loop().run_until_complete(scenario())
+
+
+def test_mismatches_are_reported(context):
+    with MockGateway() as gateway:
+        records = make_records(gateway, context, 3)
+        records[1].amount = "99.00"
+        records.append(LocalRecord("404404", "transfer", "10.00", seq=4))
+        report, mismatches = reconcile(gateway, context, records)
+
+    assert sorted((m.transaction_id, m.reason) for m in mismatches) \
+        == sorted([(records[1].transaction_id, AMOUNT), ("404404", MISSING)])
+    assert (report.checked, report.matched, report.mismatched) == (4, 2, 2)
+    assert report.last_seq == 4
+
+
+def test_last_seq_stops_before_the_first_lookup_error(context):
+    with BrokenLookupGateway(broken=()) as gateway:
+        records = make_records(gateway, context, 6)
+        gateway.broken = (records[2].transaction_id,)
+        report, mismatches = reconcile(gateway, context, records)
+
+    assert [(m.transaction_id, m.reason) for m in mismatches] \
+        == [(records[2].transaction_id, ERROR)]
+    assert report.errors == 1
+    assert report.checked == 6
+    assert report.last_seq == 2
+
+
+def test_last_seq_waits_for_records_still_in_flight():
+    report = ReconcileReport()
+    report.advance(1, 20, True)
+    report.advance(2, 30, True)
+    assert report.last_seq == 0
+
+    report.advance(0, 10, True)
+    assert report.last_seq == 30
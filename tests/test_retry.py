@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+'''
+
+Retry and idempotency tests against the local mock gateway.
+
+'''
+import pytest
+
+from mimolib import MimoRestClient, MimoContext
+from mimolib.mockgateway import MockGateway
+from mimolib.retry import RetryPolicy, RetryBudget
+
+
+class FlakyGateway(MockGateway):
+    """MockGateway that executes the first transfers but loses their answer behind a 503."""
+
+    def __init__(self, failures, **kwargs):
+        MockGateway.__init__(self, **kwargs)
+        self.failures = failures
+        self.keys = []
+
+    def handle_transfer(self, params, headers):
+        self.keys.append(headers.get("Idempotency-Key"))
+        answer = MockGateway.handle_transfer(self, params, headers)
+        if len(self.keys) <= self.failures:
+            return 503, {"error": "Service unavailable"}, None
+        return answer
+
+
+def make_client(gateway, policy):
+    return MimoRestClient("id", "secret", gateway.url, transfer_url="partner/transfers",
+                          retry_policy=policy)
+
+
+@pytest.fixture
+def context():
+    return MimoContext("token")
+
+
+def test_retries_reuse_the_idempotency_key(context):
+    with FlakyGateway(failures=2) as gateway:
+        client = make_client(gateway, RetryPolicy(max_attempts=3, backoff=0))
+        response = client.transfer_funds(10, "rent", context=context)
+
+    assert len(gateway.keys) == 3
+    assert len(set(gateway.keys)) == 1
+    assert len(gateway.transactions) == 1
+    assert response["transaction_id"] == list(gateway.transactions)[0]
+
+
+def test_explicit_idempotency_key_is_sent(context):
+    with FlakyGateway(failures=1) as gateway:
+        client = make_client(gateway, RetryPolicy(max_attempts=2, backoff=0))
+        client.transfer_funds(10, "rent", context=context, idempotency_key="payout-42")
+
+    assert gateway.keys == ["payout-42", "payout-42"]
+    assert len(gateway.transactions) == 1
+
+
+def test_max_attempts_stops_retrying(context):
+    with MockGateway(error_rate=1.0) as gateway:
+        policy = RetryPolicy(max_attempts=3, backoff=0)
+        response = make_client(gateway, policy).transfer_funds(10, "rent", context=context)
+
+    assert response == {"error": "Internal server error"}
+    assert gateway.calls["transfer"] == 3
+    assert policy.retries == 2
+
+
+def test_exhausted_budget_stops_retrying(context):
+    with MockGateway(error_rate=1.0) as gateway:
+        policy = RetryPolicy(max_attempts=5, backoff=0,
+                             budget=RetryBudget(ratio=0, min_tokens=1))
+        client = make_client(gateway, policy)
+        client.transfer_funds(10, "rent", context=context)
+        client.transfer_funds(20, "rent", context=context)
+
+    # One token: the first call retries once, the second not at all.
+    assert gateway.calls["transfer"] == 3
+    assert policy.retries == 1
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+'''
+
+Request template tests: precompiled URLs must match plain urlencode.
+
+'''
+from mimolib import MimoRestClient, REGISTRATION_QUERY_FIELDS
+from mimolib.compat import urlencode
+from mimolib.templates import RequestTemplate
+
+URL = "http://gateway.test"
+
+
+def make_client():
+    return MimoRestClient("id&1", "secret=2", URL, search_url="/partner/search")
+
+
+def test_registration_url_matches_urlencode():
+    values = ["personal", "ada lovelace", 1234, "ada+test@example.com", "p&ss=word",
+              "Pet?", "Ém", True, "1 Main St", "", "1815-12-10", "London", "LDN", "N1",
+              "GB", "home", "Ada", "", "Smith", "f", "about/me", "https://ada.test/?a=1",
+              "fb", "@ada", "Analytical", 42, 1843, "+44 20 0000"]
+    client = make_client()
+    url = client.get_registration_url(*values)
+
+    query = [("client_id", "id&1"), ("client_secret", "secret=2")]
+    query.extend(zip(REGISTRATION_QUERY_FIELDS, values[:18] + values[19:]))
+    assert url == client.registration_url + "?" + urlencode(query)
+
+
+def test_search_url_keeps_the_call_parameters():
+    url = make_client().get_search_url(username="a b&c", access_token="tok")
+
+    path, query = url.split("?")
+    assert path == URL + "/partner/search"
+    assert sorted(query.split("&")) == ["access_token=tok", "username=a+b%26c"]
+
+
+def test_code_url_has_the_static_parameters_first():
+    client = make_client()
+
+    assert client.get_code_url() == URL + "/oauth/v2/authenticate?" \
+        + urlencode([("client_id", "id&1"), ("response_type", "code")])
+    assert client.get_code_url(state="x y").endswith("response_type=code&state=x+y")
+
+
+def test_compile_templates_picks_up_a_changed_url():
+    client = make_client()
+    client.search_url = URL + "/v2/search"
+    client.compile_templates()
+
+    assert client.get_search_url(username="ada", access_token="tok").startswith(URL + "/v2/search?")
+    assert client.get_endpoint_name(URL + "/v2/search?username=ada") == "search_url"
+
+
+def test_template_without_static_parameters():
+    template = RequestTemplate("void_url", URL + "/void", fields=("transaction_id",))
+
+    assert template.fill_url(7) == URL + "/void?transaction_id=7"
+    assert template.join("") == URL + "/void?"
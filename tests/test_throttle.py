@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+'''
+
+Circuit breaker and rate limiter tests against the local mock gateway.
+
+'''
+import asyncio
+
+import pytest
+
+from mimolib import MimoRestClient, MimoContext
+from mimolib.aio import AsyncMimoRestClient
+from mimolib.compat import monotonic
+from mimolib.mockgateway import MockGateway
+from mimolib.throttle import CircuitBreaker, CircuitOpenError, RateLimiter, HALF_OPEN, CLOSED
+
+
+def half_open_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0)
+    breaker.record_failure()
+    return breaker
+
+
+def make_client(gateway, client_class=MimoRestClient, **kwargs):
+    return client_class("id", "secret", gateway.url, transfer_url="partner/transfers", **kwargs)
+
+
+@pytest.fixture
+def context():
+    return MimoContext("token")
+
+
+def test_half_open_probe_allows_one_call():
+    breaker = half_open_breaker()
+    breaker.allow()
+
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_probe_is_released_when_the_call_fails_outside_the_transport(context, monkeypatch):
+    breaker = half_open_breaker()
+    with MockGateway() as gateway:
+        client = make_client(gateway, circuit_breaker=breaker)
+
+        def interrupted(*args, **kwargs):
+            raise KeyboardInterrupt()
+        monkeypatch.setattr(client.session, "request", interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            client.transfer_funds(10, "rent", context=context)
+        monkeypatch.undo()
+
+        assert breaker.probes == 0
+        response = client.transfer_funds(10, "rent", context=context)
+
+    assert "transaction_id" in response
+    assert breaker.state == CLOSED
+
+
+def test_cancelled_async_probe_is_released(context):
+    breaker = half_open_breaker()
+
+    async def scenario(gateway):
+        client = make_client(gateway, AsyncMimoRestClient, circuit_breaker=breaker)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(client.transfer_funds(10, "rent", context=context), 0.05)
+            assert breaker.probes == 0
+            gateway.latency = 0
+            return await client.transfer_funds(10, "rent", context=context)
+        finally:
+            await client.close()
+
+    with MockGateway(latency=0.5) as gateway:
+        response = asyncio.new_event_loop().run_until_complete(scenario(gateway))
+
+    assert "transaction_id" in response
+    assert breaker.state == CLOSED
+
+
+def test_endpoint_names_ignore_the_query():
+    client = MimoRestClient("id", "secret", "http://localhost/", offline=True)
+    client.add_route("lookup_url", "http://localhost/partner/transactions")
+
+    assert client.get_endpoint_name(client.search_url + "?access_token=abc&q=1") == "search_url"
+    assert client.get_endpoint_name("http://localhost/partner/transactions?access_token=abc") \
+        == "lookup_url"
+    assert client.get_endpoint_name("http://localhost/elsewhere?access_token=abc") == "other"
+
+
+def test_rate_limit_holds_across_query_strings():
+    limiter = RateLimiter(default=(20, 1))
+    with MockGateway() as gateway:
+        client = make_client(gateway, rate_limiter=limiter)
+        started = monotonic()
+        for transaction_id in range(3):
+            client.GET_request(gateway.url + "partner/transactions?access_token=t%d&transaction_id=%d"
+                               % (transaction_id, transaction_id))
+        elapsed = monotonic() - started
+
+    assert list(limiter.buckets) == ["other"]
+    assert elapsed >= 0.09
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+'''
+
+Notification receiver tests over a local socket.
+
+'''
+import asyncio
+from time import time
+
+from mimolib.aio.webhooks import NotificationSender, WebhookReceiver
+from mimolib.webhooks import DedupeIndex, sign, verify
+
+SECRET = "secret"
+
+
+def run(scenario):
+    return asyncio.new_event_loop().run_until_complete(scenario())
+
+
+def payload(transaction_id, type="success"):
+    return {"transaction_id": transaction_id, "type": type, "amount": "10.00"}
+
+
+def test_verify_refuses_bad_signatures_and_stale_timestamps():
+    now = int(time())
+    signature = sign(SECRET, b'{"transaction_id": 1}', now)
+
+    assert verify(SECRET, b'{"transaction_id": 1}', signature, str(now))
+    assert not verify("other", b'{"transaction_id": 1}', signature, str(now))
+    assert not verify(SECRET, b'{"transaction_id": 2}', signature, str(now))
+    assert not verify(SECRET, b'{"transaction_id": 1}', signature, str(now), now=now + 301)
+    assert not verify(SECRET, b'{"transaction_id": 1}', signature, "soon")
+
+
+def test_dedupe_index_forgets_the_oldest_key():
+    index = DedupeIndex(maxsize=2)
+
+    assert [index.add(key) for key in ("a", "b", "a", "c")] == [True, True, False, True]
+    assert "a" not in index and len(index) == 2
+
+
+def test_events_are_dispatched_once_per_key():
+    seen = []
+
+    async def scenario():
+        async with WebhookReceiver(secret=SECRET, workers=4) as receiver:
+            receiver.add_handler(seen.append, "success")
+            async with NotificationSender(receiver.url, SECRET) as sender:
+                statuses = await sender.send_many([payload(i) for i in range(20)]
+                                                  + [payload(i) for i in range(5)])
+                forged = await sender.send(payload(99), secret="wrong")
+                await receiver.drain()
+            return statuses, forged, receiver.report
+
+    statuses, forged, report = run(scenario)
+
+    assert statuses == {200: 25}
+    assert forged == 401
+    assert sorted(event.transaction_id for event in seen) == list(range(20))
+    assert (report.received, report.accepted, report.duplicates, report.unauthorized) \
+        == (26, 20, 5, 1)
+    assert report.handled == 20 and report.latency.count == 20
+
+
+def test_failed_events_are_accepted_again():
+    failures = []
+
+    async def scenario():
+        async with WebhookReceiver(secret=SECRET, workers=1,
+                                   on_error=lambda event, e: failures.append(e)) as receiver:
+            attempts = []
+
+            def flaky(event):
+                attempts.append(event.transaction_id)
+                if len(attempts) == 1:
+                    raise RuntimeError("handler down")
+
+            receiver.add_handler(flaky)
+            async with NotificationSender(receiver.url, SECRET) as sender:
+                for _ in range(2):
+                    await sender.send(payload(7))
+                    await receiver.drain()
+            return attempts, receiver.report
+
+    attempts, report = run(scenario)
+
+    assert attempts == [7, 7]
+    assert (report.failed, report.handled, report.duplicates) == (1, 1, 0)
+    assert len(failures) == 1
+
+
+def test_full_queue_answers_busy():
+    async def scenario():
+        release = asyncio.Event()
+        async with WebhookReceiver(secret=SECRET, workers=1, backlog=1) as receiver:
+            async def blocked(event):
+                await release.wait()
+
+            receiver.add_handler(blocked)
+            async with NotificationSender(receiver.url, SECRET, retries=0) as sender:
+                statuses = [await sender.send(payload(i)) for i in range(4)]
+                release.set()
+                await receiver.drain()
+            return statuses, receiver.report
+
+    statuses, report = run(scenario)
+
+    assert statuses[:2] == [200, 200]
+    assert 503 in statuses[2:]
+    assert report.overloaded == statuses.count(503)
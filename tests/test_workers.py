@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+'''
+
+Multi-process payout runner tests against the local mock gateway.
+
+'''
+import functools
+import os
+
+import pytest
+
+from mimolib import MimoRestClient, MimoContext
+from mimolib.mockgateway import MockGateway
+from mimolib.workers import ProcessPayoutRunner
+
+
+class DyingClient(MimoRestClient):
+    """MimoRestClient whose process dies right after its first transfer reached the gateway."""
+
+    def transfer_funds(self, amount, notes, context=None, **kwargs):
+        MimoRestClient.transfer_funds(self, amount, notes, context, **kwargs)
+        os._exit(1)
+
+
+def make_factory(gateway, client_class=MimoRestClient):
+    return functools.partial(client_class, "id", "secret", gateway.url,
+                             transfer_url="partner/transfers")
+
+
+@pytest.fixture
+def payouts():
+    return [(10 + index, "payout", {"context": MimoContext("token"), "card_id": "CARD-%d" % index})
+            for index in range(6)]
+
+
+def test_transfers_are_sent_with_keys_from_the_parent(payouts):
+    payouts[0][2]["idempotency_key"] = "payout-0"
+    with MockGateway() as gateway:
+        runner = ProcessPayoutRunner(make_factory(gateway), processes=2, threads=2)
+        results = list(runner.run(payouts))
+
+    assert all(result.ok for result in results)
+    assert runner.report.succeeded == len(payouts)
+    assert set(result.idempotency_key for result in results) == set(gateway.idempotency_keys)
+    assert "payout-0" in gateway.idempotency_keys
+
+
+def test_transfers_of_a_dead_worker_are_in_doubt_with_their_key(payouts):
+    with MockGateway() as gateway:
+        runner = ProcessPayoutRunner(make_factory(gateway, DyingClient), processes=1, threads=1,
+                                     poll_interval=0.1)
+        report = runner.run_all(payouts)
+
+        assert report.in_doubt == len(payouts)
+        assert report.failed == 0
+        assert 0 in runner.errors
+        # The first transfer reached the gateway; re-sending it with its key does not pay twice.
+        keys = dict(report.unanswered)
+        client = make_factory(gateway)()
+        for index, (amount, notes, recipient) in enumerate(payouts):
+            recipient = dict(recipient, idempotency_key=keys[index])
+            client.transfer_funds(amount, notes, **recipient)
+
+    assert len(gateway.transactions) == len(payouts)